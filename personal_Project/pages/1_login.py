@@ -1,8 +1,16 @@
 import streamlit as st
-import json
 from pathlib import Path
-import hashlib
 from datetime import datetime
+from utils.user_store import get_user_store
+from utils.passwords import (
+    get_login_limiter,
+    get_password_service,
+    LoginRateLimitedError,
+    PasswordServiceBusyError,
+)
+from utils.sessions import start_session
+from utils import metrics
+from utils.instrumentation import begin_rerun, end_rerun
 
 # Page configuration
 st.set_page_config(
@@ -12,6 +20,9 @@ st.set_page_config(
     initial_sidebar_state="collapsed"
 )
 
+# Rerun boundaries for metrics and (with INSTRUMENTATION=1) the phase timings
+begin_rerun("login", st.session_state)
+
 # Custom CSS
 st.markdown("""
 <style>
@@ -77,44 +88,57 @@ if "user_data" not in st.session_state:
 # Data directory setup
 DATA_DIR = Path("data")
 DATA_DIR.mkdir(exist_ok=True)
-USERS_FILE = DATA_DIR / "users.json"
-
-def load_users():
-    """Load users from JSON file."""
-    if USERS_FILE.exists():
-        with open(USERS_FILE, 'r') as f:
-            return json.load(f)
-    return {}
-
-def save_users(users):
-    """Save users to JSON file."""
-    with open(USERS_FILE, 'w') as f:
-        json.dump(users, f, indent=2)
 
 def hash_password(password):
-    """Hash password using SHA-256."""
-    return hashlib.sha256(password.encode()).hexdigest()
+    """Hash password with scrypt on the shared password worker pool."""
+    return get_password_service().hash(password)
 
-def verify_password(password, hashed):
-    """Verify password against hash."""
-    return hash_password(password) == hashed
+def get_client_ip():
+    """Client address for rate limiting, or None (forwarding headers only count behind trusted proxies)."""
+    try:
+        headers = st.context.headers
+        peer_ip = getattr(st.context, "ip_address", None)
+    except Exception:
+        # No browser connection (e.g. scripts/load_test.py runs pages headless)
+        return None
+    return get_login_limiter().client_ip(peer_ip, headers.get("X-Forwarded-For"), headers.get("X-Real-Ip"))
 
 def authenticate_user(email, password):
     """Authenticate user with email and password."""
-    users = load_users()
-    if email in users:
-        if verify_password(password, users[email]['password']):
-            return users[email]
-    return None
+    store = get_user_store()
+    service = get_password_service()
+    # Check only the stored hash first; the full record is loaded once the password matched.
+    # Unknown emails still pay for a dummy verification so timing does not reveal accounts.
+    hashed = store.get_password_hash(email)
+    matches, needs_upgrade = service.verify(password, hashed)
+    if not matches:
+        return None
+    if needs_upgrade:
+        # Legacy SHA-256 account: store a scrypt hash now that we know the password
+        return store.update(email, {"password": service.hash(password)})
+    return store.get(email)
 
 def login_user(email, password):
-    """Login user and set session state."""
-    user_data = authenticate_user(email, password)
+    """Login user and set session state. Raises LoginRateLimitedError or PasswordServiceBusyError."""
+    limiter = get_login_limiter()
+    try:
+        limiter.check(email, get_client_ip())
+        user_data = authenticate_user(email, password)
+    except LoginRateLimitedError:
+        metrics.LOGIN_ATTEMPTS.labels("rate_limited").inc()
+        raise
+    except PasswordServiceBusyError:
+        metrics.LOGIN_ATTEMPTS.labels("busy").inc()
+        raise
     if user_data:
+        limiter.succeeded(email)
+        metrics.LOGIN_ATTEMPTS.labels("success").inc()
         st.session_state["authenticated"] = True
         st.session_state["user_email"] = email
         st.session_state["user_data"] = user_data
+        start_session(st.session_state, st.query_params, email)
         return True
+    metrics.LOGIN_ATTEMPTS.labels("invalid").inc()
     return False
 
 # Main UI
@@ -140,12 +164,19 @@ with st.container():
         
         if login_button:
             if email and password:
-                if login_user(email, password):
-                    st.success("✅ Login successful! Redirecting to main app...")
-                    st.balloons()
-                    st.switch_page("pages/3_main_app.py")
+                try:
+                    logged_in = login_user(email, password)
+                except LoginRateLimitedError as e:
+                    st.error(f"⏳ Too many login attempts. Please wait {e.retry_after:.0f} seconds and try again.")
+                except PasswordServiceBusyError:
+                    st.error("⏳ Lots of people are logging in right now. Please try again in a moment.")
                 else:
-                    st.error("❌ Invalid email or password. Please try again.")
+                    if logged_in:
+                        st.success("✅ Login successful! Redirecting to main app...")
+                        st.balloons()
+                        st.switch_page("pages/3_main_app.py")
+                    else:
+                        st.error("❌ Invalid email or password. Please try again.")
             else:
                 st.error("❌ Please fill in all fields.")
     
@@ -223,15 +254,14 @@ if st.button(
         }
     }
     
-    # Save the Blue Jays user to the users file
-    users = load_users()
-    users["bluejays.fan@mygymbro.com"] = blue_jays_user_data
-    save_users(users)
+    # Save the Blue Jays user to the user store
+    get_user_store().put("bluejays.fan@mygymbro.com", blue_jays_user_data)
     
     # Log in the Blue Jays fan
     st.session_state["authenticated"] = True
     st.session_state["user_email"] = "bluejays.fan@mygymbro.com"
     st.session_state["user_data"] = blue_jays_user_data
+    start_session(st.session_state, st.query_params, "bluejays.fan@mygymbro.com")
     
     st.success("Welcome, Blue Jays Fan! Logging you in...")
     st.balloons()
@@ -289,15 +319,14 @@ if st.button(
         }
     }
     
-    # Save the Clash Royale user to the users file
-    users = load_users()
-    users["clashroyale.player@mygymbro.com"] = clash_royale_user_data
-    save_users(users)
+    # Save the Clash Royale user to the user store
+    get_user_store().put("clashroyale.player@mygymbro.com", clash_royale_user_data)
     
     # Log in the Clash Royale player
     st.session_state["authenticated"] = True
     st.session_state["user_email"] = "clashroyale.player@mygymbro.com"
     st.session_state["user_data"] = clash_royale_user_data
+    start_session(st.session_state, st.query_params, "clashroyale.player@mygymbro.com")
     
     st.success("Welcome, Clash Royale Player! Logging you in...")
     st.balloons()
@@ -331,3 +360,5 @@ st.markdown("""
     }
 </style>
 """, unsafe_allow_html=True)
+
+end_rerun()
@@ -1,9 +1,11 @@
 import streamlit as st
-import json
 from pathlib import Path
-import hashlib
 from datetime import datetime
 import re
+from utils.user_store import get_user_store
+from utils.sessions import start_session
+from utils.passwords import get_password_service, PasswordServiceBusyError
+from utils.instrumentation import begin_rerun, end_rerun
 
 # Page configuration
 st.set_page_config(
@@ -13,6 +15,9 @@ st.set_page_config(
     initial_sidebar_state="collapsed"
 )
 
+# Rerun boundaries for metrics and (with INSTRUMENTATION=1) the phase timings
+begin_rerun("signup", st.session_state)
+
 # Custom CSS
 st.markdown("""
 <style>
@@ -93,23 +98,10 @@ if "temp_user_data" not in st.session_state:
 # Data directory setup
 DATA_DIR = Path("data")
 DATA_DIR.mkdir(exist_ok=True)
-USERS_FILE = DATA_DIR / "users.json"
-
-def load_users():
-    """Load users from JSON file."""
-    if USERS_FILE.exists():
-        with open(USERS_FILE, 'r') as f:
-            return json.load(f)
-    return {}
-
-def save_users(users):
-    """Save users to JSON file."""
-    with open(USERS_FILE, 'w') as f:
-        json.dump(users, f, indent=2)
 
 def hash_password(password):
-    """Hash password using SHA-256."""
-    return hashlib.sha256(password.encode()).hexdigest()
+    """Hash password with scrypt on the shared password worker pool."""
+    return get_password_service().hash(password)
 
 def validate_email(email):
     """Validate email format."""
@@ -130,9 +122,9 @@ def validate_password(password):
 
 def create_user_basic(email, password, first_name, last_name):
     """Create a basic user account with minimal information."""
-    users = load_users()
+    store = get_user_store()
     
-    if email in users:
+    if store.exists(email):
         return False, "Email already exists"
     
     if not validate_email(email):
@@ -142,10 +134,15 @@ def create_user_basic(email, password, first_name, last_name):
     if not is_valid:
         return False, message
     
+    try:
+        hashed = hash_password(password)
+    except PasswordServiceBusyError:
+        return False, "The server is busy, please try again in a moment"
+    
     # Create minimal user data
     user_data = {
         "email": email,
-        "password": hash_password(password),
+        "password": hashed,
         "first_name": first_name,
         "last_name": last_name,
         "created_at": datetime.now().isoformat(),
@@ -158,14 +155,15 @@ def create_user_basic(email, password, first_name, last_name):
         }
     }
     
-    users[email] = user_data
-    save_users(users)
+    # Insert-if-absent so two sessions racing on the same email cannot both succeed
+    if not store.create(email, user_data):
+        return False, "Email already exists"
     return True, "Account created successfully", user_data
 
 def update_user_profile(email, updated_data):
     """Update user profile with additional information."""
-    users = load_users()
-    if email in users:
+    store = get_user_store()
+    if store.exists(email):
         # Convert height and weight if provided
         if 'height_feet' in updated_data and 'height_inches' in updated_data:
             height_feet = updated_data['height_feet']
@@ -177,9 +175,9 @@ def update_user_profile(email, updated_data):
             updated_data['weight_kg'] = weight_lbs * 0.453592
         
         # Update the user data
-        users[email].update(updated_data)
-        save_users(users)
-        return True, users[email]
+        user_data = store.update(email, updated_data)
+        if user_data is not None:
+            return True, user_data
     return False, None
 
 # Main UI
@@ -453,6 +451,7 @@ elif st.session_state["signup_stage"] == 2:
                         # Automatically log in the user
                         st.session_state["authenticated"] = True
                         st.session_state["user_data"] = updated_user_data
+                        start_session(st.session_state, st.query_params, st.session_state["user_email"])
                         st.success("✅ Profile completed successfully!")
                         st.balloons()
                         st.info("🔄 Redirecting to main app...")
@@ -479,3 +478,5 @@ st.markdown(
     """, 
     unsafe_allow_html=True
 )
+
+end_rerun()
@@ -49,14 +49,26 @@ Main Application Page
   * setTimeout을 사용한 scroll 호출
 
 - 메시지 표시 방식:
-  * for message in st.session_state["messages"]: st.chat_message(...).write(...)
-  * rerun할 때마다 전체 메시지 리스트를 다시 렌더링
+  * display_chat_history(): 최근 CHAT_RECENT_MESSAGES개 메시지만 전체 렌더링
+  * 그 이전 메시지는 한 줄 요약(최대 CHAT_PAGE_SIZE개) + 개수만 표시 → rerun 비용 일정
+  * "Show earlier messages" 버튼으로 CHAT_PAGE_SIZE개씩 더 펼침 (새 메시지 전송 시 초기화)
+
+- Fragment 분리 (st.fragment, Streamlit 1.37+):
+  * body_fat_estimator(), workout_plan_buttons(), calorie_results_panel(), display_chat_history()
+  * fragment 안의 위젯은 해당 fragment만 다시 실행 (채팅 재렌더링 없음)
+  * 채팅/프로필이 바뀌는 경우에만 st.rerun()으로 전체 실행
   * Streamlit이 자동으로 새 콘텐츠에 맞춰 스크롤 조정
 
 - 상태 관리:
   * session_state["messages"]: 모든 대화 메시지 저장
+  * session_state["chat_history_shown"]: 전체 렌더링할 최근 메시지 개수
+  * session_state["transcript_start"]: 저장된 대화 로그에서 아직 불러오지 않은 메시지 수
+  * 모든 메시지는 add_chat_message()로 data/transcripts/ 로그에 추가 저장 (로그인 시 최근 페이지만 로드)
   * session_state["pre_filled_question"]: 버튼 클릭 시 생성되는 질문
   * session_state["prefilled_triggered"]: pre-filled question 플래그
+  * session_state["job_notice"]: 백그라운드 작업 제출 실패 안내 (utils/jobs.py, 사용자당 동시 작업 수 제한)
+  * session_state["session_token"]: 새로고침 후 로그인 복원용 서명 토큰 (URL ?session= 에도 저장)
+  * session_state["instrumentation_session"]: 세션 ID (타이밍 집계, 스트리밍 요청 취소 토큰 등록에 사용)
 """
 
 import streamlit as st
@@ -64,9 +76,25 @@ from dotenv import load_dotenv
 import json
 from pathlib import Path
 import os
-from openai import OpenAI
-import pandas as pd
-import re
+import hashlib
+import time
+from utils.user_store import get_user_store
+from utils.equipment import get_equipment_catalog
+from utils.llm_backends import get_llm_backend, llm_backend_needs_api_key
+from utils.single_flight import get_single_flight
+from utils.workout_stream import IncrementalWorkoutParser, STRUCTURED_OUTPUT_INSTRUCTIONS, render_workout_markdown
+from utils.workout_parser import analyze_workout_text, get_parsed_workout
+from utils.rate_limiter import get_llm_governor, GovernorBusyError, GovernorTimeoutError
+from utils.conversation import count_tokens, get_context_window
+from utils.transcripts import get_transcript_store
+from utils.response_cache import get_response_cache
+from utils.sessions import restore_session, end_session
+from utils.jobs import get_job_queue, JobFailedError, JobLimitError
+from utils.cancellation import get_cancellation_registry, RequestCancelled
+from utils import metrics
+from utils.instrumentation import (
+    begin_rerun, end_rerun, record, timed, get_instrumentation, instrumentation_enabled, is_instrumentation_admin
+)
 
 # Try to import matplotlib, but make it optional
 try:
@@ -89,6 +117,9 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
+# Rerun boundaries for metrics and (with INSTRUMENTATION=1) the phase timings
+begin_rerun("main_app", st.session_state)
+
 # Custom CSS
 st.markdown("""
 <style>
@@ -155,32 +186,14 @@ if "temp_custom_workout_data" not in st.session_state:
 DATA_DIR = Path("data")
 DATA_DIR.mkdir(exist_ok=True)
 USER_PROFILE_PATH = DATA_DIR / "user_profiles.json"
-USERS_FILE = DATA_DIR / "users.json"
-EQUIPMENT_FILE = DATA_DIR / "GymMachineList.xlsx"
-
-# Functions to load and save user data
-def load_users():
-    """Load users from JSON file."""
-    if USERS_FILE.exists():
-        with open(USERS_FILE, 'r') as f:
-            return json.load(f)
-    return {}
-
-def save_users(users):
-    """Save users to JSON file."""
-    with open(USERS_FILE, 'w') as f:
-        json.dump(users, f, indent=2)
 
+# Functions to save user data
 def update_user_profile(email, updated_data):
-    """Update user profile data in the JSON file and session state."""
-    users = load_users()
-    if email in users:
-        # Update the user data
-        users[email].update(updated_data)
-        save_users(users)
-        
+    """Update user profile data in the user store and session state."""
+    user_data = get_user_store().update(email, updated_data)
+    if user_data is not None:
         # Update session state
-        st.session_state["user_data"] = users[email]
+        st.session_state["user_data"] = user_data
         return True
     return False
 
@@ -394,60 +407,39 @@ def get_text(key):
 
 def logout_user():
     """Logout user and clear session state."""
+    end_session(st.session_state, st.query_params)
     st.session_state["authenticated"] = False
     st.session_state["user_email"] = None
     st.session_state["user_data"] = {}
     st.session_state["messages"] = []
+    st.session_state.pop("chat_history_shown", None)
+    st.session_state.pop("transcript_owner", None)
+    st.session_state.pop("transcript_start", None)
     st.rerun()
 
 def check_authentication():
-    """Check if user is authenticated, redirect to login if not."""
-    if not st.session_state.get("authenticated", False):
+    """Check if user is authenticated (restoring a refreshed session from its URL token), redirect to login if not."""
+    if not restore_session(st.session_state, st.query_params):
         st.warning("🔐 Please log in to access MyGymBro")
         if st.button("Go to Login", use_container_width=True):
             st.switch_page("pages/1_login.py")
+        end_rerun()
         st.stop()
 
 
 # Load gym equipment data
 def load_gym_equipment():
-    """Load gym equipment data from Excel file."""
-    try:
-        if EQUIPMENT_FILE.exists():
-            df = pd.read_excel(EQUIPMENT_FILE)
-            return df
-        else:
-            # Create a sample equipment list if file doesn't exist
-            sample_equipment = {
-                'Equipment': ['Bench Press', 'Squat Rack', 'Dumbbells', 'Barbells', 'Treadmill', 'Rowing Machine'],
-                'Quantity': [2, 1, 10, 4, 3, 2],
-                'Location': ['Main Area', 'Main Area', 'Free Weights', 'Free Weights', 'Cardio Zone', 'Cardio Zone'],
-                'Status': ['Available', 'Available', 'Available', 'Available', 'Available', 'Available']
-            }
-            df = pd.DataFrame(sample_equipment)
-            df.to_excel(EQUIPMENT_FILE, index=False)
-            return df
-    except Exception as e:
-        st.error(f"Error loading equipment data: {str(e)}")
-        return None
+    """Load gym equipment rows from the shared (cached) equipment catalog."""
+    catalog = get_equipment_catalog()
+    items = catalog.refresh()
+    if catalog.error:
+        st.error(f"Error loading equipment data: {catalog.error}")
+    return items
 
 def get_equipment_summary():
     """Get a summary of available equipment for AI prompts."""
-    df = load_gym_equipment()
-    if df is not None:
-        equipment_list = []
-        for _, row in df.iterrows():
-            # Handle different column structures
-            machine_name = row.get('Machine', row.get('Equipment', 'Unknown'))
-            quantity = row.get('Quantity', 'N/A')
-            min_weight = row.get('Min_Weights(lbs)', 'N/A')
-            max_weight = row.get('Max_weights(lbs)', 'N/A')
-            
-            # Create detailed equipment info
-            weight_info = f" ({min_weight}-{max_weight} lbs)" if min_weight != 'N/A' and max_weight != 'N/A' else ""
-            equipment_list.append(f"- {machine_name} (Qty: {quantity}{weight_info})")
-        return "\n".join(equipment_list)
-    return "Equipment data not available"
+    load_gym_equipment()
+    return get_equipment_catalog().summary
 
 
 # Calorie calculation functions
@@ -607,214 +599,256 @@ def get_body_fat_category(body_fat, gender):
             return category, color
     return "Unknown", "#9E9E9E"
 
-def parse_workout_exercises(text):
-    """Parse workout text to extract individual exercises."""
-    exercises = []
-    lines = text.split('\n')
-    current_exercise = None
-    current_description = []
-    
-    # Patterns to match exercise numbers (1., 2., First, Second, etc.)
-    exercise_patterns = [
-        r'^\d+[\.\)]\s*(.+?)(?:\s*[-–—]|$)',  # 1. Exercise Name or 1) Exercise Name
-        r'^(?:First|Second|Third|Fourth|Fifth|Sixth|Seventh|Eighth|Ninth|Tenth)\s*[:\-]?\s*(.+?)(?:\s*[-–—]|$)',  # First: Exercise Name
-        r'^Exercise\s+\d+[:\-]?\s*(.+?)(?:\s*[-–—]|$)',  # Exercise 1: Exercise Name
-    ]
-    
-    # Skip intro sections (warm-up, introduction, etc.)
-    skip_sections = ['warm-up', 'warmup', 'introduction', 'overview', 'summary', 'cool-down', 'cooldown']
-    
-    for i, line in enumerate(lines):
-        line = line.strip()
-        if not line:
-            # Empty line might separate exercises
-            if current_exercise and current_description:
-                # Don't add empty line, but continue collecting
-                continue
-            continue
-        
-        # Skip section headers
-        line_lower = line.lower()
-        if any(section in line_lower for section in skip_sections) and len(line) < 50:
-            # Reset current exercise if we hit a section header
-            if current_exercise:
-                exercises.append({
-                    'name': current_exercise,
-                    'description': '\n'.join(current_description).strip()
-                })
-                current_exercise = None
-                current_description = []
-            continue
-        
-        # Check if this line starts a new exercise
-        is_exercise_start = False
-        exercise_name = None
-        
-        for pattern in exercise_patterns:
-            match = re.match(pattern, line, re.IGNORECASE)
-            if match:
-                exercise_name = match.group(1).strip()
-                # Clean up exercise name (remove extra punctuation)
-                exercise_name = re.sub(r'^[-–—\s]+|[-–—\s]+$', '', exercise_name)
-                if exercise_name:
-                    is_exercise_start = True
-                    break
+def get_ordinal(exercise_num):
+    """Get the ordinal label used on workout blocks."""
+    return ["First", "Second", "Third", "Fourth", "Fifth", "Sixth", "Seventh", "Eighth", "Ninth", "Tenth"][exercise_num - 1] if exercise_num <= 10 else f"{exercise_num}th"
+
+def display_workout_header():
+    """Display the heading shown above workout blocks."""
+    st.markdown("### 💪 Your Workout Plan")
+    st.markdown("*Click on each workout block to see detailed instructions*")
+    st.markdown("---")
+
+def display_exercise_block(exercise_num, exercise):
+    """Display one exercise (from a structured plan or the text parser) as an expandable block."""
+    name = str(exercise.get('name', ''))
+    display_name = name[:35] + "..." if len(name) > 35 else name
+    
+    with st.expander(f"🏋️ {get_ordinal(exercise_num)} Workout: {display_name}", expanded=False):
+        st.markdown(f"### {name}")
+        day_info = " - ".join(str(part) for part in (exercise.get('day'), exercise.get('focus')) if part)
+        if day_info:
+            st.caption(day_info)
+        st.markdown("---")
         
-        # Also check for bold text (markdown format)
-        if not is_exercise_start:
-            bold_match = re.match(r'^\*\*(.+?)\*\*', line)
-            if bold_match:
-                potential_name = bold_match.group(1).strip()
-                # Check if it looks like an exercise name (not too long, not a full sentence)
-                if len(potential_name) < 80 and ':' not in potential_name:
-                    exercise_name = potential_name
-                    is_exercise_start = True
+        if exercise.get('sets') and exercise.get('reps'):
+            st.markdown(f"**📊 Sets/Reps:** {exercise['sets']} sets x {exercise['reps']} reps")
+        if exercise.get('rest'):
+            st.markdown(f"**⏱️ Rest:** {exercise['rest']}")
+        if exercise.get('weight'):
+            st.markdown(f"**🏋️ Weight:** {exercise['weight']}")
         
-        # Check for lines that start with common exercise patterns
-        if not is_exercise_start:
-            # Look for lines that might be exercise names (short, capitalized, contain exercise keywords)
-            exercise_keywords = ['squat', 'press', 'curl', 'row', 'pull', 'push', 'deadlift', 'lunge', 'plank', 'crunch', 'bench', 'fly', 'extension', 'raise', 'dip']
-            if len(line) < 80 and any(keyword in line_lower for keyword in exercise_keywords):
-                # Check if it's likely an exercise name (starts with capital, short, no colon in middle)
-                if line[0].isupper() and line.count(':') <= 1:
-                    parts = line.split(':', 1)
-                    if len(parts) == 1 or (len(parts) == 2 and len(parts[0]) < 60):
-                        exercise_name = parts[0].strip()
-                        is_exercise_start = True
+        if exercise.get('description'):
+            st.markdown("---")
+            st.markdown("#### 📝 Description & Instructions")
+            st.markdown(exercise['description'])
         
-        if is_exercise_start and exercise_name:
-            # Save previous exercise if exists
-            if current_exercise:
-                exercises.append({
-                    'name': current_exercise,
-                    'description': '\n'.join(current_description).strip()
-                })
-            
-            # Start new exercise
-            current_exercise = exercise_name
-            current_description = []
-            # Add the rest of the line as description if it contains more info
-            if ':' in line:
-                remaining = line.split(':', 1)[1].strip()
-                if remaining:
-                    current_description.append(remaining)
-        else:
-            # Add to current exercise description
-            if current_exercise:
-                # Skip if this looks like the start of a new section
-                if not (line_lower.startswith('workout') or line_lower.startswith('day') or 
-                        any(section in line_lower for section in skip_sections)):
-                    current_description.append(line)
-            elif not exercises:  # If no exercise found yet, might be intro text
-                pass
-    
-    # Add last exercise
-    if current_exercise:
-        exercises.append({
-            'name': current_exercise,
-            'description': '\n'.join(current_description).strip()
-        })
-    
-    # If no exercises found with patterns, try alternative parsing
-    if not exercises:
-        # Look for numbered list items
-        for i, line in enumerate(lines):
-            line = line.strip()
-            if re.match(r'^\d+[\.\)]\s+', line):
-                # Extract exercise name
-                exercise_name = re.sub(r'^\d+[\.\)]\s+', '', line).strip()
-                # Get description from next few lines
-                desc_lines = []
-                for j in range(i+1, min(i+6, len(lines))):
-                    next_line = lines[j].strip()
-                    if next_line and not re.match(r'^\d+[\.\)]\s+', next_line):
-                        desc_lines.append(next_line)
-                    else:
-                        break
-                if exercise_name:
-                    exercises.append({
-                        'name': exercise_name,
-                        'description': '\n'.join(desc_lines).strip()
-                    })
-    
-    # Filter out exercises with very short or invalid names
-    exercises = [ex for ex in exercises if ex['name'] and len(ex['name']) > 2]
-    
-    return exercises
+        form_tips = exercise.get('form_tips') or []
+        if form_tips:
+            st.markdown("---")
+            st.markdown("#### ✅ Proper Form Tips")
+            for tip in form_tips[:3]:  # Show up to 3 form tips
+                st.markdown(f"• {tip}")
 
-def display_workout_blocks(response_text):
-    """Display workout in block/spreadsheet style with clickable buttons."""
-    exercises = parse_workout_exercises(response_text)
-    
+def display_structured_workout(plan):
+    """Display a stored structured workout plan without any text parsing."""
+    exercises = [
+        dict(exercise, day=day.get('day'), focus=day.get('focus'))
+        for day in plan.get('days', [])
+        for exercise in day.get('exercises', [])
+    ]
+    if plan.get('title'):
+        st.markdown(f"**{plan['title']}**")
+    display_workout_header()
+    for i, exercise in enumerate(exercises):
+        display_exercise_block(i + 1, exercise)
+    if plan.get('notes'):
+        st.markdown(plan['notes'])
+    if plan.get('notice'):
+        st.markdown(plan['notice'])
+
+# Shown with the exercises that did complete when a structured plan stops early
+PLAN_CUT_OFF_NOTICE = (
+    "⚠️ **This plan was cut off before it was finished.** "
+    "Only the exercises that were completed are shown. Please try again for the full plan."
+)
+PLAN_NOT_FINISHED = "⚠️ **This plan could not be finished.** Please try again."
+
+def build_structured_answer(parser, raw_response, error=None, finished=True):
+    """
+    Turn a structured response into (content, plan) for the chat. A plan that
+    stopped early keeps its completed exercises plus a visible notice (the error
+    message, if there was one). Without any complete exercise, content is the
+    error alone; raw JSON fragments are never shown. A reply that is plain text
+    rather than JSON (nothing went wrong) is kept as is with plan None.
+    """
+    plan = parser.result()
+    if plan is None and parser.exercises:
+        plan = parser.partial_plan()
+        plan["notice"] = error or PLAN_CUT_OFF_NOTICE
+    if plan is not None:
+        return render_workout_markdown(plan), plan
+    if error is not None:
+        return error, None
+    if not finished or raw_response.lstrip().startswith("{"):
+        return PLAN_NOT_FINISHED, None
+    return raw_response, None
+
+def stream_structured_workout(stream):
+    """
+    Consume a structured (JSON) response stream and render each exercise block
+    as soon as it is complete. Returns (raw_response, parser, error); error is
+    the error message the stream ended with (kept out of the JSON), or None.
+    """
+    parser = IncrementalWorkoutParser()
+    loading_placeholder = st.empty()
+    loading_placeholder.markdown(get_text("loading_message"))
+    chunks = []
+    error = None
+    exercise_count = 0
+    for chunk in stream:
+        if is_error_chunk(chunk):
+            error = chunk
+            continue
+        chunks.append(chunk)
+        for exercise in parser.feed(chunk):
+            exercise_count += 1
+            if exercise_count == 1:
+                display_workout_header()
+            display_exercise_block(exercise_count, exercise)
+    loading_placeholder.empty()
+    return "".join(chunks), parser, error
+
+def display_workout_blocks(exercises):
+    """Display parsed exercises in block/spreadsheet style with clickable buttons."""
     if not exercises:
         # If parsing failed, display as regular text
         return False
     
     # Display workout blocks
-    st.markdown("### 💪 Your Workout Plan")
-    st.markdown("*Click on each workout block to see detailed instructions*")
-    st.markdown("---")
+    display_workout_header()
     
     # Display workout blocks in a single column (1 per row)
-    num_exercises = len(exercises)
-    
     for i, exercise in enumerate(exercises):
-        exercise_num = i + 1
-        
-        # Create workout block button
-        ordinal = ["First", "Second", "Third", "Fourth", "Fifth", "Sixth", "Seventh", "Eighth", "Ninth", "Tenth"][exercise_num - 1] if exercise_num <= 10 else f"{exercise_num}th"
-        
-        # Truncate exercise name for display
-        display_name = exercise['name'][:35] + "..." if len(exercise['name']) > 35 else exercise['name']
-        
-        # Use expander for each workout block
-        with st.expander(f"🏋️ {ordinal} Workout: {display_name}", expanded=False):
-            st.markdown(f"### {exercise['name']}")
-            st.markdown("---")
-            
-            # Try to extract sets/reps, form tips, etc. from description
-            desc_text = exercise['description'].lower() if exercise['description'] else ""
-            
-            # Look for sets/reps pattern
-            sets_reps_match = re.search(r'(\d+)\s*(?:sets?|x)\s*(?:of\s*)?(\d+)', desc_text)
-            if sets_reps_match:
-                st.markdown(f"**📊 Sets/Reps:** {sets_reps_match.group(1)} sets x {sets_reps_match.group(2)} reps")
-            
-            # Look for rest period
-            rest_match = re.search(r'rest[:\s]+(\d+[-\s]?\d*)\s*(?:seconds?|sec|minutes?|min)', desc_text)
-            if rest_match:
-                st.markdown(f"**⏱️ Rest:** {rest_match.group(1)}")
-            
-            # Look for weight information
-            weight_match = re.search(r'(\d+[-\s]?\d*)\s*(?:lbs?|kg|pounds?|kilograms?)', desc_text)
-            if weight_match:
-                st.markdown(f"**🏋️ Weight:** {weight_match.group(1)}")
-            
-            # Display description
-            if exercise['description']:
-                st.markdown("---")
-                st.markdown("#### 📝 Description & Instructions")
-                st.markdown(exercise['description'])
-                
-                # Try to extract form tips
-                form_keywords = ['form', 'technique', 'posture', 'position', 'keep', 'maintain', 'avoid']
-                if any(keyword in desc_text for keyword in form_keywords):
-                    st.markdown("---")
-                    st.markdown("#### ✅ Proper Form Tips")
-                    # Extract sentences with form-related keywords
-                    sentences = exercise['description'].split('.')
-                    form_sentences = [s.strip() + '.' for s in sentences if any(keyword in s.lower() for keyword in form_keywords)]
-                    if form_sentences:
-                        for tip in form_sentences[:3]:  # Show up to 3 form tips
-                            st.markdown(f"• {tip}")
+        display_exercise_block(i + 1, exercise)
     
     return True
 
+# Persistent chat transcripts: messages loaded from the log per page
+TRANSCRIPT_PAGE_SIZE = 20
+
+def add_chat_message(message):
+    """Add a message to the chat and append it to the user's persistent transcript."""
+    st.session_state["messages"].append(message)
+    try:
+        get_transcript_store().append(st.session_state["user_email"], message)
+    except OSError as e:
+        st.warning(f"⚠️ Could not save chat history: {str(e)}")
+
+def restore_chat_transcript():
+    """Load the most recent page of the user's saved chat, once per login."""
+    email = st.session_state.get("user_email")
+    if not email or st.session_state.get("transcript_owner") == email:
+        return
+    messages, start = get_transcript_store().read_page(email, limit=TRANSCRIPT_PAGE_SIZE)
+    # A question left unanswered (e.g. the tab was closed mid-answer) must not trigger a new API call
+    while messages and messages[-1]["role"] == "user":
+        messages.pop()
+    st.session_state["messages"] = messages
+    st.session_state["transcript_start"] = start
+    st.session_state["transcript_owner"] = email
+
+def load_earlier_transcript_page():
+    """Prepend the previous page of the saved transcript to the chat."""
+    messages, start = get_transcript_store().read_page(
+        st.session_state["user_email"], before=st.session_state["transcript_start"], limit=TRANSCRIPT_PAGE_SIZE
+    )
+    st.session_state["messages"][:0] = messages
+    st.session_state["transcript_start"] = start
+    return len(messages)
+
+# Chat history virtualization: only the most recent messages are rendered in full
+CHAT_RECENT_MESSAGES = 10
+CHAT_PAGE_SIZE = 10
+CHAT_SUMMARY_LENGTH = 90
+
+def display_chat_message(message):
+    """Render one stored chat message in full."""
+    with st.chat_message(message["role"]):
+        # Check if this is an assistant message that might contain a workout
+        if message["role"] == "assistant" and message.get("workout"):
+            # Structured plan: render blocks straight from the stored JSON
+            display_structured_workout(message["workout"])
+        elif message["role"] == "assistant":
+            content = message["content"]
+            # Parsed once when the message was stored; only re-derived after a parser change
+            parsed = get_parsed_workout(message)
+            
+            # Try to display as workout blocks
+            displayed_as_blocks = display_workout_blocks(parsed["exercises"])
+            if not displayed_as_blocks:
+                # Not a workout (or parsing found nothing), display as regular text
+                st.write(content)
+        else:
+            # User message, display normally
+            st.write(message["content"])
+
+def summarize_chat_message(message):
+    """One-line summary of a collapsed message (no parsing, just the stored fields)."""
+    icon = "🧑" if message["role"] == "user" else "💪"
+    workout = message.get("workout")
+    if workout:
+        count = sum(len(day.get("exercises", [])) for day in workout.get("days", []))
+        title = workout.get("title") or "Workout plan"
+        return f"{icon} {title} ({count} exercises)"
+    parsed = message.get("parsed")
+    if parsed and parsed.get("exercises"):
+        return f"{icon} Workout ({len(parsed['exercises'])} exercises)"
+    first_line = message["content"].lstrip().split("\n", 1)[0]
+    if len(first_line) > CHAT_SUMMARY_LENGTH:
+        first_line = first_line[:CHAT_SUMMARY_LENGTH] + "..."
+    return f"{icon} {first_line}"
+
+@st.fragment
+@timed("chat_render")
+def display_chat_history():
+    """
+    Render the latest messages in full and collapse older ones, so each rerun
+    costs the same however long the conversation gets. Runs as a fragment, so
+    paging through history does not rerun the sidebar.
+    """
+    messages = st.session_state["messages"]
+    shown = st.session_state.get("chat_history_shown", CHAT_RECENT_MESSAGES)
+    start = max(0, len(messages) - shown)
+    # Keep a question and its answer together
+    if 0 < start < len(messages) and messages[start]["role"] == "assistant":
+        start -= 1
+    
+    if start > 0:
+        summary_start = max(0, start - CHAT_PAGE_SIZE)
+        with st.container():
+            if summary_start > 0:
+                st.caption(f"🗂️ {summary_start} earlier messages hidden")
+            for message in messages[summary_start:start]:
+                st.caption(summarize_chat_message(message))
+            if st.button(f"⬆️ Show earlier messages ({start} more)", key="show_earlier_messages"):
+                st.session_state["chat_history_shown"] = len(messages) - start + CHAT_PAGE_SIZE
+                st.rerun(scope="fragment")
+    elif st.session_state.get("transcript_start", 0) > 0:
+        # Everything loaded is on screen; older messages are read from the saved transcript on demand
+        if st.button("⬆️ Load earlier messages", key="load_earlier_messages"):
+            on_screen = len(messages)
+            loaded = load_earlier_transcript_page()
+            st.session_state["chat_history_shown"] = on_screen + min(loaded, CHAT_PAGE_SIZE)
+            st.rerun(scope="fragment")
+    
+    for message in messages[start:]:
+        display_chat_message(message)
+
+def is_error_chunk(chunk):
+    """True for the error messages stream_ai_answer yields (always as a chunk of their own, starting with the warning sign)."""
+    return chunk.startswith("⚠️")
+
 # AI response function - returns a generator for streaming
-def get_ai_response_stream(question, prompt_type):
-    import ssl
-    import httpx
-    
+def stream_ai_answer(question, language, equipment_info, structured=False, history=None,
+                     on_status=None, on_auth_error=None, cancel_token=None):
+    """
+    Stream an answer to question; history (earlier chat messages) is folded into a
+    token-budgeted context. Uses no Streamlit calls, so background jobs can run it:
+    on_status(status) reports the queue position (None once answering starts) and
+    on_auth_error() is called when the API key is rejected. Cancelling cancel_token
+    raises RequestCancelled here and stops the upstream call if no one else shares it.
+    """
     # Choose API key source based on environment
     if APP_ENV == "local":
         # Local: use OPENAI_API_KEY_LOCAL if provided, else fallback to OPENAI_API_KEY
@@ -822,7 +856,8 @@ def get_ai_response_stream(question, prompt_type):
     else:
         # Default/prod: use OPENAI_API_KEY from .env (loaded above)
         api_key = os.environ.get('OPENAI_API_KEY')
-    if not api_key or api_key == 'your_api_key_here':
+    # Only the real OpenAI backend needs a key (OpenAI-compatible servers and Ollama can run without one)
+    if llm_backend_needs_api_key() and (not api_key or api_key == 'your_api_key_here'):
         error_msg = (
             "⚠️ **OpenAI API Key Not Configured**\n\n"
             "To use MyGymBro's AI features, you need to set up your OpenAI API key:\n\n"
@@ -838,24 +873,18 @@ def get_ai_response_stream(question, prompt_type):
         return
     
     # Strip whitespace from API key
-    api_key = api_key.strip()
+    api_key = api_key.strip() if api_key else None
     
-    # Create client with SSL verification disabled for problematic networks
+    # Configured backend (LLM_BACKEND); OpenAI backends reuse the process-wide pooled client
     try:
-        client = OpenAI(
-            api_key=api_key,
-            http_client=httpx.Client(verify=False)
-        )
+        backend = get_llm_backend(api_key)
     except Exception as e:
-        error_msg = f"⚠️ **Error initializing OpenAI client:** {str(e)}"
+        error_msg = f"⚠️ **Error initializing the AI backend:** {str(e)}"
         yield error_msg
         return
     
-    # Get equipment information
-    equipment_info = get_equipment_summary()
-    
     # Backend-controlled system prompt (can be modified in backend)
-    current_language = st.session_state["language"]
+    current_language = language
     
     # Language-specific system prompts (controlled from backend)
     system_prompts = {
@@ -867,30 +896,104 @@ def get_ai_response_stream(question, prompt_type):
     }
     
     system_prompt = system_prompts.get(current_language, system_prompts["English"])
+    if structured:
+        # Structured mode: the plan comes back as JSON and is rendered block by block while streaming
+        system_prompt += "\n\n" + STRUCTURED_OUTPUT_INSTRUCTIONS
+    
+    temperature = 0.4
+    # JSON is more verbose than prose, so structured plans get a larger budget
+    max_tokens = 2000 if structured else 1000
+    response_format = {"type": "json_object"} if structured else None
+    
+    def produce(flight):
+        """Upstream call for one flight, admitted through the process-wide governor."""
+        prompt_tokens = context_info["input_tokens"]
+        # Cancelled by single-flight once nobody is waiting for this answer any more
+        upstream_cancel = flight.cancel_token
+        
+        def report_queue_position(position, waited):
+            # Leaves the governor queue without ever calling upstream
+            upstream_cancel.raise_if_cancelled()
+            flight.set_status({"queue_position": position, "waited": waited})
+        
+        upstream_called = False
+        output_parts = []
+        output_tokens = 0
+        try:
+            with get_llm_governor().acquire(prompt_tokens + max_tokens, on_wait=report_queue_position) as permit:
+                upstream_called = True
+                flight.set_status(None)
+                try:
+                    for content in backend.stream_chat(messages, temperature, max_tokens, response_format,
+                                                       labels={"language": current_language},
+                                                       cancel_token=upstream_cancel):
+                        output_parts.append(content)
+                        yield content
+                finally:
+                    # Same tokenizer as the input side; counted once on the whole text, since chunks split tokens
+                    output_tokens = count_tokens("".join(output_parts), get_context_window().model) if output_parts else 0
+                    # Counted once per upstream call (coalesced subscribers share these tokens)
+                    metrics.LLM_TOKENS.labels(backend.name, "in").inc(prompt_tokens)
+                    metrics.LLM_TOKENS.labels(backend.name, "out").inc(output_tokens)
+                    # Also on cancellation, so the unused part of the reservation goes back to the TPM budget
+                    permit.used_tokens = prompt_tokens + output_tokens
+        finally:
+            if upstream_cancel.cancelled:
+                metrics.LLM_CANCELLED.labels(backend.name, upstream_cancel.reason).inc()
+                if upstream_called:
+                    metrics.LLM_WASTED_TOKENS.labels(backend.name, "in").inc(prompt_tokens)
+                    metrics.LLM_WASTED_TOKENS.labels(backend.name, "out").inc(output_tokens)
+                metrics.LLM_TOKENS_AVOIDED.labels(backend.name).inc(max(0, max_tokens - output_tokens))
     
     # Use streaming API with error handling
+    mode = "structured" if structured else "text"
+    metrics.LLM_REQUESTS.labels(backend.name, mode).inc()
     try:
-        stream = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": question}
-            ],
-            temperature=0.4,
-            max_tokens=1000,
-            stream=True  # Enable streaming
-        )
+        # Recent turns verbatim plus a compact memory of older ones, kept under the input token budget
+        # (inside the try, so a context-building failure becomes an error message, not a traceback)
+        messages, context_info = get_context_window().build(system_prompt, history or [], question)
+        # Identical concurrent requests (e.g. a whole class clicking the same button) share one upstream stream
+        flight_key = hashlib.sha256(
+            json.dumps([backend.describe(), messages, temperature, max_tokens, response_format]).encode("utf-8")
+        ).hexdigest()
         
         # Generator function that yields tokens as they arrive
-        for chunk in stream:
-            if chunk.choices[0].delta.content is not None:
-                content = chunk.choices[0].delta.content
-                yield content
+        first_chunk = True
+        request_start = time.perf_counter()
+        for content in get_single_flight().stream(flight_key, produce, on_status=on_status, cancel_token=cancel_token):
+            if first_chunk:
+                if on_status:
+                    on_status(None)
+                ttft = time.perf_counter() - request_start
+                record("llm_first_token", ttft)
+                metrics.LLM_TTFT_SECONDS.labels(backend.name, mode).observe(ttft)
+                first_chunk = False
+            yield content
+        # Wall time of the whole answer, including rendering between chunks
+        request_seconds = time.perf_counter() - request_start
+        record("llm_stream", request_seconds)
+        metrics.LLM_REQUEST_SECONDS.labels(backend.name, mode).observe(request_seconds)
+    except RequestCancelled:
+        # Nobody is reading this answer any more; never turn it into an error message (or a cache entry)
+        raise
+    except (GovernorBusyError, GovernorTimeoutError) as e:
+        if on_status:
+            on_status(None)
+        metrics.LLM_ERRORS.labels(backend.name, "busy" if isinstance(e, GovernorBusyError) else "queue_timeout").inc()
+        error_msg = (
+            "⚠️ **MyGymBro is very busy right now**\n\n"
+            "Too many students are asking at the same time. Please try again in a minute."
+        )
+        yield error_msg
     except Exception as e:
+        if on_status:
+            on_status(None)
         error_type = type(e).__name__
         if "AuthenticationError" in error_type or "401" in str(e) or "invalid_api_key" in str(e):
+            metrics.LLM_ERRORS.labels(backend.name, "authentication").inc()
             # Mark error state
-            st.session_state["api_key_error"] = True
+            if on_auth_error:
+                on_auth_error()
             # Show minimal error message
             error_msg = (
                 "⚠️ **Unable to connect to OpenAI**\n\n"
@@ -899,427 +1002,510 @@ def get_ai_response_stream(question, prompt_type):
             )
             yield error_msg
         else:
+            metrics.LLM_ERRORS.labels(backend.name, "other").inc()
             error_msg = f"⚠️ **Error:** {str(e)[:200]}"
             yield error_msg
 
-# Check authentication
-check_authentication()
+def get_ai_response_stream(question, prompt_type, structured=False, history=None):
+    """Stream an answer for this session, showing the queue position while the request waits."""
+    # Shows the queue position while the request waits for a free slot
+    queue_placeholder = st.empty()
+    
+    def show_queue_status(status):
+        if status:
+            queue_placeholder.info(
+                f"⏳ MyGymBro is helping a lot of students right now - you're #{status['queue_position']} in line "
+                f"(waited {int(status['waited'])}s)"
+            )
+        else:
+            queue_placeholder.empty()
+    
+    def flag_api_key_error():
+        st.session_state["api_key_error"] = True
+    
+    # Registered under the session, so clearing the chat, logging out or leaving the page can cancel it
+    registry = get_cancellation_registry()
+    cancel_token = registry.open(st.session_state.get("instrumentation_session"))
+    try:
+        yield from stream_ai_answer(
+            question, st.session_state["language"], get_equipment_summary(), structured, history,
+            on_status=show_queue_status, on_auth_error=flag_api_key_error, cancel_token=cancel_token
+        )
+    finally:
+        registry.close(cancel_token)
 
-# Get user data from session state
-user_data = st.session_state.get("user_data", {}) or {}
+def cancel_abandoned_requests():
+    """Cancel any answer this session still has streaming (its upstream call stops if nobody shares it)."""
+    get_cancellation_registry().cancel_session(st.session_state.get("instrumentation_session"), "abandoned")
 
-# Main UI
-st.markdown(f'<h1 class="main-header">💪 {get_text("app_title")}</h1>', unsafe_allow_html=True)
+# Bump whenever the system prompts change so cached responses are not replayed for the old prompt
+SYSTEM_PROMPT_VERSION = "2025-10-1"
 
-# Welcome message with user's first name
-user_first_name = user_data.get("first_name", "there")
-st.markdown(f"""
-<div class="fitness-card">
-    <h3>🎓 Welcome, {user_first_name}!</h3>
-    <p>{get_text("subtitle")}</p>
-</div>
-""", unsafe_allow_html=True)
+def cached_ai_response_stream(question, language, structured, open_stream):
+    """Replay the answer from the response cache when the same prompt was answered before, else stream open_stream()."""
+    get_equipment_catalog().refresh()
+    cache = get_response_cache()
+    cache_key = cache.make_key(
+        question,
+        language,
+        f"{SYSTEM_PROMPT_VERSION}:structured" if structured else SYSTEM_PROMPT_VERSION,
+        get_equipment_catalog().fingerprint
+    )
+    cached_response = cache.get(cache_key)
+    metrics.RESPONSE_CACHE_LOOKUPS.labels("miss" if cached_response is None else "hit").inc()
+    if cached_response is not None:
+        yield cached_response
+        return
+    
+    chunks = []
+    failed = False
+    for chunk in open_stream():
+        # A failure after some content arrives as a later chunk, so check every one
+        failed = failed or is_error_chunk(chunk)
+        chunks.append(chunk)
+        yield chunk
+    
+    # Never cache an error message or an answer that was cut off by one
+    full_response = "".join(chunks)
+    if full_response and not failed:
+        cache.put(cache_key, full_response)
 
-# Sidebar
-with st.sidebar:
-    # User info section
-    if st.session_state.get("user_data"):
-        user_data = st.session_state["user_data"]
-        st.markdown("### 👤 User Profile")
-        st.markdown(f"**Name:** {user_data.get('first_name', '')} {user_data.get('last_name', '')}")
-        st.markdown(f"**Email:** {st.session_state['user_email']}")
-        st.markdown(f"**Fitness Level:** {user_data.get('fitness_level', 'Not specified')}")
+def get_cached_ai_response_stream(question, prompt_type, structured=False):
+    """Stream an AI response, replaying it from the response cache when the same prompt was answered before."""
+    return cached_ai_response_stream(
+        question, st.session_state["language"], structured,
+        lambda: get_ai_response_stream(question, prompt_type, structured)
+    )
+
+# Long plans (full weekly split, custom workouts) are generated as background jobs
+# so they survive reruns and page switches; the page polls them this often
+JOB_POLL_SECONDS = 1.5
+
+def submit_background_plan(title, prompt, display_content, cacheable):
+    """Queue a structured plan for generation; it is added to the chat when it finishes."""
+    language = st.session_state["language"]
+    equipment_info = get_equipment_summary()
+    # Sidebar prompts are built only from profile fields; other plans see the conversation so far
+    history = [] if cacheable else list(st.session_state["messages"])
+    
+    def open_stream():
+        return stream_ai_answer(prompt, language, equipment_info, True, history)
+    
+    def produce():
+        stream = cached_ai_response_stream(prompt, language, True, open_stream) if cacheable else open_stream()
+        for chunk in stream:
+            # Fail the job instead of delivering an error message as a plan
+            if is_error_chunk(chunk):
+                raise JobFailedError(chunk)
+            yield chunk
+    
+    try:
+        get_job_queue().submit(
+            st.session_state["user_email"], title, produce,
+            meta={"display": display_content, "prompt": prompt}
+        )
+    except JobLimitError as e:
+        st.session_state["job_notice"] = f"⏳ {e}. Please wait for one to finish before starting another."
+
+def deliver_background_plan(job):
+    """Add a finished job to the chat: the request, then the plan (or whatever part of it was generated)."""
+    meta = job["meta"]
+    user_message = {"role": "user", "content": meta["display"]}
+    if meta["prompt"] != meta["display"]:
+        user_message["prompt"] = meta["prompt"]
+    add_chat_message(user_message)
+    
+    raw_response = job["output"]
+    parser = IncrementalWorkoutParser()
+    parser.feed(raw_response)
+    # JobFailedError messages (from the AI call) are meant for the student; other errors are not
+    error = job["error"] if job["error"] and is_error_chunk(job["error"]) else None
+    # Failed or interrupted (e.g. the app restarted): never show the raw JSON fragment it left behind
+    content, workout_plan = build_structured_answer(parser, raw_response, error, finished=job["status"] == "done")
+    assistant_message = {"role": "assistant", "content": content}
+    if workout_plan is not None:
+        assistant_message["workout"] = workout_plan
+    else:
+        assistant_message["parsed"] = analyze_workout_text(content)
+    add_chat_message(assistant_message)
+
+@st.fragment(run_every=JOB_POLL_SECONDS)
+def background_jobs_panel():
+    """
+    Progress of the user's queued plans. Only called while the user has some;
+    once a plan is moved into the chat the full rerun redraws the chat and,
+    when nothing is left, stops the polling.
+    """
+    queue = get_job_queue()
+    jobs = queue.list_undelivered(st.session_state["user_email"])
+    delivered = False
+    for job in jobs:
+        if job["status"] not in ("queued", "running"):
+            claimed = queue.claim(job["job_id"])
+            if claimed is not None:
+                deliver_background_plan(claimed)
+                delivered = True
+    if delivered or not jobs:
+        st.rerun()
+    
+    st.markdown("#### ⏳ Plans in progress")
+    for job in jobs:
+        with st.container(border=True):
+            if job["status"] == "queued":
+                st.markdown(f"**{job['title']}** - waiting to start...")
+                continue
+            exercises = IncrementalWorkoutParser().feed(job["output"])
+            st.markdown(f"**{job['title']}** - writing ({int(time.time() - job['started_at'])}s)")
+            if exercises:
+                st.caption(f"{len(exercises)} exercises ready: " + ", ".join(str(e.get("name", "")) for e in exercises))
+
+# Independently rerunning UI sections. A widget inside a fragment only reruns its own
+# fragment; anything that changes the chat or the profile calls st.rerun() for a full run.
+@st.fragment
+def body_fat_estimator():
+    """Sidebar body-fat estimator. Runs as a fragment, so its radio and selectbox only rerun this panel."""
+    user_data = st.session_state.get("user_data", {}) or {}
+    with st.expander("📊 Visual Body Fat Percentage Estimator", expanded=False):
+        # Display current body fat if available
+        if 'body_fat_percentage' in user_data:
+            current_bf = user_data['body_fat_percentage']
+            category, color = get_body_fat_category(current_bf, user_data.get('gender', 'Male'))
+            
+            st.markdown(f"### Current Body Fat: {current_bf}%")
+            st.markdown(f"**Category:** <span style='color: {color}; font-weight: bold;'>{category}</span>", unsafe_allow_html=True)
+            
+            # Visual progress bar
+            if user_data.get('gender', 'Male').lower() in ['male', 'm']:
+                max_range = 32
+            else:
+                max_range = 38
+            
+            bf_progress = min(current_bf / max_range, 1.0)
+            st.progress(bf_progress)
+            
+            st.markdown("---")
         
-        # Display current weight and measurements
-        current_weight = user_data.get('weight_lbs', 'N/A')
-        if current_weight != 'N/A':
-            st.markdown(f"**Current Weight:** {current_weight} lbs")
+        st.markdown("### Estimate Your Body Fat Percentage")
+        st.markdown("*Compare yourself visually to the descriptions below, or enter an estimate directly*")
         
-        # Display muscle measurements if available
-        muscle_measurements = user_data.get('muscle_measurements', {})
-        if muscle_measurements:
-            st.markdown("**Muscle Measurements:**")
-            for muscle, measurement in muscle_measurements.items():
-                st.markdown(f"  - {muscle.replace('_', ' ').title()}: {measurement} inches")
+        user_gender = user_data.get('gender', 'Male')
         
-        st.markdown("---")
+        # Visual reference guide
+        if user_gender.lower() in ['male', 'm']:
+            st.markdown("#### 👨 Male Body Fat Reference Guide")
+            body_fat_ranges_male = {
+                "Essential Fat (3-5%)": {
+                    "range": (3, 5),
+                    "color": "#4CAF50",
+                    "description": "✅ Athletes at peak condition. Very defined muscle separation, vascularity visible. Minimal fat."
+                },
+                "Athletes (6-13%)": {
+                    "range": (6, 13),
+                    "color": "#8BC34A",
+                    "description": "✅ Excellent condition. Visible abs, good muscle definition. Low body fat."
+                },
+                "Fitness (14-17%)": {
+                    "range": (14, 17),
+                    "color": "#CDDC39",
+                    "description": "✅ Good shape. Some abs visible, slight fat layer. Athletic build."
+                },
+                "Average (18-24%)": {
+                    "range": (18, 24),
+                    "color": "#FFC107",
+                    "description": "⚠️ Normal range. Some fat, less muscle definition. Abs may not be visible."
+                },
+                "Obese (25-31%)": {
+                    "range": (25, 31),
+                    "color": "#FF9800",
+                    "description": "❌ Higher body fat. Noticeable fat deposits, less muscle definition."
+                },
+                "Very High (32%+)": {
+                    "range": (32, 50),
+                    "color": "#F44336",
+                    "description": "❌ High body fat. Significant fat deposits, minimal muscle visibility."
+                }
+            }
+        else:
+            st.markdown("#### 👩 Female Body Fat Reference Guide")
+            body_fat_ranges_male = {
+                "Essential Fat (10-13%)": {
+                    "range": (10, 13),
+                    "color": "#4CAF50",
+                    "description": "✅ Athletes at peak condition. Very defined muscles, minimal fat."
+                },
+                "Athletes (14-20%)": {
+                    "range": (14, 20),
+                    "color": "#8BC34A",
+                    "description": "✅ Excellent condition. Visible muscle definition, low body fat."
+                },
+                "Fitness (21-24%)": {
+                    "range": (21, 24),
+                    "color": "#CDDC39",
+                    "description": "✅ Good shape. Some muscle definition, slight fat layer."
+                },
+                "Average (25-31%)": {
+                    "range": (25, 31),
+                    "color": "#FFC107",
+                    "description": "⚠️ Normal range. Moderate fat, less muscle definition."
+                },
+                "Obese (32-37%)": {
+                    "range": (32, 37),
+                    "color": "#FF9800",
+                    "description": "❌ Higher body fat. Noticeable fat deposits."
+                },
+                "Very High (38%+)": {
+                    "range": (38, 50),
+                    "color": "#F44336",
+                    "description": "❌ High body fat. Significant fat deposits."
+                }
+            }
         
-        # Update Weight and Measurements Button - Navigate to update profile page
-        if st.button("📏 Update Weight & Measurements", use_container_width=True):
-            st.switch_page("pages/4_update_profile.py")
+        # Display reference guide
+        for category_name, info in body_fat_ranges_male.items():
+            low, high = info["range"]
+            st.markdown(
+                f"""
+                <div style='
+                    background: {info["color"]}20;
+                    border-left: 4px solid {info["color"]};
+                    padding: 10px;
+                    margin: 10px 0;
+                    border-radius: 5px;
+                '>
+                    <strong style='color: {info["color"]};'>{category_name} ({low}-{high}%)</strong><br/>
+                    <small>{info["description"]}</small>
+                </div>
+                """,
+                unsafe_allow_html=True
+            )
         
-        # Visual Body Fat Percentage Estimator Section
         st.markdown("---")
-        with st.expander("📊 Visual Body Fat Percentage Estimator", expanded=False):
-            # Display current body fat if available
-            if 'body_fat_percentage' in user_data:
-                current_bf = user_data['body_fat_percentage']
-                category, color = get_body_fat_category(current_bf, user_data.get('gender', 'Male'))
-                
-                st.markdown(f"### Current Body Fat: {current_bf}%")
-                st.markdown(f"**Category:** <span style='color: {color}; font-weight: bold;'>{category}</span>", unsafe_allow_html=True)
-                
-                # Visual progress bar
-                if user_data.get('gender', 'Male').lower() in ['male', 'm']:
-                    max_range = 32
-                else:
-                    max_range = 38
-                
-                bf_progress = min(current_bf / max_range, 1.0)
-                st.progress(bf_progress)
-                
-                st.markdown("---")
-            
-            st.markdown("### Estimate Your Body Fat Percentage")
-            st.markdown("*Compare yourself visually to the descriptions below, or enter an estimate directly*")
-            
-            user_gender = user_data.get('gender', 'Male')
-            
-            # Visual reference guide
-            if user_gender.lower() in ['male', 'm']:
-                st.markdown("#### 👨 Male Body Fat Reference Guide")
-                body_fat_ranges_male = {
-                    "Essential Fat (3-5%)": {
-                        "range": (3, 5),
-                        "color": "#4CAF50",
-                        "description": "✅ Athletes at peak condition. Very defined muscle separation, vascularity visible. Minimal fat."
-                    },
-                    "Athletes (6-13%)": {
-                        "range": (6, 13),
-                        "color": "#8BC34A",
-                        "description": "✅ Excellent condition. Visible abs, good muscle definition. Low body fat."
-                    },
-                    "Fitness (14-17%)": {
-                        "range": (14, 17),
-                        "color": "#CDDC39",
-                        "description": "✅ Good shape. Some abs visible, slight fat layer. Athletic build."
-                    },
-                    "Average (18-24%)": {
-                        "range": (18, 24),
-                        "color": "#FFC107",
-                        "description": "⚠️ Normal range. Some fat, less muscle definition. Abs may not be visible."
-                    },
-                    "Obese (25-31%)": {
-                        "range": (25, 31),
-                        "color": "#FF9800",
-                        "description": "❌ Higher body fat. Noticeable fat deposits, less muscle definition."
-                    },
-                    "Very High (32%+)": {
-                        "range": (32, 50),
-                        "color": "#F44336",
-                        "description": "❌ High body fat. Significant fat deposits, minimal muscle visibility."
-                    }
+        
+        estimation_method = st.radio(
+            "Estimation Method:",
+            ["Select from Visual Categories", "Enter Percentage Directly"],
+            key="bf_est_method"
+        )
+        
+        # Helper function to display visual chart
+        def display_body_fat_chart(body_fat, gender, category, color):
+            """Display visual body fat percentage chart."""
+            if gender.lower() in ['male', 'm']:
+                max_range = 32
+                categories_display = {
+                    "Essential Fat": (0, 6, "#4CAF50"),
+                    "Athletes": (6, 14, "#8BC34A"),
+                    "Fitness": (14, 18, "#CDDC39"),
+                    "Average": (18, 25, "#FFC107"),
+                    "Obese": (25, 32, "#FF9800"),
+                    "Very High": (32, 100, "#F44336")
                 }
             else:
-                st.markdown("#### 👩 Female Body Fat Reference Guide")
-                body_fat_ranges_male = {
-                    "Essential Fat (10-13%)": {
-                        "range": (10, 13),
-                        "color": "#4CAF50",
-                        "description": "✅ Athletes at peak condition. Very defined muscles, minimal fat."
-                    },
-                    "Athletes (14-20%)": {
-                        "range": (14, 20),
-                        "color": "#8BC34A",
-                        "description": "✅ Excellent condition. Visible muscle definition, low body fat."
-                    },
-                    "Fitness (21-24%)": {
-                        "range": (21, 24),
-                        "color": "#CDDC39",
-                        "description": "✅ Good shape. Some muscle definition, slight fat layer."
-                    },
-                    "Average (25-31%)": {
-                        "range": (25, 31),
-                        "color": "#FFC107",
-                        "description": "⚠️ Normal range. Moderate fat, less muscle definition."
-                    },
-                    "Obese (32-37%)": {
-                        "range": (32, 37),
-                        "color": "#FF9800",
-                        "description": "❌ Higher body fat. Noticeable fat deposits."
-                    },
-                    "Very High (38%+)": {
-                        "range": (38, 50),
-                        "color": "#F44336",
-                        "description": "❌ High body fat. Significant fat deposits."
-                    }
+                max_range = 38
+                categories_display = {
+                    "Essential Fat": (0, 14, "#4CAF50"),
+                    "Athletes": (14, 21, "#8BC34A"),
+                    "Fitness": (21, 25, "#CDDC39"),
+                    "Average": (25, 32, "#FFC107"),
+                    "Obese": (32, 38, "#FF9800"),
+                    "Very High": (38, 100, "#F44336")
                 }
             
-            # Display reference guide
-            for category_name, info in body_fat_ranges_male.items():
-                low, high = info["range"]
-                st.markdown(
-                    f"""
+            # Visual bar chart - HTML/CSS based
+            html_chart = f"""
+            <div style='margin: 20px 0;'>
+                <div style='position: relative; height: 80px; background: #f0f0f0; border-radius: 10px; overflow: hidden; border: 2px solid #ddd;'>
+            """
+            
+            x_pos = 0
+            for cat_name, (low, high, cat_color) in categories_display.items():
+                width = high - low
+                width_percent = (width / max_range) * 100
+                left_percent = (x_pos / max_range) * 100
+                
+                is_current = body_fat >= low and body_fat < high
+                opacity = 1.0 if is_current else 0.5
+                
+                html_chart += f"""
                     <div style='
-                        background: {info["color"]}20;
-                        border-left: 4px solid {info["color"]};
-                        padding: 10px;
-                        margin: 10px 0;
-                        border-radius: 5px;
+                        position: absolute;
+                        left: {left_percent}%;
+                        width: {width_percent}%;
+                        height: 100%;
+                        background: {cat_color};
+                        opacity: {opacity};
+                        border-right: 2px solid rgba(0,0,0,0.1);
+                        display: flex;
+                        align-items: center;
+                        justify-content: center;
+                        text-align: center;
+                        font-size: 10px;
+                        font-weight: bold;
+                        color: {'white' if is_current else '#333'};
                     '>
-                        <strong style='color: {info["color"]};'>{category_name} ({low}-{high}%)</strong><br/>
-                        <small>{info["description"]}</small>
+                        <div style='padding: 5px;'>
+                            {cat_name}<br/>
+                            <small>({low}-{high}%)</small>
+                        </div>
                     </div>
-                    """,
-                    unsafe_allow_html=True
-                )
-            
-            st.markdown("---")
+                """
+                x_pos += width
             
-            estimation_method = st.radio(
-                "Estimation Method:",
-                ["Select from Visual Categories", "Enter Percentage Directly"],
-                key="bf_est_method"
-            )
+            # Mark current position
+            marker_position = (body_fat / max_range) * 100
+            html_chart += f"""
+                    <div style='
+                        position: absolute;
+                        left: {marker_position}%;
+                        top: 50%;
+                        transform: translate(-50%, -50%);
+                        width: 20px;
+                        height: 20px;
+                        background: white;
+                        border: 3px solid #000;
+                        border-radius: 50%;
+                        z-index: 10;
+                        box-shadow: 0 2px 4px rgba(0,0,0,0.3);
+                    '></div>
+                </div>
+                <div style='text-align: center; margin-top: 10px; font-weight: bold; color: #666;'>
+                    Body Fat Percentage: <span style='color: {color}; font-size: 1.2em;'>{body_fat}%</span>
+                </div>
+            </div>
+            """
             
-            # Helper function to display visual chart
-            def display_body_fat_chart(body_fat, gender, category, color):
-                """Display visual body fat percentage chart."""
-                if gender.lower() in ['male', 'm']:
-                    max_range = 32
-                    categories_display = {
-                        "Essential Fat": (0, 6, "#4CAF50"),
-                        "Athletes": (6, 14, "#8BC34A"),
-                        "Fitness": (14, 18, "#CDDC39"),
-                        "Average": (18, 25, "#FFC107"),
-                        "Obese": (25, 32, "#FF9800"),
-                        "Very High": (32, 100, "#F44336")
-                    }
+            st.markdown(html_chart, unsafe_allow_html=True)
+        
+        if estimation_method == "Select from Visual Categories":
+            with st.form("body_fat_category_form"):
+                st.info("💡 Look at the reference guide above and select the category that best matches your current body appearance.")
+                
+                # Create category options based on gender
+                if user_gender.lower() in ['male', 'm']:
+                    category_options = [
+                        "Essential Fat (3-5%)",
+                        "Athletes (6-13%)",
+                        "Fitness (14-17%)",
+                        "Average (18-24%)",
+                        "Obese (25-31%)",
+                        "Very High (32%+)"
+                    ]
+                    default_index = 3  # Average
                 else:
-                    max_range = 38
-                    categories_display = {
-                        "Essential Fat": (0, 14, "#4CAF50"),
-                        "Athletes": (14, 21, "#8BC34A"),
-                        "Fitness": (21, 25, "#CDDC39"),
-                        "Average": (25, 32, "#FFC107"),
-                        "Obese": (32, 38, "#FF9800"),
-                        "Very High": (38, 100, "#F44336")
-                    }
+                    category_options = [
+                        "Essential Fat (10-13%)",
+                        "Athletes (14-20%)",
+                        "Fitness (21-24%)",
+                        "Average (25-31%)",
+                        "Obese (32-37%)",
+                        "Very High (38%+)"
+                    ]
+                    default_index = 3  # Average
                 
-                # Visual bar chart - HTML/CSS based
-                html_chart = f"""
-                <div style='margin: 20px 0;'>
-                    <div style='position: relative; height: 80px; background: #f0f0f0; border-radius: 10px; overflow: hidden; border: 2px solid #ddd;'>
-                """
+                # Pre-select current category if available
+                current_bf = user_data.get('body_fat_percentage')
+                if current_bf:
+                    for i, option in enumerate(category_options):
+                        # Extract range from option
+                        if user_gender.lower() in ['male', 'm']:
+                            ranges = [(3, 5), (6, 13), (14, 17), (18, 24), (25, 31), (32, 50)]
+                        else:
+                            ranges = [(10, 13), (14, 20), (21, 24), (25, 31), (32, 37), (38, 50)]
+                        
+                        low, high = ranges[i]
+                        if low <= current_bf <= high:
+                            default_index = i
+                            break
                 
-                x_pos = 0
-                for cat_name, (low, high, cat_color) in categories_display.items():
-                    width = high - low
-                    width_percent = (width / max_range) * 100
-                    left_percent = (x_pos / max_range) * 100
-                    
-                    is_current = body_fat >= low and body_fat < high
-                    opacity = 1.0 if is_current else 0.5
-                    
-                    html_chart += f"""
-                        <div style='
-                            position: absolute;
-                            left: {left_percent}%;
-                            width: {width_percent}%;
-                            height: 100%;
-                            background: {cat_color};
-                            opacity: {opacity};
-                            border-right: 2px solid rgba(0,0,0,0.1);
-                            display: flex;
-                            align-items: center;
-                            justify-content: center;
-                            text-align: center;
-                            font-size: 10px;
-                            font-weight: bold;
-                            color: {'white' if is_current else '#333'};
-                        '>
-                            <div style='padding: 5px;'>
-                                {cat_name}<br/>
-                                <small>({low}-{high}%)</small>
-                            </div>
-                        </div>
-                    """
-                    x_pos += width
+                selected_category = st.selectbox(
+                    "Select your body fat category:",
+                    category_options,
+                    index=default_index,
+                    key="bf_category_select"
+                )
                 
-                # Mark current position
-                marker_position = (body_fat / max_range) * 100
-                html_chart += f"""
-                        <div style='
-                            position: absolute;
-                            left: {marker_position}%;
-                            top: 50%;
-                            transform: translate(-50%, -50%);
-                            width: 20px;
-                            height: 20px;
-                            background: white;
-                            border: 3px solid #000;
-                            border-radius: 50%;
-                            z-index: 10;
-                            box-shadow: 0 2px 4px rgba(0,0,0,0.3);
-                        '></div>
-                    </div>
-                    <div style='text-align: center; margin-top: 10px; font-weight: bold; color: #666;'>
-                        Body Fat Percentage: <span style='color: {color}; font-size: 1.2em;'>{body_fat}%</span>
-                    </div>
-                </div>
-                """
+                estimate_button = st.form_submit_button("💾 Save Visual Estimate", use_container_width=True)
                 
-                st.markdown(html_chart, unsafe_allow_html=True)
-            
-            if estimation_method == "Select from Visual Categories":
-                with st.form("body_fat_category_form"):
-                    st.info("💡 Look at the reference guide above and select the category that best matches your current body appearance.")
-                    
-                    # Create category options based on gender
+                if estimate_button:
+                    # Extract body fat percentage from selected category
                     if user_gender.lower() in ['male', 'm']:
-                        category_options = [
-                            "Essential Fat (3-5%)",
-                            "Athletes (6-13%)",
-                            "Fitness (14-17%)",
-                            "Average (18-24%)",
-                            "Obese (25-31%)",
-                            "Very High (32%+)"
-                        ]
-                        default_index = 3  # Average
+                        category_to_range = {
+                            "Essential Fat (3-5%)": (3, 5),
+                            "Athletes (6-13%)": (6, 13),
+                            "Fitness (14-17%)": (14, 17),
+                            "Average (18-24%)": (18, 24),
+                            "Obese (25-31%)": (25, 31),
+                            "Very High (32%+)": (32, 50)
+                        }
                     else:
-                        category_options = [
-                            "Essential Fat (10-13%)",
-                            "Athletes (14-20%)",
-                            "Fitness (21-24%)",
-                            "Average (25-31%)",
-                            "Obese (32-37%)",
-                            "Very High (38%+)"
-                        ]
-                        default_index = 3  # Average
-                    
-                    # Pre-select current category if available
-                    current_bf = user_data.get('body_fat_percentage')
-                    if current_bf:
-                        for i, option in enumerate(category_options):
-                            # Extract range from option
-                            if user_gender.lower() in ['male', 'm']:
-                                ranges = [(3, 5), (6, 13), (14, 17), (18, 24), (25, 31), (32, 50)]
-                            else:
-                                ranges = [(10, 13), (14, 20), (21, 24), (25, 31), (32, 37), (38, 50)]
-                            
-                            low, high = ranges[i]
-                            if low <= current_bf <= high:
-                                default_index = i
-                                break
-                    
-                    selected_category = st.selectbox(
-                        "Select your body fat category:",
-                        category_options,
-                        index=default_index,
-                        key="bf_category_select"
-                    )
+                        category_to_range = {
+                            "Essential Fat (10-13%)": (10, 13),
+                            "Athletes (14-20%)": (14, 20),
+                            "Fitness (21-24%)": (21, 24),
+                            "Average (25-31%)": (25, 31),
+                            "Obese (32-37%)": (32, 37),
+                            "Very High (38%+)": (38, 50)
+                        }
                     
-                    estimate_button = st.form_submit_button("💾 Save Visual Estimate", use_container_width=True)
+                    low, high = category_to_range[selected_category]
+                    # Use middle of the range as estimate
+                    body_fat = round((low + high) / 2, 1)
+                    category, color = get_body_fat_category(body_fat, user_gender)
                     
-                    if estimate_button:
-                        # Extract body fat percentage from selected category
-                        if user_gender.lower() in ['male', 'm']:
-                            category_to_range = {
-                                "Essential Fat (3-5%)": (3, 5),
-                                "Athletes (6-13%)": (6, 13),
-                                "Fitness (14-17%)": (14, 17),
-                                "Average (18-24%)": (18, 24),
-                                "Obese (25-31%)": (25, 31),
-                                "Very High (32%+)": (32, 50)
-                            }
-                        else:
-                            category_to_range = {
-                                "Essential Fat (10-13%)": (10, 13),
-                                "Athletes (14-20%)": (14, 20),
-                                "Fitness (21-24%)": (21, 24),
-                                "Average (25-31%)": (25, 31),
-                                "Obese (32-37%)": (32, 37),
-                                "Very High (38%+)": (38, 50)
-                            }
+                    # Save to user profile
+                    updated_data = {'body_fat_percentage': body_fat}
+                    if update_user_profile(st.session_state['user_email'], updated_data):
+                        st.success(f"✅ Body Fat Percentage estimated: **{body_fat}%**")
+                        st.markdown(f"**Category:** <span style='color: {color}; font-weight: bold;'>{category}</span>", unsafe_allow_html=True)
                         
-                        low, high = category_to_range[selected_category]
-                        # Use middle of the range as estimate
-                        body_fat = round((low + high) / 2, 1)
-                        category, color = get_body_fat_category(body_fat, user_gender)
+                        # Display visual chart
+                        display_body_fat_chart(body_fat, user_gender, category, color)
                         
-                        # Save to user profile
-                        updated_data = {'body_fat_percentage': body_fat}
-                        if update_user_profile(st.session_state['user_email'], updated_data):
-                            st.success(f"✅ Body Fat Percentage estimated: **{body_fat}%**")
-                            st.markdown(f"**Category:** <span style='color: {color}; font-weight: bold;'>{category}</span>", unsafe_allow_html=True)
-                            
-                            # Display visual chart
-                            display_body_fat_chart(body_fat, user_gender, category, color)
-                            
-                            st.rerun()
-                        else:
-                            st.error("❌ Failed to save estimate. Please try again.")
-            
-            else:  # Enter Percentage Directly
-                with st.form("body_fat_direct_form"):
-                    st.info("💡 Enter your estimated body fat percentage directly (based on visual appearance or previous measurements).")
-                    
-                    # Get current body fat or default
-                    current_bf = user_data.get('body_fat_percentage', 20.0)
-                    
-                    body_fat_input = st.number_input(
-                        "Body Fat Percentage (%)",
-                        min_value=3.0,
-                        max_value=50.0,
-                        value=float(current_bf),
-                        step=0.1,
-                        help="Enter your estimated body fat percentage (3-50%)",
-                        key="bf_direct_input"
-                    )
-                    
-                    estimate_button = st.form_submit_button("💾 Save Estimate", use_container_width=True)
+                        st.rerun()
+                    else:
+                        st.error("❌ Failed to save estimate. Please try again.")
+        
+        else:  # Enter Percentage Directly
+            with st.form("body_fat_direct_form"):
+                st.info("💡 Enter your estimated body fat percentage directly (based on visual appearance or previous measurements).")
+                
+                # Get current body fat or default
+                current_bf = user_data.get('body_fat_percentage', 20.0)
+                
+                body_fat_input = st.number_input(
+                    "Body Fat Percentage (%)",
+                    min_value=3.0,
+                    max_value=50.0,
+                    value=float(current_bf),
+                    step=0.1,
+                    help="Enter your estimated body fat percentage (3-50%)",
+                    key="bf_direct_input"
+                )
+                
+                estimate_button = st.form_submit_button("💾 Save Estimate", use_container_width=True)
+                
+                if estimate_button:
+                    body_fat = round(body_fat_input, 1)
+                    category, color = get_body_fat_category(body_fat, user_gender)
                     
-                    if estimate_button:
-                        body_fat = round(body_fat_input, 1)
-                        category, color = get_body_fat_category(body_fat, user_gender)
+                    # Save to user profile
+                    updated_data = {'body_fat_percentage': body_fat}
+                    if update_user_profile(st.session_state['user_email'], updated_data):
+                        st.success(f"✅ Body Fat Percentage saved: **{body_fat}%**")
+                        st.markdown(f"**Category:** <span style='color: {color}; font-weight: bold;'>{category}</span>", unsafe_allow_html=True)
                         
-                        # Save to user profile
-                        updated_data = {'body_fat_percentage': body_fat}
-                        if update_user_profile(st.session_state['user_email'], updated_data):
-                            st.success(f"✅ Body Fat Percentage saved: **{body_fat}%**")
-                            st.markdown(f"**Category:** <span style='color: {color}; font-weight: bold;'>{category}</span>", unsafe_allow_html=True)
-                            
-                            # Display visual chart
-                            display_body_fat_chart(body_fat, user_gender, category, color)
-                            
-                            st.rerun()
-                        else:
-                            st.error("❌ Failed to save estimate. Please try again.")
-        
-        st.markdown("---")
-    
-    st.markdown("### 🎛️ Settings")
-    
-    # Language selector
-    language_options = ["English", "French", "Korean", "Mandarin", "Spanish"]
-    selected_language = st.selectbox(
-        f"🌍 {get_text('select_language')}",
-        language_options,
-        index=language_options.index(st.session_state["language"])
-    )
-    
-    # Update language if changed
-    if selected_language != st.session_state["language"]:
-        st.session_state["language"] = selected_language
-        st.rerun()
-    
-    # Clear history button
-    if st.button("🗑️ Clear Chat History", use_container_width=True):
-        st.session_state["messages"] = []
-        st.rerun()
-    
-    st.markdown("---")
-    
-    # Logout button
-    if st.button("🚪 Logout", use_container_width=True):
-        logout_user()
-    
-    st.markdown("---")
-    
-    # Set default prompt mode (controlled from backend)
-    selected_prompt = "Basic Mode"  # Default mode, can be changed in backend
-    
+                        # Display visual chart
+                        display_body_fat_chart(body_fat, user_gender, category, color)
+                        
+                        st.rerun()
+                    else:
+                        st.error("❌ Failed to save estimate. Please try again.")
+
+@st.fragment
+def workout_plan_buttons():
+    """Sidebar workout plan and tool buttons, isolated from the chat pane."""
     # Get additional user data for workout generation
+    user_data = st.session_state.get("user_data", {}) or {}
     age = user_data.get("age", 20)
     gender = user_data.get("gender", "Male")
     fitness_level = user_data.get("fitness_level", "Average")
@@ -1356,7 +1542,10 @@ with st.sidebar:
         
         if st.button("📅 Full Weekly Split", use_container_width=True):
             sports_info = f" and participate in {', '.join(sports_activities)}" if sports_activities else " and don't participate in any specific sports"
-            st.session_state["pre_filled_question"] = f"Create a complete weekly workout split for me using the available gym equipment. I'm a {age}-year-old {gender.lower()}, {fitness_level.lower()} fitness level, exercise {exercise_frequency.lower()}{sports_info}. Plan out each day of the week with specific exercises, sets, reps, and rest days. Make it a balanced program that targets all muscle groups throughout the week."
+            question = f"Create a complete weekly workout split for me using the available gym equipment. I'm a {age}-year-old {gender.lower()}, {fitness_level.lower()} fitness level, exercise {exercise_frequency.lower()}{sports_info}. Plan out each day of the week with specific exercises, sets, reps, and rest days. Make it a balanced program that targets all muscle groups throughout the week."
+            # Long plan: generated in the background, shown in the chat when finished
+            submit_background_plan("📅 Full Weekly Split", question, question, cacheable=True)
+            metrics.CHAT_MESSAGES.labels("sidebar").inc()
             st.rerun()
         
         if st.button("⚡ Quick 30-min Workout", use_container_width=True):
@@ -1459,7 +1648,200 @@ with st.sidebar:
     
     if st.button("💬 Ask MyGymBro anything", use_container_width=True):
         st.session_state["pre_filled_question"] = "I have a question about my fitness routine or nutrition. Please help me with personalized advice based on my information."
+        st.session_state["pre_filled_is_chat"] = True  # Conversational answer, not a workout plan
+        st.rerun()
+
+@st.fragment
+def calorie_results_panel():
+    """Maintenance calorie results with goal selection and macros."""
+    if st.session_state.get("show_results", False) and st.session_state.get("calorie_results"):
+        results = st.session_state["calorie_results"]
+        
+        # Display results
+        st.markdown("### 📊 " + get_text("maintenance_calories"))
+        
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.metric(get_text("bmr"), f"{results['bmr']} kcal")
+        with col2:
+            st.metric(get_text("activity_metabolism"), f"{results['activity_metabolism']} kcal")
+        with col3:
+            st.metric(get_text("total_metabolism"), f"{results['total_metabolism']} kcal")
+        
+        # Goal selection
+        st.markdown("### 🎯 " + get_text("daily_intake"))
+        goal = st.radio("Select your goal:", ["weight_loss", "weight_maintenance", "bulk_up"], 
+                       format_func=lambda x: get_text(x), key="goal_selection")
+        
+        # Calculate macros based on selected goal
+        macros = calculate_macros(results['total_metabolism'], goal)
+        
+        st.markdown(f"**{get_text('target_calories')}:** {macros['calories']} kcal")
+        
+        # Macronutrients
+        st.markdown("### 🥗 " + get_text("macros"))
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.metric(get_text("carbs"), f"{macros['carbs']}g")
+        with col2:
+            st.metric(get_text("protein"), f"{macros['protein']}g")
+        with col3:
+            st.metric(get_text("fat"), f"{macros['fat']}g")
+        
+        # Heart rate range
+        min_hr, max_hr = calculate_heart_rate_range(results['age'], results['fitness_level'])
+        st.markdown("### ❤️ " + get_text("cardio_intensity"))
+        st.markdown(f"**{get_text('heart_rate_range')}:** {min_hr} - {max_hr} {get_text('bpm')}")
+        st.info("💡 This is the optimal heart rate range for fat burning during cardio!")
+        
+        # Close results button
+        if st.button("❌ Close Results", key="close_results"):
+            st.session_state["show_results"] = False
+            st.session_state["calorie_results"] = None
+            st.rerun(scope="fragment")
+
+def timing_rows(phases):
+    """Table rows for a {phase: histogram dict} mapping, slowest total first."""
+    rows = [
+        {"phase": phase, "count": h["count"], "p50 ms": h["p50_ms"], "p95 ms": h["p95_ms"],
+         "p99 ms": h["p99_ms"], "max ms": h["max_ms"], "total ms": h["total_ms"]}
+        for phase, h in phases.items()
+    ]
+    return sorted(rows, key=lambda row: row["total ms"], reverse=True)
+
+@st.fragment
+def instrumentation_panel():
+    """Hidden admin panel with rerun phase timings (INSTRUMENTATION=1 and an INSTRUMENTATION_ADMINS email)."""
+    instrumentation = get_instrumentation()
+    with st.expander("⏱️ Rerun Timings (admin)", expanded=False):
+        if st.button("🔄 Refresh", key="timings_refresh", use_container_width=True):
+            st.rerun(scope="fragment")
+        snapshot = instrumentation.snapshot()
+
+        session_id = st.session_state.get("instrumentation_session")
+        session = snapshot["sessions"].get(session_id)
+        if session:
+            st.markdown(f"**This session** ({session['reruns']} reruns)")
+            st.dataframe(timing_rows(session["phases"]), hide_index=True, use_container_width=True)
+
+        for page, phases in sorted(snapshot["pages"].items()):
+            st.markdown(f"**Page: {page}**")
+            st.dataframe(timing_rows(phases), hide_index=True, use_container_width=True)
+        st.caption(f"{len(snapshot['sessions'])} sessions tracked")
+
+        st.download_button(
+            "💾 Download JSON",
+            json.dumps(snapshot, indent=2),
+            file_name="mygymbro_timings.json",
+            mime="application/json",
+            key="timings_download",
+            use_container_width=True
+        )
+        if st.button("🗑️ Reset Timings", key="timings_reset", use_container_width=True):
+            instrumentation.reset()
+            st.rerun(scope="fragment")
+
+# Check authentication
+check_authentication()
+
+# Bring back the latest saved conversation after a login or refresh
+restore_chat_transcript()
+
+# Get user data from session state
+user_data = st.session_state.get("user_data", {}) or {}
+
+# Main UI
+st.markdown(f'<h1 class="main-header">💪 {get_text("app_title")}</h1>', unsafe_allow_html=True)
+
+# Welcome message with user's first name
+user_first_name = user_data.get("first_name", "there")
+st.markdown(f"""
+<div class="fitness-card">
+    <h3>🎓 Welcome, {user_first_name}!</h3>
+    <p>{get_text("subtitle")}</p>
+</div>
+""", unsafe_allow_html=True)
+
+# Sidebar
+with st.sidebar:
+    # User info section
+    if st.session_state.get("user_data"):
+        user_data = st.session_state["user_data"]
+        st.markdown("### 👤 User Profile")
+        st.markdown(f"**Name:** {user_data.get('first_name', '')} {user_data.get('last_name', '')}")
+        st.markdown(f"**Email:** {st.session_state['user_email']}")
+        st.markdown(f"**Fitness Level:** {user_data.get('fitness_level', 'Not specified')}")
+        
+        # Display current weight and measurements
+        current_weight = user_data.get('weight_lbs', 'N/A')
+        if current_weight != 'N/A':
+            st.markdown(f"**Current Weight:** {current_weight} lbs")
+        
+        # Display muscle measurements if available
+        muscle_measurements = user_data.get('muscle_measurements', {})
+        if muscle_measurements:
+            st.markdown("**Muscle Measurements:**")
+            for muscle, measurement in muscle_measurements.items():
+                st.markdown(f"  - {muscle.replace('_', ' ').title()}: {measurement} inches")
+        
+        st.markdown("---")
+        
+        # Update Weight and Measurements Button - Navigate to update profile page
+        if st.button("📏 Update Weight & Measurements", use_container_width=True):
+            st.switch_page("pages/4_update_profile.py")
+        
+        # Visual Body Fat Percentage Estimator Section
+        st.markdown("---")
+        body_fat_estimator()
+        
+        st.markdown("---")
+    
+    st.markdown("### 🎛️ Settings")
+    
+    # Language selector
+    language_options = ["English", "French", "Korean", "Mandarin", "Spanish"]
+    selected_language = st.selectbox(
+        f"🌍 {get_text('select_language')}",
+        language_options,
+        index=language_options.index(st.session_state["language"])
+    )
+    
+    # Update language if changed
+    if selected_language != st.session_state["language"]:
+        st.session_state["language"] = selected_language
         st.rerun()
+    
+    # Clear history button
+    if st.button("🗑️ Clear Chat History", use_container_width=True):
+        st.session_state["messages"] = []
+        st.session_state.pop("chat_history_shown", None)
+        st.session_state["transcript_start"] = 0
+        get_transcript_store().clear(st.session_state["user_email"])
+        st.rerun()
+    
+    st.markdown("---")
+    
+    # Logout button
+    if st.button("🚪 Logout", use_container_width=True):
+        logout_user()
+
+    st.markdown("---")
+
+    # Timing panel, only for admins while instrumentation is on
+    if instrumentation_enabled() and is_instrumentation_admin(st.session_state.get("user_email")):
+        instrumentation_panel()
+        st.markdown("---")
+
+    # Set default prompt mode (controlled from backend)
+    selected_prompt = "Basic Mode"  # Default mode, can be changed in backend
+    
+    # Workout plan and tool buttons (fragment: only a click that queues a prompt reruns the app)
+    workout_plan_buttons()
+
+# A full rerun interrupted any answer the previous run was streaming (e.g. Clear Chat or Logout was
+# clicked mid-answer). Streamlit normally closes that stream before this run starts, which cancels
+# it as "abandoned"; this catches one that is still open. Jobs are not registered, so they keep going.
+cancel_abandoned_requests()
 
 # Get additional user data for workout generation (for use in main area if needed)
 user_data = st.session_state.get("user_data", {}) or {}
@@ -1501,77 +1883,19 @@ if st.session_state.get("show_calorie_calculation", False):
     st.session_state["show_results"] = True
     st.session_state["show_calorie_calculation"] = False
 
-# Show results section
-if st.session_state.get("show_results", False) and st.session_state.get("calorie_results"):
-    results = st.session_state["calorie_results"]
-    
-    # Display results
-    st.markdown("### 📊 " + get_text("maintenance_calories"))
-    
-    col1, col2, col3 = st.columns(3)
-    with col1:
-        st.metric(get_text("bmr"), f"{results['bmr']} kcal")
-    with col2:
-        st.metric(get_text("activity_metabolism"), f"{results['activity_metabolism']} kcal")
-    with col3:
-        st.metric(get_text("total_metabolism"), f"{results['total_metabolism']} kcal")
-    
-    # Goal selection
-    st.markdown("### 🎯 " + get_text("daily_intake"))
-    goal = st.radio("Select your goal:", ["weight_loss", "weight_maintenance", "bulk_up"], 
-                   format_func=lambda x: get_text(x), key="goal_selection")
-    
-    # Calculate macros based on selected goal
-    macros = calculate_macros(results['total_metabolism'], goal)
-    
-    st.markdown(f"**{get_text('target_calories')}:** {macros['calories']} kcal")
-    
-    # Macronutrients
-    st.markdown("### 🥗 " + get_text("macros"))
-    col1, col2, col3 = st.columns(3)
-    with col1:
-        st.metric(get_text("carbs"), f"{macros['carbs']}g")
-    with col2:
-        st.metric(get_text("protein"), f"{macros['protein']}g")
-    with col3:
-        st.metric(get_text("fat"), f"{macros['fat']}g")
-    
-    # Heart rate range
-    min_hr, max_hr = calculate_heart_rate_range(results['age'], results['fitness_level'])
-    st.markdown("### ❤️ " + get_text("cardio_intensity"))
-    st.markdown(f"**{get_text('heart_rate_range')}:** {min_hr} - {max_hr} {get_text('bpm')}")
-    st.info("💡 This is the optimal heart rate range for fat burning during cardio!")
-    
-    # Close results button
-    if st.button("❌ Close Results", key="close_results"):
-        st.session_state["show_results"] = False
-        st.session_state["calorie_results"] = None
-        st.rerun()
+# Show results section (fragment: changing the goal only reruns this panel)
+calorie_results_panel()
 
 st.markdown("---")
 
-# Display chat messages
-for message in st.session_state["messages"]:
-    with st.chat_message(message["role"]):
-        # Check if this is an assistant message that might contain a workout
-        if message["role"] == "assistant":
-            content = message["content"]
-            # Check if content looks like a workout (contains exercise-related keywords)
-            workout_keywords = ['workout', 'exercise', 'routine', 'sets', 'reps', 'squat', 'press', 'deadlift', 'bench']
-            is_workout = any(keyword in content.lower() for keyword in workout_keywords)
-            
-            if is_workout:
-                # Try to display as workout blocks
-                displayed_as_blocks = display_workout_blocks(content)
-                if not displayed_as_blocks:
-                    # If parsing failed, display as regular text
-                    st.write(content)
-            else:
-                # Not a workout, display as regular text
-                st.write(content)
-        else:
-            # User message, display normally
-            st.write(message["content"])
+# Display chat messages (older turns collapsed, see display_chat_history)
+display_chat_history()
+
+# Plans generating in the background (the panel polls only while the user has some)
+if st.session_state.get("job_notice"):
+    st.warning(st.session_state.pop("job_notice"))
+if get_job_queue().has_undelivered(st.session_state["user_email"]):
+    background_jobs_panel()
 
 # Show API key error warning (dismissible)
 if st.session_state.get("api_key_error", False) and not st.session_state.get("api_error_dismissed", False):
@@ -1595,46 +1919,81 @@ if "pre_filled_question" in st.session_state and st.session_state["pre_filled_qu
     is_custom_workout = st.session_state.get("custom_workout_request", False)
     st.session_state["pre_filled_question"] = None  # Clear after use
     st.session_state["prefilled_triggered"] = True  # Flag to track pre-filled question
+    st.session_state.pop("chat_history_shown", None)  # New turn: collapse history back to the recent window
     
-    # Store the actual prompt for AI (even if we show a different message to user)
     if is_custom_workout:
-        # Store actual prompt for AI, but show friendly message to user
-        st.session_state["actual_ai_prompt"] = user_input  # Store the real prompt
-        st.session_state["messages"].append({"role": "user", "content": "🤔 MyGymBro is thinking..."})
+        # Custom plans are long: generated in the background, the real prompt is kept on the message as context
         st.session_state["custom_workout_request"] = False  # Clear flag
+        submit_background_plan("✨ Custom workout", user_input, "✨ Custom workout plan", cacheable=False)
+        metrics.CHAT_MESSAGES.labels("custom_workout").inc()
     else:
-        st.session_state["messages"].append({"role": "user", "content": user_input})
+        # Workout buttons ask for a structured (JSON) plan
+        st.session_state["structured_request"] = not st.session_state.pop("pre_filled_is_chat", False)
+        add_chat_message({"role": "user", "content": user_input})
+        # Sidebar prompts are built only from profile fields, so their answers can be shared
+        st.session_state["cacheable_request"] = True
+        metrics.CHAT_MESSAGES.labels("sidebar").inc()
     
     # Force rerun to show the user message in chat first
+    end_rerun()
     st.rerun()
 elif user_input := st.chat_input(get_text("chat_placeholder")):
     # Add user message to session state first (this will show in chat immediately after rerun)
-    st.session_state["messages"].append({"role": "user", "content": user_input})
+    add_chat_message({"role": "user", "content": user_input})
+    st.session_state.pop("chat_history_shown", None)  # New turn: collapse history back to the recent window
+    st.session_state["cacheable_request"] = False
+    st.session_state["structured_request"] = False
+    metrics.CHAT_MESSAGES.labels("chat").inc()
     
     # Force rerun to show the user message in chat first
+    end_rerun()
     st.rerun()
 
 # Generate AI response if there's a user message without an assistant response
 if st.session_state["messages"] and st.session_state["messages"][-1]["role"] == "user":
-    # Get the last user message - use actual prompt if it's a custom workout
-    if "actual_ai_prompt" in st.session_state:
-        last_user_message = st.session_state["actual_ai_prompt"]
-        del st.session_state["actual_ai_prompt"]  # Clear after use
-    else:
-        last_user_message = st.session_state["messages"][-1]["content"]
+    # Get the last user message (a stored real prompt wins over the text shown in the chat)
+    last_message = st.session_state["messages"][-1]
+    last_user_message = last_message.get("prompt") or last_message["content"]
+    
+    cacheable = st.session_state.pop("cacheable_request", False)
+    structured = st.session_state.pop("structured_request", False)
+    assistant_message = {"role": "assistant"}
     
     # Create a placeholder for the assistant message
     with st.chat_message("assistant"):
-        # Use write_stream to stream the response word by word
-        # This displays the response progressively as tokens arrive
-        full_response = st.write_stream(get_ai_response_stream(last_user_message, selected_prompt))
+        if cacheable:
+            response_stream = get_cached_ai_response_stream(last_user_message, selected_prompt, structured)
+        else:
+            # Follow-ups see the earlier conversation (everything before the current question)
+            history = st.session_state["messages"][:-1]
+            response_stream = get_ai_response_stream(last_user_message, selected_prompt, structured, history)
+        
+        if structured:
+            # Render each workout block as soon as its JSON object is complete
+            raw_response, parser, error = stream_structured_workout(response_stream)
+            full_response, workout_plan = build_structured_answer(parser, raw_response, error)
+            if workout_plan is not None:
+                assistant_message["workout"] = workout_plan
+                if workout_plan.get("notice"):
+                    # Cut off: the completed blocks are already on screen, say why the rest is missing
+                    st.markdown(workout_plan["notice"])
+            else:
+                st.write(full_response)
+        else:
+            # Use write_stream to stream the response word by word
+            # This displays the response progressively as tokens arrive
+            full_response = st.write_stream(response_stream)
+            # Parse once now so reruns never have to scan the text again
+            assistant_message["parsed"] = analyze_workout_text(full_response)
     
     # Add AI response to session state after streaming completes
     # This ensures the message persists in the chat history
-    st.session_state["messages"].append({"role": "assistant", "content": full_response})
+    assistant_message["content"] = full_response
+    add_chat_message(assistant_message)
     
     # Rerun to update the UI and ensure the message is saved properly
     # The streamed content will now be displayed from session_state on next render
+    end_rerun()
     st.rerun()
 
 # Footer
@@ -1648,3 +2007,5 @@ st.markdown(
     """, 
     unsafe_allow_html=True
 )
+
+end_rerun()
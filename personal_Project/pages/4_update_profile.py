@@ -1,6 +1,9 @@
 import streamlit as st
-import json
 from pathlib import Path
+from utils.user_store import get_user_store
+from utils.sessions import restore_session
+from utils.cancellation import get_cancellation_registry
+from utils.instrumentation import begin_rerun, end_rerun
 
 # Page configuration
 st.set_page_config(
@@ -10,6 +13,9 @@ st.set_page_config(
     initial_sidebar_state="collapsed"
 )
 
+# Rerun boundaries for metrics and (with INSTRUMENTATION=1) the phase timings
+begin_rerun("update_profile", st.session_state)
+
 # Custom CSS
 st.markdown("""
 <style>
@@ -48,13 +54,17 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
-# Check authentication
-if not st.session_state.get("authenticated", False):
+# Check authentication (a refreshed browser is logged back in from the URL session token)
+if not restore_session(st.session_state, st.query_params):
     st.warning("🔐 Please log in to update your profile")
     if st.button("Go to Login", use_container_width=True):
         st.switch_page("pages/1_login.py")
     st.stop()
 
+# Left the main app: stop any chat answer it was still streaming for this session (normally
+# already cancelled as "abandoned" when Streamlit closed the interrupted run's stream)
+get_cancellation_registry().cancel_session(st.session_state.get("instrumentation_session"), "abandoned")
+
 # Initialize session state for update form
 if "update_form_step" not in st.session_state:
     st.session_state["update_form_step"] = 1
@@ -64,24 +74,11 @@ if "temp_update_data" not in st.session_state:
 # Data directory setup
 DATA_DIR = Path("data")
 DATA_DIR.mkdir(exist_ok=True)
-USERS_FILE = DATA_DIR / "users.json"
-
-def load_users():
-    """Load users from JSON file."""
-    if USERS_FILE.exists():
-        with open(USERS_FILE, 'r') as f:
-            return json.load(f)
-    return {}
-
-def save_users(users):
-    """Save users to JSON file."""
-    with open(USERS_FILE, 'w') as f:
-        json.dump(users, f, indent=2)
 
 def update_user_profile(email, updated_data):
     """Update user profile with additional information."""
-    users = load_users()
-    if email in users:
+    store = get_user_store()
+    if store.exists(email):
         # Convert height and weight if provided
         if 'height_feet' in updated_data and 'height_inches' in updated_data:
             height_feet = updated_data['height_feet']
@@ -93,12 +90,11 @@ def update_user_profile(email, updated_data):
             updated_data['weight_kg'] = weight_lbs * 0.453592
         
         # Update the user data
-        users[email].update(updated_data)
-        save_users(users)
-        
-        # Update session state
-        st.session_state["user_data"] = users[email]
-        return True, users[email]
+        user_data = store.update(email, updated_data)
+        if user_data is not None:
+            # Update session state
+            st.session_state["user_data"] = user_data
+            return True, user_data
     return False, None
 
 # Get current user data
@@ -411,3 +407,4 @@ st.markdown(
     unsafe_allow_html=True
 )
 
+end_rerun()
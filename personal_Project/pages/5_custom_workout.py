@@ -1,5 +1,8 @@
 import streamlit as st
 from pathlib import Path
+from utils.instrumentation import begin_rerun, end_rerun
+from utils.sessions import restore_session
+from utils.cancellation import get_cancellation_registry
 
 # Get user data first for page title
 user_data_for_title = st.session_state.get("user_data", {})
@@ -13,6 +16,9 @@ st.set_page_config(
     initial_sidebar_state="collapsed"
 )
 
+# Rerun boundaries for metrics and (with INSTRUMENTATION=1) the phase timings
+begin_rerun("custom_workout", st.session_state)
+
 # Custom CSS
 st.markdown("""
 <style>
@@ -51,13 +57,17 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
-# Check authentication
-if not st.session_state.get("authenticated", False):
+# Check authentication (a refreshed browser is logged back in from the URL session token)
+if not restore_session(st.session_state, st.query_params):
     st.warning("🔐 Please log in to create a custom workout")
     if st.button("Go to Login", use_container_width=True):
         st.switch_page("pages/1_login.py")
     st.stop()
 
+# Left the main app: stop any chat answer it was still streaming for this session (normally
+# already cancelled as "abandoned" when Streamlit closed the interrupted run's stream)
+get_cancellation_registry().cancel_session(st.session_state.get("instrumentation_session"), "abandoned")
+
 # Initialize session state for custom workout form
 if "custom_workout_step" not in st.session_state:
     st.session_state["custom_workout_step"] = 1
@@ -365,7 +375,7 @@ Make it the perfect workout routine for my needs!"""
                 
                 # Store the actual prompt but show a friendly message
                 st.session_state["pre_filled_question"] = custom_prompt
-                st.session_state["custom_workout_request"] = True  # Flag to show friendly message
+                st.session_state["custom_workout_request"] = True  # Flag: the main app generates it as a background job
                 
                 # Reset custom workout form state
                 st.session_state["custom_workout_step"] = 1
@@ -399,3 +409,4 @@ st.markdown(
     unsafe_allow_html=True
 )
 
+end_rerun()
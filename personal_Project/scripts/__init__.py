@@ -0,0 +1,3 @@
+"""
+MyGymBro maintenance and benchmark scripts (run from personal_Project with python -m scripts.<name>).
+"""
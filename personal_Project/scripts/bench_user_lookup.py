@@ -0,0 +1,169 @@
+"""
+MyGymBro - Login Lookup Benchmark
+
+Compares the legacy login path (parse the whole users.json, then look up one
+email) against the keyed store path used by authenticate_user (read only the
+password hash from SQLite, then load the one matching record) at several
+directory sizes. Reports per-login latency (p50/p99), peak Python memory per
+login, and the size of the data on disk.
+
+Usage (from personal_Project):
+    python -m scripts.bench_user_lookup [--sizes 10000,100000,1000000] [--lookups 2000]
+"""
+
+import argparse
+import hashlib
+import json
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+
+from utils.user_store import CachedUserStore, SQLiteUserStore
+
+PASSWORD = "Loadtest1pass"
+PASSWORD_HASH = hashlib.sha256(PASSWORD.encode()).hexdigest()
+
+
+def make_user(index, rng):
+    """A record shaped like a completed signup."""
+    email = f"student{index}@district.example.com"
+    return email, {
+        "email": email,
+        "password": PASSWORD_HASH,
+        "first_name": f"Student{index}",
+        "last_name": "Example",
+        "created_at": datetime(2025, 9, 1).isoformat(),
+        "last_login": None,
+        "workout_history": [],
+        "preferences": {"language": "English", "notifications": True, "theme": "light"},
+        "height_feet": 5,
+        "height_inches": rng.randint(0, 11),
+        "weight_lbs": rng.randint(90, 250),
+        "lifestyle": "Student or office worker",
+        "exercise_experience": rng.choice(["None", "Beginner", "Intermediate"]),
+        "fitness_level": rng.choice(["Below average", "Average", "Good"]),
+        "sports_activities": rng.sample(["Soccer", "Basketball", "Swimming", "Running"], 2),
+        "exercise_frequency": "3x/week",
+        "age": rng.randint(13, 19),
+        "gender": rng.choice(["Male", "Female"]),
+        "profile_completed": True,
+    }
+
+
+def build(directory, count, write_json):
+    """Create users.db (and optionally users.json) with count users."""
+    rng = random.Random(count)
+    db = SQLiteUserStore(directory / "users.db")
+    conn = db._connect()
+    now = datetime.now().isoformat()
+    users = {} if write_json else None
+    conn.execute("BEGIN")
+    batch = []
+    for index in range(count):
+        email, record = make_user(index, rng)
+        batch.append((email, json.dumps(record), now))
+        if users is not None:
+            users[email] = record
+        if len(batch) == 10000:
+            conn.executemany("INSERT INTO users (email, data, updated_at) VALUES (?, ?, ?)", batch)
+            batch = []
+    conn.executemany("INSERT INTO users (email, data, updated_at) VALUES (?, ?, ?)", batch)
+    conn.execute("COMMIT")
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    if users is not None:
+        # Same format JsonUserStore writes
+        with open(directory / "users.json", 'w') as f:
+            json.dump(users, f, indent=2)
+    return db
+
+
+def legacy_authenticate(json_path, email, password):
+    """The old login: load every user, then check one hash."""
+    with open(json_path, 'r') as f:
+        users = json.load(f)
+    user = users.get(email)
+    if user and hashlib.sha256(password.encode()).hexdigest() == user["password"]:
+        return user
+    return None
+
+
+def keyed_authenticate(store, email, password):
+    """The lookup path of pages/1_login.py authenticate_user (SHA-256 check so only the lookup is measured)."""
+    hashed = store.get_password_hash(email)
+    if hashed and hashlib.sha256(password.encode()).hexdigest() == hashed:
+        return store.get(email)
+    return None
+
+
+def measure(login, emails):
+    """Return (sorted per-login seconds, peak traced bytes of a single login)."""
+    timings = []
+    for email in emails:
+        start = time.perf_counter()
+        login(email)
+        timings.append(time.perf_counter() - start)
+    tracemalloc.start()
+    login(emails[0])
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return sorted(timings), peak
+
+
+def percentile(values, q):
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark login lookups against large user directories.")
+    parser.add_argument("--sizes", default="10000,100000,1000000", help="comma-separated user counts")
+    parser.add_argument("--lookups", type=int, default=2000, help="logins timed per size on the keyed store")
+    parser.add_argument("--legacy-lookups", type=int, default=5, help="logins timed per size on users.json")
+    parser.add_argument("--legacy-max", type=int, default=100000,
+                        help="largest size that also gets a users.json baseline (it is slow and memory hungry)")
+    args = parser.parse_args(argv)
+
+    header = f"{'users':>9}  {'path':<22}{'p50 ms':>10}{'p99 ms':>10}{'peak mem':>12}{'on disk':>10}"
+    print(header)
+    print("-" * len(header))
+    for count in (int(size) for size in args.sizes.split(",")):
+        directory = Path(tempfile.mkdtemp(prefix="mygymbro-users-"))
+        try:
+            start = time.perf_counter()
+            with_json = count <= args.legacy_max
+            db = build(directory, count, with_json)
+            print(f"{count:>9}  built in {time.perf_counter() - start:.1f}s")
+
+            rng = random.Random(0)
+            # Mostly real accounts plus some typos, like a real login rush
+            emails = [
+                f"student{rng.randrange(count)}@district.example.com" if rng.random() < 0.9 else f"nobody{i}@example.com"
+                for i in range(args.lookups)
+            ]
+
+            if with_json:
+                json_path = directory / "users.json"
+                timings, peak = measure(lambda email: legacy_authenticate(json_path, email, PASSWORD),
+                                        emails[:args.legacy_lookups])
+                print(f"{'':>9}  {'users.json full parse':<22}{percentile(timings, 0.5) * 1000:>10.2f}"
+                      f"{percentile(timings, 0.99) * 1000:>10.2f}{peak / 1024 / 1024:>10.1f}MB"
+                      f"{json_path.stat().st_size / 1024 / 1024:>8.0f}MB")
+
+            # Small cache so most lookups go to SQLite, as in a large district
+            store = CachedUserStore(db, max_records=1000)
+            timings, peak = measure(lambda email: keyed_authenticate(store, email, PASSWORD), emails)
+            db_size = (directory / "users.db").stat().st_size
+            print(f"{'':>9}  {'sqlite hash lookup':<22}{percentile(timings, 0.5) * 1000:>10.3f}"
+                  f"{percentile(timings, 0.99) * 1000:>10.3f}{peak / 1024:>10.1f}KB{db_size / 1024 / 1024:>8.0f}MB")
+            db.close()
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
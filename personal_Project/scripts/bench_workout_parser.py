@@ -0,0 +1,309 @@
+"""
+MyGymBro - Workout Parser Benchmark
+
+Compares the single-pass parse_workout_exercises against the previous
+multi-pattern implementation on a corpus of realistic model answers and
+synthetic weekly splits (from a few lines up to 10k lines). Reports lines/sec,
+speedup and peak allocated memory per parse, and checks that both parsers
+return identical exercises.
+
+Usage (from personal_Project):
+    python -m scripts.bench_workout_parser [--repeat 5] [--max-lines 10000]
+"""
+
+import argparse
+import random
+import re
+import sys
+import time
+import tracemalloc
+
+from utils.workout_parser import parse_workout_exercises
+
+
+def legacy_parse_workout_exercises(text):
+    """Previous parse_workout_exercises, kept verbatim as the baseline."""
+    exercises = []
+    lines = text.split('\n')
+    current_exercise = None
+    current_description = []
+
+    # Patterns to match exercise numbers (1., 2., First, Second, etc.)
+    exercise_patterns = [
+        r'^\d+[\.\)]\s*(.+?)(?:\s*[-–—]|$)',  # 1. Exercise Name or 1) Exercise Name
+        r'^(?:First|Second|Third|Fourth|Fifth|Sixth|Seventh|Eighth|Ninth|Tenth)\s*[:\-]?\s*(.+?)(?:\s*[-–—]|$)',  # First: Exercise Name
+        r'^Exercise\s+\d+[:\-]?\s*(.+?)(?:\s*[-–—]|$)',  # Exercise 1: Exercise Name
+    ]
+
+    # Skip intro sections (warm-up, introduction, etc.)
+    skip_sections = ['warm-up', 'warmup', 'introduction', 'overview', 'summary', 'cool-down', 'cooldown']
+
+    for i, line in enumerate(lines):
+        line = line.strip()
+        if not line:
+            # Empty line might separate exercises
+            if current_exercise and current_description:
+                # Don't add empty line, but continue collecting
+                continue
+            continue
+
+        # Skip section headers
+        line_lower = line.lower()
+        if any(section in line_lower for section in skip_sections) and len(line) < 50:
+            # Reset current exercise if we hit a section header
+            if current_exercise:
+                exercises.append({
+                    'name': current_exercise,
+                    'description': '\n'.join(current_description).strip()
+                })
+                current_exercise = None
+                current_description = []
+            continue
+
+        # Check if this line starts a new exercise
+        is_exercise_start = False
+        exercise_name = None
+
+        for pattern in exercise_patterns:
+            match = re.match(pattern, line, re.IGNORECASE)
+            if match:
+                exercise_name = match.group(1).strip()
+                # Clean up exercise name (remove extra punctuation)
+                exercise_name = re.sub(r'^[-–—\s]+|[-–—\s]+$', '', exercise_name)
+                if exercise_name:
+                    is_exercise_start = True
+                    break
+
+        # Also check for bold text (markdown format)
+        if not is_exercise_start:
+            bold_match = re.match(r'^\*\*(.+?)\*\*', line)
+            if bold_match:
+                potential_name = bold_match.group(1).strip()
+                # Check if it looks like an exercise name (not too long, not a full sentence)
+                if len(potential_name) < 80 and ':' not in potential_name:
+                    exercise_name = potential_name
+                    is_exercise_start = True
+
+        # Check for lines that start with common exercise patterns
+        if not is_exercise_start:
+            # Look for lines that might be exercise names (short, capitalized, contain exercise keywords)
+            exercise_keywords = ['squat', 'press', 'curl', 'row', 'pull', 'push', 'deadlift', 'lunge', 'plank', 'crunch', 'bench', 'fly', 'extension', 'raise', 'dip']
+            if len(line) < 80 and any(keyword in line_lower for keyword in exercise_keywords):
+                # Check if it's likely an exercise name (starts with capital, short, no colon in middle)
+                if line[0].isupper() and line.count(':') <= 1:
+                    parts = line.split(':', 1)
+                    if len(parts) == 1 or (len(parts) == 2 and len(parts[0]) < 60):
+                        exercise_name = parts[0].strip()
+                        is_exercise_start = True
+
+        if is_exercise_start and exercise_name:
+            # Save previous exercise if exists
+            if current_exercise:
+                exercises.append({
+                    'name': current_exercise,
+                    'description': '\n'.join(current_description).strip()
+                })
+
+            # Start new exercise
+            current_exercise = exercise_name
+            current_description = []
+            # Add the rest of the line as description if it contains more info
+            if ':' in line:
+                remaining = line.split(':', 1)[1].strip()
+                if remaining:
+                    current_description.append(remaining)
+        else:
+            # Add to current exercise description
+            if current_exercise:
+                # Skip if this looks like the start of a new section
+                if not (line_lower.startswith('workout') or line_lower.startswith('day') or 
+                        any(section in line_lower for section in skip_sections)):
+                    current_description.append(line)
+            elif not exercises:  # If no exercise found yet, might be intro text
+                pass
+
+    # Add last exercise
+    if current_exercise:
+        exercises.append({
+            'name': current_exercise,
+            'description': '\n'.join(current_description).strip()
+        })
+
+    # If no exercises found with patterns, try alternative parsing
+    if not exercises:
+        # Look for numbered list items
+        for i, line in enumerate(lines):
+            line = line.strip()
+            if re.match(r'^\d+[\.\)]\s+', line):
+                # Extract exercise name
+                exercise_name = re.sub(r'^\d+[\.\)]\s+', '', line).strip()
+                # Get description from next few lines
+                desc_lines = []
+                for j in range(i+1, min(i+6, len(lines))):
+                    next_line = lines[j].strip()
+                    if next_line and not re.match(r'^\d+[\.\)]\s+', next_line):
+                        desc_lines.append(next_line)
+                    else:
+                        break
+                if exercise_name:
+                    exercises.append({
+                        'name': exercise_name,
+                        'description': '\n'.join(desc_lines).strip()
+                    })
+
+    # Filter out exercises with very short or invalid names
+    exercises = [ex for ex in exercises if ex['name'] and len(ex['name']) > 2]
+
+    return exercises
+
+
+# Representative answers in the shapes the model actually produces
+REAL_RESPONSES = {
+    "short_answer": (
+        "Great question! Protein helps your muscles recover after training. "
+        "Aim for roughly 1.6-2.2 g per kg of body weight spread across your meals."
+    ),
+    "numbered_workout": """Here's a beginner full-body workout for today:
+
+Warm-up
+5 minutes of light cardio and dynamic stretches.
+
+1. Goblet Squat - 3 sets of 10 reps
+Hold the dumbbell at chest height. Keep your chest up and knees tracking over your toes.
+Rest: 60 seconds. Start with 15-25 lbs.
+
+2. Dumbbell Bench Press - 3 sets of 8-10 reps
+Lower the dumbbells slowly. Maintain a slight arch and avoid flaring your elbows.
+Rest: 90 seconds.
+
+3. Seated Cable Row - 3x12
+Pull to your stomach and squeeze your shoulder blades. Keep your back straight.
+
+4. Plank - 3 sets of 30 seconds
+Maintain a straight line from head to heels.
+
+Cool-down
+Stretch your hips, chest and hamstrings for 5 minutes.""",
+    "bold_markdown": """**Upper Body Day**
+
+**Incline Dumbbell Press**
+4 sets x 10 reps, rest 75 seconds, 20-30 lbs. Keep your shoulder blades pinned.
+
+**Lat Pulldown**
+3 sets x 12 reps. Avoid leaning back too far; focus on technique.
+
+**Lateral Raise**
+3 sets x 15 reps with 10 lbs. Maintain a soft bend in the elbows.
+
+Summary
+Finish with light stretching.""",
+    "ordinal_list": """First: Barbell Back Squat - 5 sets of 5 reps at 135 lbs
+Brace your core and maintain a neutral spine.
+Second: Romanian Deadlift - 3 sets of 8 reps
+Keep the bar close to your legs.
+Third: Walking Lunge - 3 sets of 12 steps per leg
+Exercise 4: Hanging Knee Raise - 3x15
+Avoid swinging.""",
+}
+
+_EXERCISES = [
+    "Barbell Back Squat", "Bench Press", "Deadlift", "Overhead Press", "Pull-up", "Barbell Row",
+    "Dumbbell Curl", "Tricep Extension", "Walking Lunge", "Leg Press", "Plank", "Cable Fly",
+    "Lateral Raise", "Push-up", "Bench Dip", "Hip Thrust", "Face Pull", "Calf Raise",
+]
+_DAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+_FOCUS = ["Upper body", "Lower body", "Push", "Pull", "Legs", "Full body", "Conditioning"]
+_TIPS = [
+    "Keep your core braced throughout the movement.",
+    "Maintain a neutral spine and avoid rounding your back.",
+    "Control the lowering phase for two seconds.",
+    "Focus on proper form before adding weight.",
+    "Breathe out on the way up.",
+]
+
+
+def synthetic_weekly_split(target_lines, seed=0):
+    """Build a weekly-split style answer with roughly target_lines lines."""
+    rng = random.Random(seed)
+    lines = ["Here is your weekly split:", "", "Overview", "Train hard and recover well.", ""]
+    week = 0
+    while len(lines) < target_lines:
+        day = _DAYS[week % len(_DAYS)]
+        lines.append(f"**{day} - {_FOCUS[rng.randrange(len(_FOCUS))]}**")
+        lines.append("Warm-up")
+        lines.append("5 minutes of easy cardio.")
+        for number in range(1, rng.randint(4, 8) + 1):
+            name = rng.choice(_EXERCISES)
+            style = rng.randrange(3)
+            if style == 0:
+                lines.append(f"{number}. {name} - {rng.randint(3, 5)} sets of {rng.randint(6, 15)} reps")
+            elif style == 1:
+                lines.append(f"**{name}**")
+                lines.append(f"{rng.randint(3, 5)}x{rng.randint(6, 15)}, rest: {rng.choice([45, 60, 90])} seconds")
+            else:
+                lines.append(f"{name}: {rng.randint(3, 5)} sets x {rng.randint(6, 15)} reps")
+            lines.append(f"Use {rng.randint(10, 60) * 5} lbs. {rng.choice(_TIPS)} {rng.choice(_TIPS)}")
+            lines.append("")
+        lines.append("Cool-down")
+        lines.append("Stretch for 5-10 minutes.")
+        lines.append("")
+        week += 1
+    return "\n".join(lines[:target_lines])
+
+
+def build_corpus(max_lines):
+    """Return [(name, text)] from short answers up to max_lines-line weekly splits."""
+    corpus = list(REAL_RESPONSES.items())
+    size = 10
+    while size <= max_lines:
+        corpus.append((f"weekly_split_{size}_lines", synthetic_weekly_split(size, seed=size)))
+        size *= 10
+    return corpus
+
+
+def measure(parser, text, repeat):
+    """Return (best seconds per parse, peak bytes allocated during one parse)."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        parser(text)
+        best = min(best, time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        parser(text)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return best, peak
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the workout text parser.")
+    parser.add_argument("--repeat", type=int, default=5, help="timed runs per corpus entry (best is reported)")
+    parser.add_argument("--max-lines", type=int, default=10000, help="largest synthetic weekly split")
+    args = parser.parse_args(argv)
+
+    corpus = build_corpus(args.max_lines)
+    header = f"{'corpus':<26}{'lines':>7}  {'legacy lines/s':>15}{'new lines/s':>13}{'speedup':>9}  {'legacy peak':>12}{'new peak':>10}  match"
+    print(header)
+    print("-" * len(header))
+    mismatches = 0
+    for name, text in corpus:
+        line_count = text.count("\n") + 1
+        same = legacy_parse_workout_exercises(text) == parse_workout_exercises(text)
+        mismatches += not same
+        legacy_time, legacy_peak = measure(legacy_parse_workout_exercises, text, args.repeat)
+        new_time, new_peak = measure(parse_workout_exercises, text, args.repeat)
+        print(
+            f"{name:<26}{line_count:>7}  {line_count / legacy_time:>15,.0f}{line_count / new_time:>13,.0f}"
+            f"{legacy_time / new_time:>8.2f}x  {legacy_peak / 1024:>10.1f}KB{new_peak / 1024:>8.1f}KB  {'yes' if same else 'NO'}"
+        )
+    if mismatches:
+        print(f"\n{mismatches} corpus entries parsed differently")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,257 @@
+"""
+MyGymBro - Load Test
+
+Simulates a class of students using the app at once. Every simulated user
+runs the real pages through Streamlit's AppTest:
+- signup (2_signup.py): account form plus the three profile steps
+- login (1_login.py)
+- main app (3_main_app.py): first load, sidebar workout buttons, and
+  free-form chat follow-ups
+
+The LLM is the bundled stub server (scripts/stub_llm_server.py), started
+in-process and selected with LLM_BACKEND=openai_compatible, so runs need no
+network and no API spend. Everything runs in a throwaway working directory
+(fresh users.db, transcripts and caches; the equipment workbook is copied).
+
+Reports p50/p95/p99 latency per kind of rerun, time to first token as seen by
+the chat page (including queueing in the governor), throughput, and memory
+per session.
+
+Usage (from personal_Project):
+    python -m scripts.load_test --users 200 --concurrency 50 --chats 2 --ttft 0.5 --tokens-per-sec 60
+"""
+
+import argparse
+import os
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from http.server import ThreadingHTTPServer
+from pathlib import Path
+
+PROJECT_DIR = Path(__file__).resolve().parent.parent
+PAGES_DIR = PROJECT_DIR / "pages"
+
+WORKOUT_BUTTONS = ["💪 Full Body Workout", "🔥 Upper Body Focus", "🦵 Lower Body Focus", "⚡ Quick 30-min Workout"]
+CHAT_MESSAGES = ["Can you make it shorter?", "What should I eat after this workout?", "Swap the squats for something easier"]
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p * len(values)))]
+
+
+def rss_bytes():
+    """Current resident set size (falls back to peak RSS where /proc is unavailable)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class Recorder:
+    """Thread-safe latency samples grouped by action."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    def add(self, action, seconds):
+        with self._lock:
+            self.samples[action].append(seconds)
+
+    def error(self, action):
+        with self._lock:
+            self.errors[action] += 1
+
+
+def install_ttft_probe(recorder):
+    """Time from each chat request to its first streamed chunk, as the page sees it."""
+    from utils.single_flight import SingleFlight
+
+    original_stream = SingleFlight.stream
+
+    def timed_stream(self, key, producer, on_status=None, cancel_token=None):
+        start = time.perf_counter()
+        first = True
+        for chunk in original_stream(self, key, producer, on_status, cancel_token):
+            if first:
+                recorder.add("time_to_first_token", time.perf_counter() - start)
+                first = False
+            yield chunk
+
+    SingleFlight.stream = timed_stream
+
+
+def start_stub_server(args):
+    from scripts.stub_llm_server import StubLLM, make_handler
+
+    stub = StubLLM(args.ttft, args.tokens_per_sec, args.error_rate, 500, {}, args.seed)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), make_handler(stub))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, stub
+
+
+def timed_run(recorder, action, at, timeout):
+    """Run one rerun of an AppTest and record its latency."""
+    start = time.perf_counter()
+    at.run(timeout=timeout)
+    recorder.add(action, time.perf_counter() - start)
+    if at.exception:
+        recorder.error(action)
+    return at
+
+
+def click(at, label):
+    for button in at.button:
+        if button.label == label:
+            button.click()
+            return at
+    raise LookupError(f"No button labelled {label!r}")
+
+
+def simulate_user(index, args, recorder, run_id):
+    """One student: sign up, log in, then use the main app."""
+    from streamlit.testing.v1 import AppTest
+
+    rng = random.Random(f"{args.seed}:{index}")
+    email = f"student{index}.{run_id}@loadtest.example.com"
+    password = f"Loadtest{index}pass"
+    timeout = args.timeout
+
+    # Signup: account form, then the three profile steps
+    signup = AppTest.from_file(str(PAGES_DIR / "2_signup.py"), default_timeout=timeout)
+    timed_run(recorder, "signup_load", signup, timeout)
+    signup.text_input(key="stage1_first_name").input(f"Student{index}")
+    signup.text_input(key="stage1_last_name").input("Loadtest")
+    signup.text_input(key="stage1_email").input(email)
+    signup.text_input(key="stage1_password").input(password)
+    signup.text_input(key="stage1_confirm_password").input(password)
+    signup.checkbox(key="stage1_terms").check()
+    timed_run(recorder, "signup_submit", click(signup, "🚀 Create Account"), timeout)
+    timed_run(recorder, "signup_step", click(signup, "➡️ Next"), timeout)
+    signup.selectbox(key="form2_fitness").select(rng.choice(["Below average", "Average", "Good"]))
+    timed_run(recorder, "signup_step", click(signup, "➡️ Next"), timeout)
+    signup.number_input(key="form3_age").set_value(rng.randint(14, 19))
+    signup.selectbox(key="form3_gender").select(rng.choice(["Male", "Female"]))
+    signup.selectbox(key="form3_frequency").select(rng.choice(["2x/week", "3x/week", "4x/week"]))
+    timed_run(recorder, "signup_complete", click(signup, "✅ Complete Profile"), timeout)
+
+    # Login with the new account
+    login = AppTest.from_file(str(PAGES_DIR / "1_login.py"), default_timeout=timeout)
+    timed_run(recorder, "login_load", login, timeout)
+    login.text_input[0].input(email)
+    login.text_input[1].input(password)
+    timed_run(recorder, "login_submit", click(login, "🚀 Login"), timeout)
+    if not login.session_state["authenticated"]:
+        recorder.error("login_submit")
+        return None
+
+    # Main app with the logged-in session
+    app = AppTest.from_file(str(PAGES_DIR / "3_main_app.py"), default_timeout=timeout)
+    for key in ("authenticated", "user_email", "user_data"):
+        app.session_state[key] = login.session_state[key]
+    timed_run(recorder, "main_load", app, timeout)
+    for label in rng.sample(WORKOUT_BUTTONS, args.buttons):
+        timed_run(recorder, "workout_button", click(app, label), timeout)
+    for _ in range(args.chats):
+        app.chat_input[0].set_value(rng.choice(CHAT_MESSAGES))
+        timed_run(recorder, "chat_message", app, timeout)
+    return app
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Simulate many concurrent MyGymBro sessions.")
+    parser.add_argument("--users", type=int, default=50, help="simulated students")
+    parser.add_argument("--concurrency", type=int, default=20, help="students active at the same time")
+    parser.add_argument("--buttons", type=int, default=1, help="sidebar workout buttons clicked per student")
+    parser.add_argument("--chats", type=int, default=2, help="free-form chat messages per student")
+    parser.add_argument("--ttft", type=float, default=0.5, help="stub server time to first token")
+    parser.add_argument("--tokens-per-sec", type=float, default=80.0, help="stub server streaming speed")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="stub server error rate")
+    parser.add_argument("--timeout", type=float, default=120.0, help="seconds allowed per rerun")
+    parser.add_argument("--trace-memory", action="store_true", help="also measure Python allocations (slower)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    # Pages and utils are imported from the project, but all data goes to a throwaway directory
+    sys.path.insert(0, str(PROJECT_DIR))
+    workdir = Path(tempfile.mkdtemp(prefix="mygymbro-load-"))
+    (workdir / "data").mkdir()
+    workbook = PROJECT_DIR / "data" / "GymMachineList.xlsx"
+    if workbook.exists():
+        shutil.copy(workbook, workdir / "data" / workbook.name)
+    os.chdir(workdir)
+
+    server, stub = start_stub_server(args)
+    os.environ["LLM_BACKEND"] = "openai_compatible"
+    os.environ["LLM_BASE_URL"] = f"http://127.0.0.1:{server.server_address[1]}/v1"
+    os.environ.setdefault("LLM_API_KEY", "load-test")
+
+    recorder = Recorder()
+    install_ttft_probe(recorder)
+    if args.trace_memory:
+        tracemalloc.start()
+    baseline_rss = rss_bytes()
+    run_id = int(time.time())
+
+    start = time.perf_counter()
+    sessions = []
+    failures = 0
+    try:
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            futures = [pool.submit(simulate_user, i, args, recorder, run_id) for i in range(args.users)]
+            for future in as_completed(futures):
+                try:
+                    app = future.result()
+                except Exception as e:
+                    failures += 1
+                    print(f"session failed: {type(e).__name__}: {e}", file=sys.stderr)
+                    continue
+                if app is not None:
+                    # Keep sessions alive so their memory is still counted
+                    sessions.append(app)
+        elapsed = time.perf_counter() - start
+        rss_per_session = (rss_bytes() - baseline_rss) / max(len(sessions), 1)
+        traced_per_session = None
+        if args.trace_memory:
+            traced_per_session = tracemalloc.get_traced_memory()[0] / max(len(sessions), 1)
+            tracemalloc.stop()
+    finally:
+        server.shutdown()
+        os.chdir(PROJECT_DIR)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(f"\n{args.users} students, concurrency {args.concurrency}, {elapsed:.1f}s "
+          f"({len(sessions)} completed, {failures} failed)")
+    print(f"{'action':<22}{'count':>7}{'errors':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for action, values in recorder.samples.items():
+        print(f"{action:<22}{len(values):>7}{recorder.errors.get(action, 0):>8}"
+              f"{percentile(values, 0.5) * 1000:>10.0f}{percentile(values, 0.95) * 1000:>10.0f}"
+              f"{percentile(values, 0.99) * 1000:>10.0f}{max(values) * 1000:>10.0f}")
+    reruns = sum(len(values) for action, values in recorder.samples.items() if action != "time_to_first_token")
+    answers = len(recorder.samples.get("workout_button", [])) + len(recorder.samples.get("chat_message", []))
+    print(f"\nthroughput: {reruns / elapsed:.1f} reruns/s, {answers / elapsed:.2f} AI answers/s, "
+          f"{len(sessions) / elapsed:.2f} sessions/s")
+    print(f"upstream LLM requests: {stub.requests} ({stub.errors} injected errors)")
+    print(f"memory per session: {rss_per_session / 1024 / 1024:.2f} MB RSS", end="")
+    if traced_per_session is not None:
+        print(f", {traced_per_session / 1024 / 1024:.2f} MB traced Python allocations", end="")
+    print()
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
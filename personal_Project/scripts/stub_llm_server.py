@@ -0,0 +1,236 @@
+"""
+MyGymBro - Stub LLM Server
+
+A local OpenAI-compatible server for offline, deterministic benchmarking of
+the chat pipeline. It serves POST /v1/chat/completions (streaming SSE or a
+single JSON response) and GET /v1/models, with configurable latency and
+failure behaviour:
+- --ttft: seconds before the first token
+- --tokens-per-sec: streaming speed after the first token
+- --error-rate: fraction of requests answered with --error-status
+- --replay: JSONL file(s) or directories of recorded responses
+  ({"request_key": ..., "response": ...} per line, request_key as computed by
+  utils.llm_backends.request_fingerprint). Requests without a recording get a
+  synthetic workout (a JSON plan when JSON mode is requested).
+
+Usage (from personal_Project):
+    python -m scripts.stub_llm_server --port 8787 --ttft 0.4 --tokens-per-sec 60
+    LLM_BACKEND=openai_compatible LLM_BASE_URL=http://127.0.0.1:8787/v1 streamlit run main.py
+"""
+
+import argparse
+import json
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+from utils.llm_backends import request_fingerprint
+
+_TOKEN_RE = re.compile(r"\s*\S+")
+
+_EXERCISES = [
+    ("Goblet Squat", "Hold the dumbbell at chest height and sit back between your heels."),
+    ("Dumbbell Bench Press", "Lower the dumbbells to chest level and press up without locking out."),
+    ("Seated Cable Row", "Pull the handle to your stomach and squeeze your shoulder blades."),
+    ("Romanian Deadlift", "Hinge at the hips with a flat back and feel the stretch in your hamstrings."),
+    ("Lat Pulldown", "Pull the bar to your upper chest while keeping your torso upright."),
+    ("Plank", "Hold a straight line from head to heels and brace your core."),
+]
+
+
+def load_recordings(paths):
+    """Load recorded responses keyed by request fingerprint from JSONL files or directories."""
+    recordings = {}
+    for path in paths:
+        path = Path(path)
+        files = sorted(path.glob("*.jsonl")) if path.is_dir() else [path]
+        for file in files:
+            with open(file, "r", encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        record = json.loads(line)
+                        recordings[record["request_key"]] = record["response"]
+    return recordings
+
+
+def synthetic_response(rng, structured):
+    """Build a deterministic workout answer (text or JSON plan)."""
+    picks = rng.sample(_EXERCISES, 4)
+    if structured:
+        plan = {
+            "title": "Stub Full Body Workout",
+            "days": [{
+                "day": "Workout",
+                "focus": "Full body",
+                "exercises": [
+                    {
+                        "name": name,
+                        "sets": rng.randint(3, 4),
+                        "reps": f"{rng.choice([8, 10, 12])}",
+                        "rest": f"{rng.choice([60, 90])} sec",
+                        "weight": "moderate",
+                        "description": description,
+                        "form_tips": ["Keep your core braced.", "Control the lowering phase."],
+                    }
+                    for name, description in picks
+                ],
+            }],
+            "notes": "Warm up for 5 minutes and stretch afterwards.",
+        }
+        return json.dumps(plan, indent=2)
+    lines = ["Here's a full body workout for today:", ""]
+    for number, (name, description) in enumerate(picks, 1):
+        lines.append(f"{number}. {name} - {rng.randint(3, 4)} sets of {rng.choice([8, 10, 12])} reps")
+        lines.append(f"{description} Keep your core braced. Rest: {rng.choice([60, 90])} seconds.")
+        lines.append("")
+    lines.append("Warm up for 5 minutes before you start and stretch afterwards.")
+    return "\n".join(lines)
+
+
+class StubLLM:
+    """Shared state and behaviour of the stub server."""
+
+    def __init__(self, ttft, tokens_per_sec, error_rate, error_status, recordings, seed):
+        self.ttft = ttft
+        self.tokens_per_sec = tokens_per_sec
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.recordings = recordings
+        self.seed = seed
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.replayed = 0
+
+    def plan(self, request):
+        """Decide the outcome for one request: (error_status or None, response text)."""
+        messages = request.get("messages", [])
+        response_format = request.get("response_format")
+        key = request_fingerprint(messages, response_format)
+        with self._lock:
+            self.requests += 1
+            if self._rng.random() < self.error_rate:
+                self.errors += 1
+                return self.error_status, None
+            if key in self.recordings:
+                self.replayed += 1
+                return None, self.recordings[key]
+        # Same request, same synthetic answer
+        rng = random.Random(f"{self.seed}:{key}")
+        return None, synthetic_response(rng, bool(response_format and response_format.get("type") == "json_object"))
+
+
+def make_handler(stub):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send_json(self, status, body):
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path.rstrip("/").endswith("/models"):
+                self._send_json(200, {"object": "list", "data": [{"id": "stub", "object": "model", "owned_by": "stub"}]})
+            elif self.path.rstrip("/").endswith("/stats"):
+                self._send_json(200, {"requests": stub.requests, "errors": stub.errors, "replayed": stub.replayed})
+            else:
+                self._send_json(404, {"error": {"message": "not found"}})
+
+        def do_POST(self):
+            if not self.path.rstrip("/").endswith("/chat/completions"):
+                self._send_json(404, {"error": {"message": "not found"}})
+                return
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length) or b"{}")
+            error_status, text = stub.plan(request)
+            if error_status is not None:
+                self._send_json(error_status, {"error": {"message": "Stub server injected error", "type": "server_error"}})
+                return
+
+            model = request.get("model", "stub")
+            completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+            tokens = _TOKEN_RE.findall(text)
+            if not request.get("stream"):
+                time.sleep(stub.ttft + len(tokens) / stub.tokens_per_sec)
+                self._send_json(200, {
+                    "id": completion_id, "object": "chat.completion", "created": int(time.time()), "model": model,
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+                    "usage": {"prompt_tokens": 0, "completion_tokens": len(tokens), "total_tokens": len(tokens)},
+                })
+                return
+
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Cache-Control", "no-cache")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            self.close_connection = True
+
+            def send_chunk(delta, finish_reason=None):
+                chunk = {
+                    "id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+                    "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+                }
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                self.wfile.flush()
+
+            try:
+                time.sleep(stub.ttft)
+                send_chunk({"role": "assistant", "content": ""})
+                interval = 1.0 / stub.tokens_per_sec
+                next_at = time.monotonic()
+                for token in tokens:
+                    send_chunk({"content": token})
+                    next_at += interval
+                    time.sleep(max(0.0, next_at - time.monotonic()))
+                send_chunk({}, "stop")
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.wfile.flush()
+            except (BrokenPipeError, ConnectionResetError):
+                # Client went away mid-stream
+                pass
+
+    return Handler
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="OpenAI-compatible stub server for offline benchmarks.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8787)
+    parser.add_argument("--ttft", type=float, default=0.3, help="seconds before the first token")
+    parser.add_argument("--tokens-per-sec", type=float, default=80.0, help="streaming speed")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests that fail")
+    parser.add_argument("--error-status", type=int, default=500, help="HTTP status of injected errors (e.g. 429)")
+    parser.add_argument("--replay", action="append", default=[], help="JSONL file or directory of recordings (repeatable)")
+    parser.add_argument("--seed", type=int, default=0, help="seed for error injection and synthetic answers")
+    args = parser.parse_args(argv)
+
+    recordings = load_recordings(args.replay)
+    stub = StubLLM(args.ttft, args.tokens_per_sec, args.error_rate, args.error_status, recordings, args.seed)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(stub))
+    server.daemon_threads = True
+    print(f"Stub LLM server on http://{args.host}:{args.port}/v1 ({len(recordings)} recorded responses)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,38 @@
+import sys
+import types
+
+import pytest
+
+from utils import conversation
+
+
+@pytest.fixture
+def offline_tiktoken(monkeypatch):
+    """A tiktoken whose encoding download fails, as on a machine without network access."""
+    attempts = []
+
+    def load(name):
+        attempts.append(name)
+        raise ConnectionError("cannot download o200k_base")
+
+    fake = types.ModuleType("tiktoken")
+    fake.encoding_for_model = load
+    fake.get_encoding = load
+    monkeypatch.setitem(sys.modules, "tiktoken", fake)
+    monkeypatch.setattr(conversation, "_encodings", {})
+    return attempts
+
+
+def test_offline_encoding_falls_back_to_characters_once(offline_tiktoken):
+    assert conversation.count_tokens("x" * 40) == 11
+    assert conversation.count_tokens("y" * 8) == 3
+    assert len(offline_tiktoken) == 1
+
+
+def test_context_window_builds_without_an_encoding(offline_tiktoken):
+    history = [{"role": "user", "content": "Plan a leg day"}, {"role": "assistant", "content": "1. Squat"}]
+    messages, info = conversation.ContextWindow().build("You are a coach.", history, "Make it shorter")
+
+    assert messages[0] == {"role": "system", "content": "You are a coach."}
+    assert messages[-1] == {"role": "user", "content": "Make it shorter"}
+    assert info["input_tokens"] > 0
@@ -0,0 +1,121 @@
+import hashlib
+
+import pytest
+
+from utils.passwords import (
+    LoginLimiter,
+    LoginRateLimitedError,
+    PasswordService,
+    PasswordServiceBusyError,
+    check_password,
+    scrypt_hash,
+)
+
+# Cheap scrypt cost so the tests stay fast
+N, R, P = 1024, 8, 1
+
+
+@pytest.fixture
+def service():
+    return PasswordService(workers=2, n=N, r=R, p=P)
+
+
+def test_hash_and_verify(service):
+    stored = service.hash("hunter22")
+
+    assert stored.startswith(f"scrypt${N}${R}${P}$")
+    assert service.verify("hunter22", stored) == (True, False)
+    assert service.verify("hunter23", stored) == (False, False)
+
+
+def test_legacy_and_outdated_hashes_need_upgrade(service):
+    legacy = hashlib.sha256(b"hunter22").hexdigest()
+    outdated = scrypt_hash("hunter22", N * 2, R, P)
+
+    assert check_password("hunter22", legacy) == (True, "sha256")
+    assert service.verify("hunter22", legacy) == (True, True)
+    assert service.verify("hunter22", outdated) == (True, True)
+    assert service.verify("wrong", legacy) == (False, False)
+    assert service.stats()["upgrades_needed"] == 2
+
+
+def test_unknown_account_runs_a_dummy_check(service):
+    assert service.verify("anything", None) == (False, False)
+    assert service._dummy_hash.startswith(f"scrypt${N}$")
+    assert service.stats()["pending"] == 0
+
+
+def test_garbage_hash_never_matches():
+    assert check_password("x", "scrypt$not$a$valid$hash") == (False, None)
+    assert check_password("x", "plaintext") == (False, None)
+
+
+def test_overloaded_service_turns_requests_away():
+    service = PasswordService(workers=1, max_pending=0, n=N, r=R, p=P)
+    with pytest.raises(PasswordServiceBusyError):
+        service.hash("hunter22")
+    assert service.stats()["rejected"] == 1
+
+
+def test_email_lockout_and_reset_after_success():
+    limiter = LoginLimiter(email_burst=3, email_per_minute=1)
+    for _ in range(3):
+        limiter.check("Victim@School.edu", "10.0.0.1")
+    with pytest.raises(LoginRateLimitedError) as excinfo:
+        limiter.check("victim@school.edu ", "10.0.0.2")
+    assert excinfo.value.retry_after >= 1.0
+
+    limiter.succeeded("victim@school.edu")
+    limiter.check("victim@school.edu", "10.0.0.1")
+
+
+def test_ip_limit_refunds_the_email_attempt():
+    limiter = LoginLimiter(email_burst=2, ip_burst=1, ip_per_minute=1)
+    limiter.check("a@school.edu", "10.0.0.1")
+    with pytest.raises(LoginRateLimitedError):
+        limiter.check("b@school.edu", "10.0.0.1")
+    # b's failed attempt was not charged to b
+    limiter.check("b@school.edu", "10.0.0.2")
+    limiter.check("b@school.edu", "10.0.0.3")
+
+
+def test_limited_buckets_survive_key_flooding():
+    limiter = LoginLimiter(email_burst=2, email_per_minute=1, ip_burst=2, ip_per_minute=1, max_keys=10)
+    for _ in range(2):
+        limiter.check("victim@school.edu", "10.0.0.1")
+
+    # New IP keys (e.g. rotated forwarding headers) and new, idle email keys
+    for i in range(200):
+        try:
+            limiter.check("attacker@school.edu", f"192.168.{i // 256}.{i % 256}")
+        except LoginRateLimitedError:
+            pass
+        limiter.succeeded(f"user{i}@school.edu")
+
+    with pytest.raises(LoginRateLimitedError):
+        limiter.check("victim@school.edu", "10.0.0.9")
+    stats = limiter.stats()
+    # Idle (full) buckets were forgotten, so the stores stay bounded
+    assert stats["tracked_emails"] <= 10
+    assert stats["tracked_ips"] <= 10
+
+
+def test_forwarding_headers_need_trusted_proxies():
+    direct = LoginLimiter()
+    assert direct.client_ip("203.0.113.5", "1.2.3.4", "5.6.7.8") == "203.0.113.5"
+    assert direct.client_ip(None, "1.2.3.4") is None
+
+    one_proxy = LoginLimiter(trusted_proxy_hops=1)
+    assert one_proxy.client_ip("10.0.0.1", "spoofed, 198.51.100.7") == "198.51.100.7"
+    assert one_proxy.client_ip("10.0.0.1", None, "198.51.100.8") == "198.51.100.8"
+    assert one_proxy.client_ip("10.0.0.1") == "10.0.0.1"
+
+    two_proxies = LoginLimiter(trusted_proxy_hops=2)
+    assert two_proxies.client_ip("10.0.0.1", "spoofed, 198.51.100.7, 10.0.0.2") == "198.51.100.7"
+
+
+def test_unknown_client_skips_the_ip_bucket():
+    limiter = LoginLimiter(email_burst=100, ip_burst=1)
+    for i in range(5):
+        limiter.check(f"user{i}@school.edu", None)
+    assert limiter.stats()["tracked_ips"] == 0
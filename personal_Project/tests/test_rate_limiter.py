@@ -0,0 +1,72 @@
+import threading
+
+import pytest
+
+from utils.rate_limiter import GovernorBusyError, GovernorTimeoutError, LLMGovernor, TokenBucket
+
+TIMEOUT = 5
+
+
+def test_token_bucket_refills_and_refunds():
+    bucket = TokenBucket(rate=1000, capacity=10)
+    assert bucket.try_acquire(10)
+    assert not bucket.try_acquire(10)
+    assert bucket.wait_time(10) > 0
+    bucket.refund(100)
+    assert bucket.tokens == 10
+
+
+def test_concurrency_cap_queues_in_order():
+    governor = LLMGovernor(max_concurrent=1, poll_interval=0.01)
+    first = governor.acquire(10)
+    positions, admitted = [], threading.Event()
+
+    def waiter():
+        with governor.acquire(10, on_wait=lambda position, waited: positions.append(position)):
+            admitted.set()
+
+    thread = threading.Thread(target=waiter)
+    thread.start()
+    assert not admitted.wait(0.1)
+    first.release()
+    assert admitted.wait(TIMEOUT)
+    thread.join(TIMEOUT)
+
+    assert positions and set(positions) == {1}
+    stats = governor.stats()
+    assert stats["active"] == 0 and stats["admitted"] == 2
+
+
+def test_full_queue_and_timeout():
+    # Every request passes through the queue, so a zero-length queue turns everyone away
+    governor = LLMGovernor(max_queue=0)
+    with pytest.raises(GovernorBusyError):
+        governor.acquire(10)
+    assert governor.stats()["rejected"] == 1
+
+    governor = LLMGovernor(max_concurrent=1, queue_timeout=0.05, poll_interval=0.01)
+    held = governor.acquire(10)
+    with pytest.raises(GovernorTimeoutError):
+        governor.acquire(10)
+    assert governor.stats()["queue_depth"] == 0
+    held.release()
+
+
+def test_waiter_can_leave_the_queue():
+    governor = LLMGovernor(max_concurrent=1, poll_interval=0.01)
+    held = governor.acquire(10)
+
+    def leave(position, waited):
+        raise RuntimeError("cancelled")
+
+    with pytest.raises(RuntimeError):
+        governor.acquire(10, on_wait=leave)
+    assert governor.stats()["queue_depth"] == 0
+    held.release()
+
+
+def test_unused_token_reservation_is_refunded():
+    governor = LLMGovernor(tokens_per_minute=1000)
+    with governor.acquire(900) as permit:
+        permit.used_tokens = 100
+    assert governor.token_bucket.tokens >= 900
@@ -0,0 +1,112 @@
+import time
+import types
+
+import pytest
+
+from utils import sessions
+from utils.sessions import SESSION_QUERY_PARAM, SessionStore
+
+SECRET = b"test-secret"
+
+
+@pytest.fixture
+def store(tmp_path):
+    return SessionStore(tmp_path / "sessions.db", secret=SECRET, ttl_seconds=3600)
+
+
+def later(monkeypatch, seconds):
+    """Move utils.sessions' clock forward."""
+    now = time.time() + seconds
+    monkeypatch.setattr(sessions, "time", types.SimpleNamespace(time=lambda: now))
+
+
+def test_valid_token_resolves(store):
+    token = store.create("a@school.edu")
+
+    assert store.resolve(token) == "a@school.edu"
+    assert store.stats()["hits"] == 1
+
+
+@pytest.mark.parametrize("tamper", [
+    lambda sid, exp, sig: f"{sid}.{exp}.{sig[:-1]}{'A' if sig[-1] != 'A' else 'B'}",
+    lambda sid, exp, sig: f"{sid}.{int(exp) + 86400}.{sig}",
+    lambda sid, exp, sig: f"{sid[:-1]}{'A' if sid[-1] != 'A' else 'B'}.{exp}.{sig}",
+    lambda sid, exp, sig: f"{sid}.{exp}",
+    lambda sid, exp, sig: f"{sid}.soon.{sig}",
+    lambda sid, exp, sig: "",
+])
+def test_tampered_token_is_rejected(store, tamper):
+    token = store.create("a@school.edu")
+
+    assert store.resolve(tamper(*token.split("."))) is None
+    assert store.stats()["rejected"] == 1
+
+
+def test_token_signed_with_another_secret_is_rejected(store, tmp_path):
+    other = SessionStore(tmp_path / "other.db", secret=b"another-secret")
+    token = other.create("a@school.edu")
+
+    assert store.resolve(token) is None
+
+
+def test_expired_token_is_rejected(store, monkeypatch):
+    token = store.create("a@school.edu")
+    later(monkeypatch, 3601)
+
+    assert store.resolve(token) is None
+    assert store.stats()["rejected"] == 1
+
+
+def test_revoked_token_is_rejected(store, tmp_path):
+    token = store.create("a@school.edu")
+    store.revoke(token)
+
+    assert store.resolve(token) is None
+    # Also by a process that starts later and only has the database
+    assert SessionStore(tmp_path / "sessions.db", secret=SECRET).resolve(token) is None
+
+
+def test_sessions_survive_cache_eviction(tmp_path):
+    store = SessionStore(tmp_path / "sessions.db", secret=SECRET, max_cached=1)
+    first = store.create("a@school.edu")
+    store.create("b@school.edu")
+
+    assert store.resolve(first) == "a@school.edu"
+    assert store.stats()["misses"] == 1
+
+
+class FakeUserStore:
+    def __init__(self, users):
+        self.users = users
+
+    def get(self, email):
+        return self.users.get(email)
+
+
+@pytest.fixture
+def page_helpers(store, monkeypatch):
+    monkeypatch.setattr(sessions, "get_session_store", lambda: store)
+    monkeypatch.setattr(sessions, "get_user_store", lambda: FakeUserStore({"a@school.edu": {"name": "A"}}))
+
+
+def test_restore_session_after_refresh(page_helpers):
+    session_state, query_params = {}, {}
+    sessions.start_session(session_state, query_params, "a@school.edu")
+
+    # Browser refresh: session state is gone, the URL keeps the token
+    refreshed = {}
+    assert sessions.restore_session(refreshed, dict(query_params))
+    assert refreshed["user_email"] == "a@school.edu"
+    assert refreshed["user_data"] == {"name": "A"}
+
+
+def test_forged_or_ended_session_is_dropped_from_url(page_helpers):
+    query_params = {SESSION_QUERY_PARAM: "forged.1.sig"}
+    assert not sessions.restore_session({}, query_params)
+    assert SESSION_QUERY_PARAM not in query_params
+
+    session_state, query_params = {}, {}
+    sessions.start_session(session_state, query_params, "a@school.edu")
+    token = query_params[SESSION_QUERY_PARAM]
+    sessions.end_session(session_state, query_params)
+    assert not sessions.restore_session({}, {SESSION_QUERY_PARAM: token})
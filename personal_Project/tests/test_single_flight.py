@@ -0,0 +1,126 @@
+import threading
+import time
+
+import pytest
+
+from utils.cancellation import CancelToken, CancellationRegistry, RequestCancelled
+from utils.single_flight import SingleFlight
+
+TIMEOUT = 5
+
+
+def gated_producer(gate, chunks, calls, finished):
+    """Producer that waits for gate before each chunk and records how it ended."""
+    def producer(flight):
+        calls.append(flight)
+        try:
+            for chunk in chunks:
+                assert gate.wait(TIMEOUT)
+                gate.clear()
+                if flight.cancel_token.cancelled:
+                    return
+                yield chunk
+        finally:
+            finished.set()
+    return producer
+
+
+def test_identical_requests_share_one_upstream_call():
+    group = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def producer(flight):
+        calls.append(flight)
+        assert release.wait(TIMEOUT)
+        yield "a"
+        yield "b"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append("".join(group.stream("k", producer))))
+               for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    deadline = time.monotonic() + TIMEOUT
+    while group.stats()["coalesced_requests"] < 2 and time.monotonic() < deadline:
+        time.sleep(0.001)
+    release.set()
+    for thread in threads:
+        thread.join(TIMEOUT)
+
+    assert results == ["ab"] * 3
+    assert len(calls) == 1
+    assert group.stats()["in_flight"] == 0
+
+
+def test_producer_errors_reach_every_subscriber():
+    group = SingleFlight()
+
+    def producer(flight):
+        yield "a"
+        raise RuntimeError("upstream failed")
+
+    with pytest.raises(RuntimeError, match="upstream failed"):
+        list(group.stream("k", producer))
+
+
+def test_cancelled_last_subscriber_cancels_the_flight():
+    group = SingleFlight()
+    gate, finished, calls = threading.Event(), threading.Event(), []
+    token = CancelToken()
+    stream = group.stream("k", gated_producer(gate, ["a", "b", "c"], calls, finished), cancel_token=token)
+
+    gate.set()
+    assert next(stream) == "a"
+    token.cancel("clear_chat")
+    with pytest.raises(RequestCancelled):
+        next(stream)
+    gate.set()
+
+    assert finished.wait(TIMEOUT)
+    assert calls[0].cancel_token.reason == "clear_chat"
+    assert group.stats()["cancelled_flights"] == 1
+
+
+def test_flight_keeps_running_while_someone_still_reads_it():
+    group = SingleFlight()
+    gate, finished, calls = threading.Event(), threading.Event(), []
+    producer = gated_producer(gate, ["a", "b"], calls, finished)
+    leaving = group.stream("k", producer)
+    staying = group.stream("k", producer)
+
+    gate.set()
+    assert next(leaving) == "a"
+    assert next(staying) == "a"
+    # Closing a generator is what Streamlit does to an interrupted run's stream
+    leaving.close()
+    gate.set()
+
+    assert list(staying) == ["b"]
+    assert not calls[0].cancel_token.cancelled
+
+
+def test_abandoned_stream_cancels_upstream():
+    group = SingleFlight()
+    gate, finished, calls = threading.Event(), threading.Event(), []
+    stream = group.stream("k", gated_producer(gate, ["a", "b"], calls, finished))
+
+    gate.set()
+    assert next(stream) == "a"
+    stream.close()
+    gate.set()
+
+    assert finished.wait(TIMEOUT)
+    assert calls[0].cancel_token.reason == "abandoned"
+
+
+def test_registry_cancels_only_the_sessions_open_requests():
+    registry = CancellationRegistry()
+    mine, theirs = registry.open("session-1"), registry.open("session-2")
+    done = registry.open("session-1")
+    registry.close(done)
+
+    assert registry.cancel_session("session-1", "abandoned") == 1
+    assert mine.reason == "abandoned"
+    assert not theirs.cancelled and not done.cancelled
+    assert registry.stats()["open_requests"] == 1
@@ -0,0 +1,78 @@
+import os
+
+from utils.transcripts import INDEX_RECORD, TranscriptStore
+
+EMAIL = "Student@School.edu"
+
+
+def make_store(tmp_path, **kwargs):
+    return TranscriptStore(tmp_path / "transcripts", **kwargs)
+
+
+def append_messages(store, count, start=0):
+    for i in range(start, start + count):
+        store.append(EMAIL, {"role": "user" if i % 2 == 0 else "assistant", "content": f"message {i}"})
+
+
+def contents(store, **kwargs):
+    messages, _ = store.read_page(EMAIL, limit=100, **kwargs)
+    return [message["content"] for message in messages]
+
+
+def test_pages_are_read_from_the_end(tmp_path):
+    store = make_store(tmp_path, segment_bytes=64)
+    append_messages(store, 7)
+
+    messages, start = store.read_page(EMAIL, limit=3)
+    assert [m["content"] for m in messages] == ["message 4", "message 5", "message 6"]
+    assert start == 4
+    older, start = store.read_page(EMAIL, before=start, limit=3)
+    assert [m["content"] for m in older] == ["message 1", "message 2", "message 3"]
+    assert start == 1
+    # Small segments rolled over, so the page above spans several files
+    assert len(list(store._user_dir(EMAIL).glob("seg-*.jsonl"))) > 1
+
+
+def test_truncated_index_tail_is_ignored_and_repaired(tmp_path):
+    store = make_store(tmp_path)
+    append_messages(store, 3)
+    index_path = store._user_dir(EMAIL) / "index.bin"
+    # Crash in the middle of writing the last index record
+    with open(index_path, "r+b") as f:
+        f.truncate(3 * INDEX_RECORD.size - 5)
+
+    assert store.count(EMAIL) == 2
+    assert contents(store) == ["message 0", "message 1"]
+
+    append_messages(store, 1, start=3)
+    assert os.path.getsize(index_path) == 3 * INDEX_RECORD.size
+    assert contents(store) == ["message 0", "message 1", "message 3"]
+
+
+def test_segment_data_without_index_record_stays_invisible(tmp_path):
+    store = make_store(tmp_path)
+    append_messages(store, 2)
+    # Crash after the data was written but before its index record
+    with open(store._user_dir(EMAIL) / "seg-000001.jsonl", "ab") as f:
+        f.write(b'{"role": "user", "content": "torn')
+
+    assert contents(store) == ["message 0", "message 1"]
+    append_messages(store, 1, start=2)
+    assert contents(store) == ["message 0", "message 1", "message 2"]
+
+
+def test_clear_and_unknown_users(tmp_path):
+    store = make_store(tmp_path)
+    assert store.read_page("nobody@school.edu") == ([], 0)
+    append_messages(store, 2)
+    store.clear(EMAIL)
+    assert store.count(EMAIL) == 0
+
+
+def test_every_spelling_of_an_email_shares_one_log_and_lock(tmp_path):
+    store = make_store(tmp_path)
+    store.append(EMAIL, {"role": "user", "content": "first"})
+    store.append(f"  {EMAIL.lower()} ", {"role": "assistant", "content": "second"})
+
+    assert store._lock_for(EMAIL) is store._lock_for(EMAIL.upper())
+    assert contents(store) == ["first", "second"]
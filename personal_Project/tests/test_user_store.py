@@ -0,0 +1,81 @@
+import pytest
+
+from utils.user_store import CachedUserStore, JsonUserStore, SQLiteUserStore
+
+
+@pytest.fixture
+def sqlite_path(tmp_path):
+    return tmp_path / "users.db"
+
+
+@pytest.fixture
+def cached(sqlite_path):
+    store = CachedUserStore(SQLiteUserStore(sqlite_path), max_records=2)
+    yield store
+    store.close()
+
+
+def user(name, password="hash"):
+    return {"name": name, "password": password, "fitness_level": "Beginner"}
+
+
+def test_reads_are_cached_copies(cached):
+    cached.create("a@school.edu", user("A"))
+    first = cached.get("a@school.edu")
+    first["name"] = "changed by a session"
+
+    assert cached.get("a@school.edu")["name"] == "A"
+    assert cached.stats()["hits"] == 2
+
+
+def test_writes_through_the_cache_update_it_in_place(cached):
+    cached.create("a@school.edu", user("A"))
+    cached.get("a@school.edu")
+    cached.update("a@school.edu", {"fitness_level": "Advanced"})
+
+    assert cached.get("a@school.edu")["fitness_level"] == "Advanced"
+    assert cached.stats()["invalidations"] == 0
+
+
+def test_write_by_another_process_invalidates(cached, sqlite_path):
+    cached.create("a@school.edu", user("A"))
+    assert cached.get("a@school.edu")["name"] == "A"
+
+    other = SQLiteUserStore(sqlite_path)
+    try:
+        other.update("a@school.edu", {"name": "Renamed"})
+    finally:
+        other.close()
+
+    assert cached.get("a@school.edu")["name"] == "Renamed"
+    assert cached.stats()["invalidations"] == 1
+
+
+def test_cache_is_bounded(cached):
+    for name in "abc":
+        cached.create(f"{name}@school.edu", user(name))
+    for name in "abc":
+        cached.get(f"{name}@school.edu")
+
+    stats = cached.stats()
+    assert stats["cached_records"] == 2
+    assert stats["evictions"] >= 1
+    assert cached.get("a@school.edu")["name"] == "a"
+
+
+def test_password_hash_lookup_does_not_cache_records(cached):
+    cached.backend.put("a@school.edu", user("A", password="scrypt$x"))
+
+    assert cached.get_password_hash("a@school.edu") == "scrypt$x"
+    assert cached.get_password_hash("missing@school.edu") is None
+    assert cached.stats()["cached_records"] == 0
+
+
+def test_json_backend_sees_file_changes(tmp_path):
+    path = tmp_path / "users.json"
+    cached = CachedUserStore(JsonUserStore(path))
+    cached.create("a@school.edu", user("A"))
+    assert cached.get("a@school.edu")["name"] == "A"
+
+    JsonUserStore(path).put("a@school.edu", user("Edited by hand, longer name"))
+    assert cached.get("a@school.edu")["name"] == "Edited by hand, longer name"
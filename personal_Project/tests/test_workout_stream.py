@@ -0,0 +1,117 @@
+import json
+
+import pytest
+
+from utils.workout_stream import IncrementalWorkoutParser, parse_workout_json, render_workout_markdown
+
+PLAN = {
+    "title": "Push / Pull",
+    "days": [
+        {
+            "day": "Monday",
+            "focus": "Push {chest}",
+            "exercises": [
+                {"name": "Bench Press", "sets": 4, "reps": "8-10", "rest": "90 sec", "weight": "45-65 lbs",
+                 "description": "Lower the bar to mid-chest, then press.", "form_tips": ["Feet flat", "Elbows at 45°"]},
+                {"name": "Dips \"weighted\"", "sets": "3", "reps": 12, "form_tips": []},
+            ],
+        },
+        {
+            "day": "Wednesday",
+            "focus": "Pull",
+            "exercises": [
+                {"name": "Rowing Machine", "sets": 1, "reps": "10 min", "description": "Steady pace, [easy]."},
+            ],
+        },
+    ],
+    "notes": "Warm up for 5 minutes.",
+}
+
+
+def feed_in_chunks(text, size):
+    parser = IncrementalWorkoutParser()
+    streamed = []
+    for i in range(0, len(text), size):
+        streamed.extend(parser.feed(text[i:i + size]))
+    return parser, streamed
+
+
+def strip_tags(exercise):
+    return {key: value for key, value in exercise.items() if key not in ("day", "focus", "day_index")}
+
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 7, 64, 10000])
+def test_incremental_exercises_match_full_parse(chunk_size):
+    text = json.dumps(PLAN, ensure_ascii=False, indent=2)
+    parser, streamed = feed_in_chunks(text, chunk_size)
+    plan = parse_workout_json(text)
+
+    expected = [(day["day"], day["focus"], exercise) for day in plan["days"] for exercise in day["exercises"]]
+    assert [(e["day"], e["focus"], strip_tags(e)) for e in streamed] == expected
+    assert [e["day_index"] for e in streamed] == [0, 0, 1]
+    assert parser.result() == plan
+
+
+def test_partial_plan_keeps_completed_exercises():
+    text = json.dumps(PLAN)
+    cut = text.index("Rowing Machine")
+    parser, streamed = feed_in_chunks(text[:cut], 5)
+
+    assert parser.result() is None
+    partial = parser.partial_plan()
+    assert [day["day"] for day in partial["days"]] == ["Monday"]
+    assert [strip_tags(e) for e in partial["days"][0]["exercises"]] == PLAN["days"][0]["exercises"]
+    render_workout_markdown(partial)
+
+
+def test_malformed_days_and_exercises_are_dropped():
+    text = json.dumps({
+        "title": 7,
+        "days": [
+            "Monday legs",
+            {"day": "Tuesday", "focus": ["x"], "exercises": [
+                "Squat", {"name": ""}, {"sets": 3}, {"name": "Lunge", "sets": True, "reps": {"x": 1},
+                                                     "rest": 60, "form_tips": "Knee over toes"},
+            ]},
+            {"day": "Friday", "exercises": "none"},
+        ],
+    })
+    plan = parse_workout_json(text)
+
+    assert plan == {
+        "title": "",
+        "days": [
+            {"day": "Tuesday", "focus": None, "exercises": [{"name": "Lunge"}]},
+            {"day": "Friday", "focus": None, "exercises": []},
+        ],
+        "notes": "",
+    }
+    assert "Lunge" in render_workout_markdown(plan)
+    _, streamed = feed_in_chunks(text, 4)
+    assert [strip_tags(e) for e in streamed] == [{"name": "Lunge"}]
+
+
+@pytest.mark.parametrize("text", [
+    '{"title": "x", "days": ["Monday legs"]}',
+    '{"title": "x", "days": []}',
+    '{"title": "x", "days": {"day": "Monday"}}',
+    "Sorry, I can't help with that.",
+    '{"days": [{"exercises": [{"name": "A"}',
+])
+def test_unusable_responses_fall_back_to_text(text):
+    assert parse_workout_json(text) is None
+
+
+def test_invalid_string_literal_does_not_break_feed():
+    parser, streamed = feed_in_chunks('{"days": [{"day": "Mon\\q", "exercises": [{"name": "Squat"}]}]}', 2)
+
+    assert [e["name"] for e in streamed] == ["Squat"]
+    assert streamed[0]["day"] is None
+
+
+def test_cut_off_notice_is_rendered_after_the_plan():
+    parser, _ = feed_in_chunks(json.dumps(PLAN)[:-40], 8)
+    plan = parser.partial_plan()
+    plan["notice"] = "⚠️ Cut off"
+
+    assert render_workout_markdown(plan).endswith("\n\n⚠️ Cut off")
@@ -0,0 +1,3 @@
+"""
+MyGymBro shared helpers used by the Streamlit pages.
+"""
@@ -0,0 +1,125 @@
+"""
+MyGymBro - Request Cancellation
+
+A CancelToken belongs to one chat request (request id) of one browser
+session. Cancelling it wakes the request's single-flight subscription, which
+then leaves the flight. When the last subscriber leaves an unfinished flight,
+the flight's own upstream token is cancelled: the backend closes the HTTP
+response, a request still queued in the LLM governor leaves the queue, and
+the governor slot is released. Nobody pays for max_tokens of an answer that
+nobody will read.
+
+Every way a student stops reading an answer - Clear Chat, Logout, leaving
+the main app, any click that reruns the script mid-answer - interrupts the
+script run, and Streamlit closes the interrupted run's stream before the next
+run starts. The subscription then leaves its flight with the reason
+"abandoned", so that one reason covers all of these; the new run cannot tell
+them apart at that point. Pages also register each streaming request in the
+process-wide registry under the session id and cancel whatever is still open
+at the start of the next run (also as "abandoned"), in case a stream was not
+closed in time. Other reasons only come from code that cancels a token
+explicitly.
+"""
+
+import threading
+import uuid
+
+
+class RequestCancelled(Exception):
+    """Raised in a consumer or producer whose request was cancelled."""
+
+
+class CancelToken:
+    """Cancellation flag with callbacks (run once, on the cancelling thread)."""
+
+    def __init__(self, request_id=None, session_id=None):
+        self.request_id = request_id or uuid.uuid4().hex
+        self.session_id = session_id
+        self.reason = None
+        self._lock = threading.Lock()
+        self._callbacks = []
+
+    @property
+    def cancelled(self):
+        return self.reason is not None
+
+    def cancel(self, reason="cancelled"):
+        """Cancel with reason. Returns False if the token was already cancelled."""
+        with self._lock:
+            if self.reason is not None:
+                return False
+            self.reason = reason
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception:
+                # e.g. closing an HTTP response that already finished
+                pass
+        return True
+
+    def add_callback(self, callback):
+        """Run callback() on cancellation (right away if already cancelled)."""
+        with self._lock:
+            if self.reason is None:
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def raise_if_cancelled(self):
+        if self.reason is not None:
+            raise RequestCancelled(self.reason)
+
+
+class CancellationRegistry:
+    """Open requests per session, so a later run of the same session can cancel them."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # session id -> {request id: token}
+        self._sessions = {}
+        self.opened = 0
+        self.cancelled = 0
+
+    def open(self, session_id):
+        """Register and return a token for a new request of session_id."""
+        token = CancelToken(session_id=session_id)
+        with self._lock:
+            self._sessions.setdefault(session_id, {})[token.request_id] = token
+            self.opened += 1
+        return token
+
+    def close(self, token):
+        """Forget a finished (or cancelled) request."""
+        with self._lock:
+            requests = self._sessions.get(token.session_id)
+            if requests is not None:
+                requests.pop(token.request_id, None)
+                if not requests:
+                    del self._sessions[token.session_id]
+
+    def cancel_session(self, session_id, reason):
+        """Cancel every open request of session_id. Returns how many were cancelled."""
+        with self._lock:
+            tokens = list(self._sessions.pop(session_id, {}).values())
+        count = sum(1 for token in tokens if token.cancel(reason))
+        with self._lock:
+            self.cancelled += count
+        return count
+
+    def stats(self):
+        """Return counters for monitoring."""
+        with self._lock:
+            return {
+                "open_requests": sum(len(requests) for requests in self._sessions.values()),
+                "opened": self.opened,
+                "cancelled": self.cancelled,
+            }
+
+
+_registry = CancellationRegistry()
+
+
+def get_cancellation_registry():
+    """Return the process-wide registry of cancellable requests."""
+    return _registry
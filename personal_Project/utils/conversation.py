@@ -0,0 +1,186 @@
+"""
+MyGymBro - Conversation Context Window
+
+Builds the message list for each chat request from the conversation so far,
+so follow-ups like "make it shorter" keep their context without prompts
+growing with the conversation:
+- the most recent turns are sent verbatim (rolling window)
+- older turns are folded into a compact extractive memory (one line per turn,
+  no extra API call) sent as a second system message
+- everything is counted in tokens and kept under a fixed input budget
+
+Tokens are counted with tiktoken when it is installed and its encoding can be
+loaded (imported lazily; the encoding file is downloaded on first use),
+otherwise estimated at about 4 characters per token.
+
+Settings (env vars):
+- CONTEXT_MAX_INPUT_TOKENS: input budget per request incl. system prompt (default 6000)
+- CONTEXT_RECENT_MESSAGES: max recent messages sent verbatim (default 8)
+- CONTEXT_SUMMARY_TOKENS: budget for the memory of older turns (default 600)
+"""
+
+import os
+import re
+import threading
+
+# Per-message framing overhead in the chat format (role, separators) and reply priming
+MESSAGE_OVERHEAD_TOKENS = 4
+REPLY_PRIMING_TOKENS = 2
+SUMMARY_LINE_CHARS = 160
+
+_encodings = {}
+_encodings_lock = threading.Lock()
+
+
+def _get_encoding(model):
+    """Return a cached tiktoken encoding for model, or None if tiktoken or its data is unavailable."""
+    if model in _encodings:
+        return _encodings[model]
+    with _encodings_lock:
+        if model not in _encodings:
+            try:
+                import tiktoken
+            except ImportError:
+                encoding = None
+            else:
+                try:
+                    try:
+                        encoding = tiktoken.encoding_for_model(model)
+                    except KeyError:
+                        encoding = tiktoken.get_encoding("o200k_base")
+                except Exception:
+                    # The BPE file is downloaded on first use; offline setups (stub server, Ollama) cannot
+                    # fetch it. Cached as None, so later requests count characters instead of retrying.
+                    encoding = None
+            _encodings[model] = encoding
+    return _encodings[model]
+
+
+def count_tokens(text, model="gpt-4o-mini"):
+    """Count tokens in text (tiktoken if available, else about 4 characters per token)."""
+    encoding = _get_encoding(model)
+    if encoding is None:
+        return len(text) // 4 + 1
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def count_message_tokens(messages, model="gpt-4o-mini"):
+    """Count the prompt tokens of a chat message list, including framing overhead."""
+    return sum(count_tokens(m["content"], model) + MESSAGE_OVERHEAD_TOKENS for m in messages) + REPLY_PRIMING_TOKENS
+
+
+def _message_text(message):
+    """Text a stored chat message contributes to the context (custom workouts keep their real prompt)."""
+    return message.get("prompt") or message["content"]
+
+
+def _is_usable(message):
+    # Error replies carry no useful context
+    return message["role"] in ("user", "assistant") and not message["content"].startswith("⚠️")
+
+
+def _shorten(text, limit=SUMMARY_LINE_CHARS):
+    text = re.sub(r"\s+", " ", text).strip()
+    return text if len(text) <= limit else text[:limit - 3].rstrip() + "..."
+
+
+def summarize_message(message):
+    """One memory line for an older message: the question, or what the answer contained."""
+    if message["role"] == "user":
+        return "User: " + _shorten(_message_text(message))
+    workout = message.get("workout")
+    if workout:
+        names = [e.get("name", "") for day in workout.get("days", []) for e in day.get("exercises", [])]
+        title = workout.get("title") or "workout plan"
+        return "MyGymBro: gave " + _shorten(f"{title}: {', '.join(names)}")
+    parsed = message.get("parsed")
+    if parsed and parsed.get("exercises"):
+        return "MyGymBro: gave workout: " + _shorten(", ".join(e["name"] for e in parsed["exercises"]))
+    # First sentence of a free-text answer
+    first_sentence = re.split(r"(?<=[.!?])\s", message["content"].strip(), maxsplit=1)[0]
+    return "MyGymBro: " + _shorten(first_sentence)
+
+
+class ContextWindow:
+    """Token-budgeted context of recent turns plus a compact memory of older ones."""
+
+    def __init__(self, max_input_tokens=6000, recent_messages=8, summary_tokens=600, model="gpt-4o-mini"):
+        self.max_input_tokens = max_input_tokens
+        self.recent_messages = recent_messages
+        self.summary_tokens = summary_tokens
+        self.model = model
+
+    def build(self, system_prompt, history, question):
+        """
+        Return (messages, info) for a request. history is the stored chat before
+        the current question; info reports token use and what was kept or folded.
+        """
+        model = self.model
+        system_message = {"role": "system", "content": system_prompt}
+        question_message = {"role": "user", "content": question}
+        used = count_message_tokens([system_message, question_message], model)
+        usable = [m for m in history if _is_usable(m)]
+
+        # Newest turns verbatim while they fit
+        recent = []
+        index = len(usable)
+        while index > 0 and len(recent) < self.recent_messages:
+            message = usable[index - 1]
+            entry = {"role": message["role"], "content": _message_text(message)}
+            cost = count_tokens(entry["content"], model) + MESSAGE_OVERHEAD_TOKENS
+            if used + cost > self.max_input_tokens - self.summary_tokens:
+                break
+            recent.append(entry)
+            used += cost
+            index -= 1
+        recent.reverse()
+        # Never start the window with a dangling answer
+        if recent and recent[0]["role"] == "assistant" and index > 0:
+            used -= count_tokens(recent[0]["content"], model) + MESSAGE_OVERHEAD_TOKENS
+            recent.pop(0)
+            index += 1
+
+        # Older turns become memory lines, newest first, until the memory budget is spent
+        memory_lines = []
+        summary_budget = min(self.summary_tokens, self.max_input_tokens - used)
+        memory_used = MESSAGE_OVERHEAD_TOKENS + count_tokens("Earlier in this conversation:", model)
+        for message in reversed(usable[:index]):
+            line = summarize_message(message)
+            cost = count_tokens(line, model) + 1
+            if memory_used + cost > summary_budget:
+                break
+            memory_lines.append(line)
+            memory_used += cost
+        memory_lines.reverse()
+
+        messages = [system_message]
+        if memory_lines:
+            messages.append({"role": "system", "content": "Earlier in this conversation:\n" + "\n".join(memory_lines)})
+            used += memory_used
+        messages.extend(recent)
+        messages.append(question_message)
+        info = {
+            "input_tokens": used,
+            "recent_messages": len(recent),
+            "summarized_messages": len(memory_lines),
+            "dropped_messages": index - len(memory_lines),
+        }
+        return messages, info
+
+
+_context_window = None
+_context_window_lock = threading.Lock()
+
+
+def get_context_window():
+    """Return the process-wide context window settings."""
+    global _context_window
+    if _context_window is None:
+        with _context_window_lock:
+            if _context_window is None:
+                _context_window = ContextWindow(
+                    max_input_tokens=int(os.getenv("CONTEXT_MAX_INPUT_TOKENS", "6000")),
+                    recent_messages=int(os.getenv("CONTEXT_RECENT_MESSAGES", "8")),
+                    summary_tokens=int(os.getenv("CONTEXT_SUMMARY_TOKENS", "600")),
+                )
+    return _context_window
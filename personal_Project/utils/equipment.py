@@ -0,0 +1,405 @@
+"""
+MyGymBro - Gym Equipment Catalog
+
+Parses data/GymMachineList.xlsx once into a compact tuple of Equipment rows
+and caches the summary string that goes into every AI system prompt.
+The workbook is only re-read when its mtime/size changes, and only re-parsed
+when its content hash actually differs.
+
+Parsed rows are also compiled into a binary sidecar next to the workbook
+(GymMachineList.equipment.bin). Later loads - including fresh processes -
+memory-map the sidecar and never import pandas/openpyxl; the Excel stack is
+only imported when the workbook changed and the sidecar has to be rebuilt.
+Prebuild the sidecar at deploy time with:
+
+    python -m utils.equipment build [--workbook data/GymMachineList.xlsx] [--force]
+"""
+
+import argparse
+import hashlib
+import logging
+import math
+import mmap
+import os
+import struct
+import threading
+import time
+from pathlib import Path
+from typing import NamedTuple, Optional, Union
+
+from utils import metrics
+from utils.instrumentation import timed
+
+logger = logging.getLogger(__name__)
+
+# Data directory setup
+DATA_DIR = Path("data")
+EQUIPMENT_FILE = DATA_DIR / "GymMachineList.xlsx"
+
+EQUIPMENT_UNAVAILABLE = "Equipment data not available"
+
+# Placeholder list written to disk when no workbook exists yet
+SAMPLE_EQUIPMENT = {
+    'Equipment': ['Bench Press', 'Squat Rack', 'Dumbbells', 'Barbells', 'Treadmill', 'Rowing Machine'],
+    'Quantity': [2, 1, 10, 4, 3, 2],
+    'Location': ['Main Area', 'Main Area', 'Free Weights', 'Free Weights', 'Cardio Zone', 'Cardio Zone'],
+    'Status': ['Available', 'Available', 'Available', 'Available', 'Available', 'Available']
+}
+
+
+class Equipment(NamedTuple):
+    """One row of the gym equipment list."""
+    name: str
+    quantity: Union[str, float, None]
+    min_weight: Optional[float]
+    max_weight: Optional[float]
+
+
+def _clean_cell(value):
+    """Normalize an Excel cell: empty/NaN becomes None, whole floats become ints."""
+    if value is None:
+        return None
+    if isinstance(value, float):
+        if math.isnan(value):
+            return None
+        if value.is_integer():
+            return int(value)
+    if isinstance(value, str) and not value.strip():
+        return None
+    return value
+
+
+def _format_value(value):
+    return "N/A" if value is None else str(value)
+
+
+def render_equipment_summary(items):
+    """Render equipment rows as the bullet list used in AI prompts."""
+    equipment_list = []
+    for item in items:
+        weight_info = ""
+        if item.min_weight is not None and item.max_weight is not None:
+            weight_info = f" ({item.min_weight}-{item.max_weight} lbs)"
+        equipment_list.append(f"- {item.name} (Qty: {_format_value(item.quantity)}{weight_info})")
+    return "\n".join(equipment_list)
+
+
+def _records_to_items(records):
+    """Convert workbook rows (dicts keyed by column name) into Equipment tuples."""
+    items = []
+    for row in records:
+        # Handle different column structures
+        name = _clean_cell(row.get('Machine', row.get('Equipment')))
+        items.append(Equipment(
+            name=str(name) if name is not None else 'Unknown',
+            quantity=_clean_cell(row.get('Quantity')),
+            min_weight=_clean_cell(row.get('Min_Weights(lbs)')),
+            max_weight=_clean_cell(row.get('Max_weights(lbs)')),
+        ))
+    return tuple(items)
+
+
+def read_workbook(path):
+    """Parse the Excel workbook into Equipment rows (imports pandas/openpyxl)."""
+    import pandas as pd
+
+    df = pd.read_excel(path)
+    return _records_to_items(df.to_dict("records"))
+
+
+def write_sample_workbook(path):
+    """Create a sample equipment workbook so the app has something to show."""
+    import pandas as pd
+
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    pd.DataFrame(SAMPLE_EQUIPMENT).to_excel(path, index=False)
+
+
+# Sidecar layout (little endian):
+#   header: magic, format version, workbook sha256, workbook size, workbook mtime_ns, row count
+#   rows:   name, quantity, min_weight, max_weight as tagged values
+SIDECAR_MAGIC = b"MGBEQUIP"
+SIDECAR_VERSION = 1
+_HEADER = struct.Struct("<8sH32sQqI")
+_TAG = struct.Struct("<B")
+_INT = struct.Struct("<q")
+_FLOAT = struct.Struct("<d")
+_LEN = struct.Struct("<I")
+_TAG_NONE, _TAG_INT, _TAG_FLOAT, _TAG_STR = 0, 1, 2, 3
+
+
+def sidecar_path_for(workbook_path):
+    """Return the sidecar path that belongs to a workbook."""
+    workbook_path = Path(workbook_path)
+    return workbook_path.with_name(workbook_path.stem + ".equipment.bin")
+
+
+def _pack_value(value):
+    if value is None:
+        return _TAG.pack(_TAG_NONE)
+    if isinstance(value, bool):
+        value = int(value)
+    if isinstance(value, int) and -(2 ** 63) <= value < 2 ** 63:
+        return _TAG.pack(_TAG_INT) + _INT.pack(value)
+    if isinstance(value, float):
+        return _TAG.pack(_TAG_FLOAT) + _FLOAT.pack(value)
+    encoded = str(value).encode("utf-8")
+    return _TAG.pack(_TAG_STR) + _LEN.pack(len(encoded)) + encoded
+
+
+def _unpack_value(buffer, offset):
+    (tag,) = _TAG.unpack_from(buffer, offset)
+    offset += _TAG.size
+    if tag == _TAG_NONE:
+        return None, offset
+    if tag == _TAG_INT:
+        return _INT.unpack_from(buffer, offset)[0], offset + _INT.size
+    if tag == _TAG_FLOAT:
+        return _FLOAT.unpack_from(buffer, offset)[0], offset + _FLOAT.size
+    if tag == _TAG_STR:
+        (length,) = _LEN.unpack_from(buffer, offset)
+        offset += _LEN.size
+        return bytes(buffer[offset:offset + length]).decode("utf-8"), offset + length
+    raise ValueError(f"Unknown sidecar value tag {tag}")
+
+
+def write_sidecar(path, items, sha256_hex, stamp):
+    """Write Equipment rows to a sidecar file (atomically replaced)."""
+    path = Path(path)
+    size, mtime_ns = stamp[1], stamp[0]
+    chunks = [_HEADER.pack(SIDECAR_MAGIC, SIDECAR_VERSION, bytes.fromhex(sha256_hex), size, mtime_ns, len(items))]
+    for item in items:
+        chunks.extend(_pack_value(value) for value in item)
+    tmp_path = path.with_name(path.name + f".tmp{os.getpid()}")
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(b"".join(chunks))
+        os.replace(tmp_path, path)
+    except OSError:
+        # Do not leave a half-written temp file behind on a full disk
+        tmp_path.unlink(missing_ok=True)
+        raise
+
+
+def read_sidecar_header(path):
+    """Return (sha256_hex, (mtime_ns, size)) from a sidecar, or None if missing/invalid."""
+    try:
+        with open(path, 'rb') as f:
+            header = f.read(_HEADER.size)
+    except FileNotFoundError:
+        return None
+    if len(header) != _HEADER.size:
+        return None
+    magic, version, sha256, size, mtime_ns, _ = _HEADER.unpack(header)
+    if magic != SIDECAR_MAGIC or version != SIDECAR_VERSION:
+        return None
+    return sha256.hex(), (mtime_ns, size)
+
+
+def read_sidecar(path):
+    """Read Equipment rows from a sidecar file via mmap."""
+    with open(path, 'rb') as f:
+        try:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (ValueError, OSError):
+            # Empty files and some filesystems cannot be mapped
+            buffer = f.read()
+        try:
+            magic, version, _, _, _, count = _HEADER.unpack_from(buffer, 0)
+            if magic != SIDECAR_MAGIC or version != SIDECAR_VERSION:
+                raise ValueError("Not an equipment sidecar file")
+            offset = _HEADER.size
+            items = []
+            for _ in range(count):
+                values = []
+                for _ in range(4):
+                    value, offset = _unpack_value(buffer, offset)
+                    values.append(value)
+                items.append(Equipment(*values))
+            return tuple(items)
+        finally:
+            if isinstance(buffer, mmap.mmap):
+                buffer.close()
+
+
+def _file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(65536), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class EquipmentCatalog:
+    """Process-wide cache of the parsed equipment workbook and its prompt summary."""
+
+    def __init__(self, path=EQUIPMENT_FILE):
+        self.path = Path(path)
+        self.sidecar_path = sidecar_path_for(self.path)
+        self._lock = threading.Lock()
+        self._stamp = None
+        self.items = None
+        self.summary = EQUIPMENT_UNAVAILABLE
+        self.fingerprint = None
+        self.error = None
+        self.sidecar_error = None
+        self.load_seconds = 0.0
+        self.loaded_at = None
+        self.loads = 0
+        self.rebuilds = 0
+        self.hits = 0
+        self.source = None
+
+    def _current_stamp(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    @timed("equipment_refresh")
+    def refresh(self):
+        """Reload the workbook if it changed on disk. Returns the current Equipment rows (or None)."""
+        with self._lock:
+            stamp = self._current_stamp()
+            if stamp is not None and stamp == self._stamp:
+                self.hits += 1
+                metrics.EQUIPMENT_CACHE.labels("hit").inc()
+                return self.items
+
+            start = time.perf_counter()
+            try:
+                if stamp is None:
+                    write_sample_workbook(self.path)
+                    stamp = self._current_stamp()
+                self._load(stamp)
+                self.error = None
+                self._stamp = stamp
+                metrics.EQUIPMENT_CACHE.labels("reload").inc()
+            except Exception as e:
+                metrics.EQUIPMENT_CACHE.labels("error").inc()
+                self.error = str(e)
+                self.items = None
+                self.summary = EQUIPMENT_UNAVAILABLE
+                self.fingerprint = None
+                self._stamp = None
+            self.load_seconds = time.perf_counter() - start
+            self.loaded_at = time.time()
+            return self.items
+
+    def _load(self, stamp):
+        """Load rows for the workbook version identified by stamp, preferring the sidecar."""
+        header = read_sidecar_header(self.sidecar_path)
+        if header is not None and header[1] == stamp:
+            # Sidecar was compiled from exactly this file version; no hashing needed
+            fingerprint = header[0]
+            if fingerprint != self.fingerprint or self.items is None:
+                self._set_items(read_sidecar(self.sidecar_path), fingerprint)
+                self.source = "sidecar"
+            return
+
+        fingerprint = _file_sha256(self.path)
+        if fingerprint == self.fingerprint and self.items is not None:
+            # Touched but unchanged: keep the parsed rows and refresh the sidecar stamp
+            self._write_sidecar(self.items, fingerprint, stamp)
+            return
+        if header is not None and header[0] == fingerprint:
+            items = read_sidecar(self.sidecar_path)
+            self.source = "sidecar"
+        else:
+            items = read_workbook(self.path)
+            self.source = "workbook"
+            self.rebuilds += 1
+        self._set_items(items, fingerprint)
+        self._write_sidecar(items, fingerprint, stamp)
+
+    def _write_sidecar(self, items, fingerprint, stamp):
+        """Best-effort sidecar write: the sidecar is only a cache, so a read-only or full disk must not fail the load."""
+        try:
+            write_sidecar(self.sidecar_path, items, fingerprint, stamp)
+        except OSError as e:
+            metrics.EQUIPMENT_CACHE.labels("sidecar_error").inc()
+            self.sidecar_error = str(e)
+            logger.warning("Could not write equipment sidecar %s: %s", self.sidecar_path, e)
+        else:
+            self.sidecar_error = None
+
+    def _set_items(self, items, fingerprint):
+        self.items = items
+        self.summary = render_equipment_summary(items)
+        self.fingerprint = fingerprint
+        self.loads += 1
+
+    def get_summary(self):
+        """Return the cached equipment summary string for AI prompts."""
+        self.refresh()
+        return self.summary
+
+    def stats(self):
+        """Return load timing and cache counters for monitoring."""
+        return {
+            "path": str(self.path),
+            "items": len(self.items) if self.items is not None else 0,
+            "fingerprint": self.fingerprint,
+            "load_seconds": round(self.load_seconds, 4),
+            "loaded_at": self.loaded_at,
+            "source": self.source,
+            "loads": self.loads,
+            "rebuilds": self.rebuilds,
+            "hits": self.hits,
+            "error": self.error,
+            "sidecar_error": self.sidecar_error,
+        }
+
+
+_catalog = None
+_catalog_lock = threading.Lock()
+
+
+def get_equipment_catalog():
+    """Return the process-wide equipment catalog."""
+    global _catalog
+    if _catalog is None:
+        with _catalog_lock:
+            if _catalog is None:
+                _catalog = EquipmentCatalog(EQUIPMENT_FILE)
+    return _catalog
+
+
+def build_sidecar(workbook_path=EQUIPMENT_FILE, force=False):
+    """Compile the workbook into its sidecar. Returns (items, rebuilt)."""
+    workbook_path = Path(workbook_path)
+    sidecar_path = sidecar_path_for(workbook_path)
+    stat = os.stat(workbook_path)
+    stamp = (stat.st_mtime_ns, stat.st_size)
+    fingerprint = _file_sha256(workbook_path)
+    header = read_sidecar_header(sidecar_path)
+    if not force and header is not None and header[0] == fingerprint:
+        items = read_sidecar(sidecar_path)
+        if header[1] != stamp:
+            write_sidecar(sidecar_path, items, fingerprint, stamp)
+        return items, False
+    items = read_workbook(workbook_path)
+    write_sidecar(sidecar_path, items, fingerprint, stamp)
+    return items, True
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="MyGymBro equipment catalog tools")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    build_parser = subparsers.add_parser("build", help="Compile the equipment workbook into its binary sidecar")
+    build_parser.add_argument("--workbook", default=str(EQUIPMENT_FILE), help="Path to the equipment workbook")
+    build_parser.add_argument("--force", action="store_true", help="Rebuild even if the sidecar is up to date")
+
+    args = parser.parse_args(argv)
+    if args.command == "build":
+        start = time.perf_counter()
+        items, rebuilt = build_sidecar(args.workbook, force=args.force)
+        elapsed = time.perf_counter() - start
+        status = "Built" if rebuilt else "Up to date:"
+        print(f"{status} {sidecar_path_for(args.workbook)} ({len(items)} rows, {elapsed:.3f}s)")
+
+
+if __name__ == "__main__":
+    main()
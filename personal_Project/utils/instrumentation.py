@@ -0,0 +1,315 @@
+"""
+MyGymBro - Rerun Instrumentation
+
+Lightweight timing spans around the hot phases of a rerun (equipment loading,
+user lookups, users.json parsing, chat redraw, workout parsing, the LLM
+stream), aggregated into fixed-bucket histograms per page and per session.
+
+Pages call begin_rerun() at the top and end_rerun() at the bottom, and also
+right before the hot early exits (st.rerun() / st.stop() in the chat flow).
+Any other early exit is closed at the end of its last span when the same
+session starts its next rerun, or not counted if nothing was measured in it.
+Spans recorded outside a page run (e.g. on a background thread) are filed
+under the "background" page.
+
+Rerun boundaries are always tracked (two calls per rerun) because they also
+feed the rerun-duration and active-session metrics in utils/metrics.py; only
+the phase histograms depend on INSTRUMENTATION.
+
+Settings (env vars):
+- INSTRUMENTATION: 1 to enable (default off; disabled spans are a shared no-op
+  context manager and @timed functions are left undecorated)
+- INSTRUMENTATION_ADMINS: comma-separated emails that see the timing panel
+- INSTRUMENTATION_MAX_SESSIONS: sessions with per-session histograms kept, least recently
+  active dropped (default 500; the active-session count is tracked separately and is not capped)
+- INSTRUMENTATION_DUMP_FILE: write a JSON snapshot to this path at exit
+"""
+
+import atexit
+import bisect
+import contextlib
+import functools
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from utils import metrics
+
+# Histogram bucket upper bounds in seconds (the last bucket catches everything slower)
+BUCKETS = metrics.LATENCY_BUCKETS
+
+# A session counts as active for this long after its last rerun
+ACTIVE_SESSION_SECONDS = 300
+
+BACKGROUND_PAGE = "background"
+
+_NOOP_SPAN = contextlib.nullcontext()
+
+
+class Histogram:
+    """Fixed-bucket latency histogram."""
+
+    __slots__ = ("counts", "count", "total", "max")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, q):
+        """Upper bound of the bucket holding the q-th quantile (capped at the observed max)."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        cumulative = 0
+        for bound, bucket_count in zip(BUCKETS, self.counts):
+            cumulative += bucket_count
+            if cumulative >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "mean_ms": round(self.total / self.count * 1000, 3) if self.count else 0.0,
+            "p50_ms": round(self.percentile(0.5) * 1000, 3),
+            "p95_ms": round(self.percentile(0.95) * 1000, 3),
+            "p99_ms": round(self.percentile(0.99) * 1000, 3),
+            "max_ms": round(self.max * 1000, 3),
+            "total_ms": round(self.total * 1000, 3),
+            "buckets": dict(zip([*map(str, BUCKETS), "+Inf"], self.counts)),
+        }
+
+
+class _Span:
+    __slots__ = ("_recorder", "_phase", "_start")
+
+    def __init__(self, recorder, phase):
+        self._recorder = recorder
+        self._phase = phase
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # Recorded even when the block exits through st.rerun()/st.stop()
+        self._recorder.observe(self._phase, time.perf_counter() - self._start)
+        return False
+
+
+class Instrumentation:
+    """Per-page and per-session phase histograms for one process."""
+
+    def __init__(self, max_sessions=500, record_phases=True, active_window=ACTIVE_SESSION_SECONDS):
+        self.max_sessions = max_sessions
+        self.record_phases = record_phases
+        self.active_window = active_window
+        self._lock = threading.Lock()
+        # Each Streamlit script run has its own thread, so the current page/session is thread-local
+        self._local = threading.local()
+        # session id -> time of its last rerun, oldest first. Unlike self.sessions this is never capped,
+        # only expired after active_window, so the active-session gauge stays exact at any load.
+        self._last_seen = OrderedDict()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.pages = {}
+            self.sessions = OrderedDict()
+            self._open_reruns = {}
+            self.started_at = time.time()
+
+    def _session(self, session_id, page):
+        session = self.sessions.get(session_id)
+        if session is None:
+            session = self.sessions[session_id] = {"page": page, "reruns": 0, "last_seen": 0.0, "phases": {}}
+            while len(self.sessions) > self.max_sessions:
+                dropped, _ = self.sessions.popitem(last=False)
+                self._open_reruns.pop(dropped, None)
+        else:
+            self.sessions.move_to_end(session_id)
+            session["page"] = page
+        return session
+
+    def _observe(self, page, session_id, phase, seconds):
+        # Caller holds the lock
+        self.pages.setdefault(page, {}).setdefault(phase, Histogram()).observe(seconds)
+        if session_id is not None:
+            self._session(session_id, page)["phases"].setdefault(phase, Histogram()).observe(seconds)
+
+    def _close_rerun(self, session_id, end=None):
+        # Caller holds the lock
+        rerun = self._open_reruns.pop(session_id, None)
+        if rerun is not None:
+            page, start, last_end = rerun
+            if end is None and last_end == start:
+                # Ended early with no span to tell when; a zero would skew the histogram
+                return
+            seconds = (end or last_end) - start
+            metrics.RERUN_SECONDS.labels(page).observe(seconds)
+            if self.record_phases:
+                self._observe(page, session_id, "rerun", seconds)
+            self._session(session_id, page)["reruns"] += 1
+
+    def begin_rerun(self, page, session_id):
+        """Mark the start of a script run of page for session_id on this thread."""
+        now = time.perf_counter()
+        self._local.context = (page, session_id)
+        with self._lock:
+            self._close_rerun(session_id)
+            self._open_reruns[session_id] = (page, now, now)
+            seen = time.time()
+            self._session(session_id, page)["last_seen"] = seen
+            self._last_seen[session_id] = seen
+            self._last_seen.move_to_end(session_id)
+            self._expire_sessions(seen)
+
+    def end_rerun(self):
+        """Mark the end of the current script run."""
+        context = getattr(self._local, "context", None)
+        if context is not None:
+            with self._lock:
+                self._close_rerun(context[1], time.perf_counter())
+
+    def observe(self, phase, seconds):
+        """Record one measurement of phase for the current page and session."""
+        page, session_id = getattr(self._local, "context", None) or (BACKGROUND_PAGE, None)
+        with self._lock:
+            self._observe(page, session_id, phase, seconds)
+            rerun = self._open_reruns.get(session_id)
+            if rerun is not None:
+                self._open_reruns[session_id] = (rerun[0], rerun[1], time.perf_counter())
+
+    def _expire_sessions(self, now):
+        # Caller holds the lock; entries are ordered by last rerun, so only expired ones are visited
+        cutoff = now - self.active_window
+        while self._last_seen:
+            session_id, seen = next(iter(self._last_seen.items()))
+            if seen >= cutoff:
+                break
+            del self._last_seen[session_id]
+
+    def active_sessions(self):
+        """Number of sessions with a rerun in the last active_window seconds."""
+        with self._lock:
+            self._expire_sessions(time.time())
+            return len(self._last_seen)
+
+    def span(self, phase):
+        """Context manager that times its block as phase."""
+        return _Span(self, phase)
+
+    def snapshot(self, session_id=None):
+        """JSON-serializable view of every histogram (or only one session's)."""
+        with self._lock:
+            sessions = self.sessions if session_id is None else {
+                key: value for key, value in self.sessions.items() if key == session_id
+            }
+            return {
+                "started_at": self.started_at,
+                "generated_at": time.time(),
+                "pages": {
+                    page: {phase: histogram.to_dict() for phase, histogram in phases.items()}
+                    for page, phases in self.pages.items()
+                } if session_id is None else {},
+                "sessions": {
+                    key: {
+                        "page": session["page"],
+                        "reruns": session["reruns"],
+                        "phases": {phase: histogram.to_dict() for phase, histogram in session["phases"].items()},
+                    }
+                    for key, session in sessions.items()
+                },
+            }
+
+    def dump_json(self, path):
+        """Write a full snapshot to path."""
+        with open(path, 'w') as f:
+            json.dump(self.snapshot(), f, indent=2)
+
+    def stats(self):
+        """Return counters for monitoring."""
+        with self._lock:
+            return {
+                "pages": len(self.pages),
+                "sessions": len(self.sessions),
+                "open_reruns": len(self._open_reruns),
+            }
+
+
+_enabled = os.getenv("INSTRUMENTATION", "").strip().lower() in ("1", "true", "yes", "on")
+_instrumentation = Instrumentation(
+    max_sessions=int(os.getenv("INSTRUMENTATION_MAX_SESSIONS", "500")),
+    record_phases=_enabled,
+)
+metrics.ACTIVE_SESSIONS.set_function(_instrumentation.active_sessions)
+
+if _enabled and os.getenv("INSTRUMENTATION_DUMP_FILE"):
+    atexit.register(_instrumentation.dump_json, os.getenv("INSTRUMENTATION_DUMP_FILE"))
+
+
+def instrumentation_enabled():
+    return _enabled
+
+
+def get_instrumentation():
+    """Return the process-wide instrumentation recorder."""
+    return _instrumentation
+
+
+def is_instrumentation_admin(email):
+    """True if email may see the timing panel."""
+    admins = {a.strip().lower() for a in os.getenv("INSTRUMENTATION_ADMINS", "").split(",") if a.strip()}
+    return bool(email) and email.strip().lower() in admins
+
+
+def span(phase):
+    """Time a block as phase (a shared no-op when instrumentation is off)."""
+    if not _enabled:
+        return _NOOP_SPAN
+    return _instrumentation.span(phase)
+
+
+def record(phase, seconds):
+    """Record a measurement taken by the caller (e.g. time to first token)."""
+    if _enabled:
+        _instrumentation.observe(phase, seconds)
+
+
+def timed(phase):
+    """Decorator form of span(); functions are returned unchanged when instrumentation is off."""
+    def decorator(func):
+        if not _enabled:
+            return func
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with _instrumentation.span(phase):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def begin_rerun(page, session_state):
+    """Call at the top of a page script. session_state is st.session_state (holds the session id)."""
+    metrics.start_metrics_exporter()
+    session_id = session_state.get("instrumentation_session")
+    if session_id is None:
+        session_id = session_state["instrumentation_session"] = os.urandom(6).hex()
+    _instrumentation.begin_rerun(page, session_id)
+
+
+def end_rerun():
+    """Call at the bottom of a page script."""
+    _instrumentation.end_rerun()
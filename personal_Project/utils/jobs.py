@@ -0,0 +1,340 @@
+"""
+MyGymBro - Background Jobs
+
+Long generations (the full weekly split, custom workouts) run as background
+jobs instead of inside the page's st.write_stream, so they no longer pin the
+script run and are not lost when the student reruns or switches pages. A
+student can queue several plans at once.
+
+Jobs run on a process-wide thread pool. Streamed output is buffered in
+memory, where the page polls it, and the new part is appended to a job table
+(data/jobs.db) every JOBS_FLUSH_SECONDS and when the job ends. A producer
+fails its job by raising (JobFailedError carries a message meant for the
+student); yielding an error message would deliver it as a plan. The main app moves a
+finished job's output into the chat exactly once (claim()). Jobs that were
+queued or running when the process stopped are marked "interrupted" on the
+next start, keeping whatever output had been flushed (so run one Streamlit
+process per data directory).
+
+Settings (env vars):
+- JOBS_WORKERS: generations run at the same time (default 4; upstream calls
+  still go through the LLM governor)
+- JOBS_MAX_PER_USER: queued or running jobs per user (default 3)
+- JOBS_FLUSH_SECONDS: how often partial output is written to the table (default 2)
+- JOBS_RETENTION_HOURS: delivered jobs are deleted after this long (default 168)
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from utils import metrics
+
+logger = logging.getLogger(__name__)
+
+# Data directory setup
+DATA_DIR = Path("data")
+JOBS_DB_FILE = DATA_DIR / "jobs.db"
+
+# Attempts at writing a finished job's final state before falling back to a bare "failed"
+FINAL_WRITE_ATTEMPTS = 3
+
+
+class JobLimitError(Exception):
+    """Raised when a user already has the maximum number of active jobs."""
+
+
+class JobFailedError(Exception):
+    """Raised by a producer to fail its job; the message is shown to the student as is."""
+
+
+class _Job:
+    """Live state of a queued or running job."""
+
+    __slots__ = ("job_id", "owner", "kind", "title", "meta", "status", "chunks", "flushed", "error",
+                 "created_at", "started_at", "finished_at", "lock")
+
+    def __init__(self, job_id, owner, kind, title, meta):
+        self.job_id = job_id
+        self.owner = owner
+        self.kind = kind
+        self.title = title
+        self.meta = meta
+        self.status = "queued"
+        self.chunks = []
+        # Number of chunks already appended to the table
+        self.flushed = 0
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.lock = threading.Lock()
+
+    def to_dict(self):
+        with self.lock:
+            output = "".join(self.chunks)
+        return {
+            "job_id": self.job_id,
+            "owner": self.owner,
+            "kind": self.kind,
+            "title": self.title,
+            "meta": self.meta,
+            "status": self.status,
+            "output": output,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "delivered": False,
+        }
+
+
+class JobQueue:
+    """Thread-pool job runner with a persisted job table."""
+
+    def __init__(self, db_path=JOBS_DB_FILE, workers=4, max_per_owner=3, flush_seconds=2.0, retention_seconds=7 * 24 * 3600):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_per_owner = max_per_owner
+        self.flush_seconds = flush_seconds
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="job")
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        # job id -> _Job, only while queued or running
+        self._live = {}
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self._init_schema(retention_seconds)
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+    def _init_schema(self, retention_seconds):
+        conn = self._connect()
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                job_id TEXT PRIMARY KEY,
+                owner TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                title TEXT NOT NULL,
+                meta TEXT NOT NULL,
+                status TEXT NOT NULL,
+                output TEXT NOT NULL DEFAULT '',
+                error TEXT,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL,
+                delivered INTEGER NOT NULL DEFAULT 0
+            )
+            """
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS jobs_owner_delivered ON jobs (owner, delivered)")
+        now = time.time()
+        # Jobs of a previous process can no longer make progress
+        conn.execute(
+            "UPDATE jobs SET status = 'interrupted', finished_at = ? WHERE status IN ('queued', 'running')", (now,)
+        )
+        conn.execute("DELETE FROM jobs WHERE delivered = 1 AND finished_at < ?", (now - retention_seconds,))
+
+    def submit(self, owner, title, producer, kind="workout", meta=None):
+        """
+        Queue producer() (returns an iterator of text chunks) for owner and
+        return the job id. Raises JobLimitError when owner already has
+        max_per_owner queued or running jobs.
+        """
+        meta = meta or {}
+        with self._lock:
+            active = sum(1 for job in self._live.values() if job.owner == owner)
+            if active >= self.max_per_owner:
+                self.rejected += 1
+                raise JobLimitError(f"You already have {active} plans in progress")
+            job = _Job(uuid.uuid4().hex, owner, kind, title, meta)
+            self._live[job.job_id] = job
+            self.submitted += 1
+        self._connect().execute(
+            "INSERT INTO jobs (job_id, owner, kind, title, meta, status, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (job.job_id, owner, kind, title, json.dumps(meta), job.status, job.created_at),
+        )
+        self._executor.submit(self._run, job, producer)
+        return job.job_id
+
+    def _flush(self, job, final=False):
+        # Append only the chunks written since the last flush
+        with job.lock:
+            end = len(job.chunks)
+            delta = "".join(job.chunks[job.flushed:end])
+        if final:
+            self._connect().execute(
+                "UPDATE jobs SET status = ?, output = output || ?, error = ?, started_at = ?, finished_at = ? "
+                "WHERE job_id = ?",
+                (job.status, delta, job.error, job.started_at, job.finished_at, job.job_id),
+            )
+        else:
+            self._connect().execute(
+                "UPDATE jobs SET status = ?, output = output || ?, started_at = ? WHERE job_id = ?",
+                (job.status, delta, job.started_at, job.job_id),
+            )
+        job.flushed = end
+
+    def _finish(self, job):
+        """Write the final state. A row left "running" would be polled forever, so this retries and falls back."""
+        for attempt in range(FINAL_WRITE_ATTEMPTS):
+            try:
+                self._flush(job, final=True)
+                return
+            except sqlite3.Error as e:
+                logger.warning("Could not save job %s (attempt %d): %s", job.job_id, attempt + 1, e)
+                time.sleep(0.5 * (attempt + 1))
+        # Keeps whatever output was flushed before
+        job.status = "failed"
+        job.error = job.error or "Could not save the finished job"
+        try:
+            self._connect().execute(
+                "UPDATE jobs SET status = 'failed', error = ?, finished_at = ? WHERE job_id = ?",
+                (job.error, job.finished_at, job.job_id),
+            )
+        except sqlite3.Error as e:
+            # list_undelivered() repairs the row once the database is writable again
+            logger.error("Could not mark job %s as failed: %s", job.job_id, e)
+
+    def _run(self, job, producer):
+        job.started_at = time.time()
+        job.status = "running"
+        last_flush = time.monotonic()
+        try:
+            self._flush(job)
+            for chunk in producer():
+                with job.lock:
+                    job.chunks.append(chunk)
+                if time.monotonic() - last_flush >= self.flush_seconds:
+                    self._flush(job)
+                    last_flush = time.monotonic()
+            job.status = "done"
+        except JobFailedError as e:
+            job.error = str(e)
+            job.status = "failed"
+        except Exception as e:
+            job.error = f"{type(e).__name__}: {str(e)[:300]}"
+            job.status = "failed"
+        job.finished_at = time.time()
+        try:
+            self._finish(job)
+        finally:
+            metrics.JOBS.labels(job.kind, job.status).inc()
+            metrics.JOB_SECONDS.labels(job.kind).observe(job.finished_at - job.created_at)
+            with self._lock:
+                self._live.pop(job.job_id, None)
+                if job.status == "done":
+                    self.completed += 1
+                else:
+                    self.failed += 1
+
+    @staticmethod
+    def _row_to_dict(row):
+        job = dict(row)
+        job["meta"] = json.loads(job["meta"])
+        job["delivered"] = bool(job["delivered"])
+        return job
+
+    def get(self, job_id):
+        """Return a job as a dict (live output for running jobs), or None."""
+        job = self._live.get(job_id)
+        if job is not None:
+            return job.to_dict()
+        row = self._connect().execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return self._row_to_dict(row) if row else None
+
+    def list_undelivered(self, owner):
+        """Owner's jobs whose output has not been moved into the chat yet, oldest first."""
+        rows = self._connect().execute(
+            "SELECT * FROM jobs WHERE owner = ? AND delivered = 0 ORDER BY created_at", (owner,)
+        ).fetchall()
+        jobs = []
+        for row in rows:
+            live = self._live.get(row["job_id"])
+            if live is not None:
+                jobs.append(live.to_dict())
+                continue
+            job = self._row_to_dict(row)
+            if job["status"] in ("queued", "running"):
+                # Its final write failed: nothing is running it any more
+                job["status"] = "interrupted"
+                job["finished_at"] = job["finished_at"] or time.time()
+                try:
+                    self._connect().execute(
+                        "UPDATE jobs SET status = ?, finished_at = ? WHERE job_id = ? AND status IN ('queued', 'running')",
+                        (job["status"], job["finished_at"], job["job_id"]),
+                    )
+                except sqlite3.Error:
+                    pass
+            jobs.append(job)
+        return jobs
+
+    def has_undelivered(self, owner):
+        """Cheap check used on every rerun to decide whether the page needs to poll."""
+        with self._lock:
+            if any(job.owner == owner for job in self._live.values()):
+                return True
+        row = self._connect().execute(
+            "SELECT 1 FROM jobs WHERE owner = ? AND delivered = 0 LIMIT 1", (owner,)
+        ).fetchone()
+        return row is not None
+
+    def claim(self, job_id):
+        """Mark a finished job as delivered. Returns the job dict, or None if it is still running or was already claimed."""
+        # The final status is written before the job leaves _live, so the table alone decides
+        cursor = self._connect().execute(
+            "UPDATE jobs SET delivered = 1 WHERE job_id = ? AND delivered = 0 AND status NOT IN ('queued', 'running')",
+            (job_id,),
+        )
+        if cursor.rowcount != 1:
+            return None
+        return self.get(job_id)
+
+    def stats(self):
+        """Return counters for monitoring."""
+        with self._lock:
+            return {
+                "live": len(self._live),
+                "running": sum(1 for job in self._live.values() if job.status == "running"),
+                "submitted": self.submitted,
+                "completed": self.completed,
+                "failed": self.failed,
+                "rejected": self.rejected,
+            }
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_job_queue():
+    """Return the process-wide job queue."""
+    global _queue
+    if _queue is None:
+        with _queue_lock:
+            if _queue is None:
+                _queue = JobQueue(
+                    JOBS_DB_FILE,
+                    workers=int(os.getenv("JOBS_WORKERS", "4")),
+                    max_per_owner=int(os.getenv("JOBS_MAX_PER_USER", "3")),
+                    flush_seconds=float(os.getenv("JOBS_FLUSH_SECONDS", "2")),
+                    retention_seconds=float(os.getenv("JOBS_RETENTION_HOURS", "168")) * 3600,
+                )
+    return _queue
@@ -0,0 +1,165 @@
+"""
+MyGymBro - LLM Backends
+
+The chat pipeline talks to one LLMBackend interface instead of a hard-coded
+OpenAI client and model, so the same code can run against:
+- "openai" (default): api.openai.com through the shared pooled client
+- "openai_compatible": any OpenAI-compatible server at LLM_BASE_URL (vLLM,
+  LM Studio, the bundled stub server in scripts/stub_llm_server.py, ...)
+- "ollama": a local Ollama server through its native /api/chat endpoint
+
+Settings (env vars):
+- LLM_BACKEND: openai | openai_compatible | ollama (default openai)
+- LLM_MODEL: model name (default gpt-4o-mini; llama3.1 for ollama)
+- LLM_BASE_URL: server URL for openai_compatible / ollama
+  (defaults http://127.0.0.1:8787/v1 and http://127.0.0.1:11434)
+- LLM_API_KEY: key for openai_compatible servers (default: the OpenAI key, or "not-needed")
+- LLM_RECORD_DIR / LLM_REPLAY_DIR: record or replay streams (see utils/llm_recording.py)
+
+Offline benchmark against the stub server:
+
+    python -m scripts.stub_llm_server --port 8787 &
+    LLM_BACKEND=openai_compatible streamlit run main.py
+
+Client libraries (openai, httpx) are imported when a backend is first used,
+so the stub server and other tools can import request_fingerprint without them.
+"""
+
+import hashlib
+import json
+import os
+import threading
+
+DEFAULT_MODEL = "gpt-4o-mini"
+DEFAULT_OLLAMA_MODEL = "llama3.1"
+DEFAULT_COMPATIBLE_BASE_URL = "http://127.0.0.1:8787/v1"
+DEFAULT_OLLAMA_BASE_URL = "http://127.0.0.1:11434"
+
+
+def request_fingerprint(messages, response_format=None):
+    """Stable key for a chat request's content (used to match recorded responses)."""
+    raw = json.dumps([messages, response_format], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class LLMBackend:
+    """Interface for a streaming chat completion backend."""
+
+    name = "base"
+
+    def __init__(self, model, base_url=None):
+        self.model = model
+        self.base_url = base_url
+
+    def stream_chat(self, messages, temperature, max_tokens, response_format=None, labels=None, cancel_token=None):
+        """
+        Yield text chunks of the completion as they arrive. labels carries
+        request metadata (e.g. language) for recording; backends may ignore it.
+        Cancelling cancel_token (utils/cancellation.py) must close the upstream
+        response promptly, even while a read is blocked on another thread.
+        """
+        raise NotImplementedError
+
+    def describe(self):
+        """Identity of this backend, part of the single-flight key so different backends never share a stream."""
+        return [self.name, self.base_url, self.model]
+
+
+class OpenAIBackend(LLMBackend):
+    """OpenAI or any OpenAI-compatible endpoint, via the shared pooled client."""
+
+    def __init__(self, api_key, model=DEFAULT_MODEL, base_url=None):
+        super().__init__(model, base_url)
+        self.name = "openai_compatible" if base_url else "openai"
+        self.api_key = api_key
+
+    def stream_chat(self, messages, temperature, max_tokens, response_format=None, labels=None, cancel_token=None):
+        from utils.llm_client import get_openai_client, stream_chat_completion
+
+        client = get_openai_client(self.api_key, self.base_url)
+        return stream_chat_completion(client, self.model, messages, temperature, max_tokens, response_format,
+                                      cancel_token=cancel_token)
+
+
+class OllamaBackend(LLMBackend):
+    """Local Ollama server (native streaming /api/chat, newline-delimited JSON)."""
+
+    name = "ollama"
+
+    def __init__(self, model=DEFAULT_OLLAMA_MODEL, base_url=DEFAULT_OLLAMA_BASE_URL):
+        import httpx
+
+        super().__init__(model, base_url.rstrip("/"))
+        self._http = httpx.Client(timeout=httpx.Timeout(300.0, connect=5.0))
+
+    def stream_chat(self, messages, temperature, max_tokens, response_format=None, labels=None, cancel_token=None):
+        payload = {
+            "model": self.model,
+            "messages": messages,
+            "stream": True,
+            "options": {"temperature": temperature, "num_predict": max_tokens},
+        }
+        if response_format and response_format.get("type") == "json_object":
+            payload["format"] = "json"
+        with self._http.stream("POST", f"{self.base_url}/api/chat", json=payload) as response:
+            if cancel_token is not None:
+                cancel_token.add_callback(response.close)
+            response.raise_for_status()
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                data = json.loads(line)
+                if data.get("error"):
+                    raise RuntimeError(f"Ollama error: {data['error']}")
+                content = data.get("message", {}).get("content")
+                if content:
+                    yield content
+                if data.get("done"):
+                    return
+
+
+_backends = {}
+_backends_lock = threading.Lock()
+
+
+def get_llm_backend(api_key=None):
+    """Return the process-wide backend selected by LLM_BACKEND (api_key is the OpenAI key, if any)."""
+    kind = os.getenv("LLM_BACKEND", "openai").strip().lower()
+    if kind == "ollama":
+        key = (kind,)
+    elif kind == "openai_compatible":
+        key = (kind, os.getenv("LLM_API_KEY") or api_key or "not-needed")
+    elif kind == "openai":
+        key = (kind, api_key)
+    else:
+        raise ValueError(f"Unknown LLM_BACKEND '{kind}' (expected openai, openai_compatible or ollama)")
+
+    with _backends_lock:
+        backend = _backends.get(key)
+        if backend is None:
+            if kind == "ollama":
+                backend = OllamaBackend(
+                    model=os.getenv("LLM_MODEL") or DEFAULT_OLLAMA_MODEL,
+                    base_url=os.getenv("LLM_BASE_URL") or DEFAULT_OLLAMA_BASE_URL,
+                )
+            elif kind == "openai_compatible":
+                backend = OpenAIBackend(
+                    key[1],
+                    model=os.getenv("LLM_MODEL") or DEFAULT_MODEL,
+                    base_url=os.getenv("LLM_BASE_URL") or DEFAULT_COMPATIBLE_BASE_URL,
+                )
+            else:
+                backend = OpenAIBackend(api_key, model=os.getenv("LLM_MODEL") or DEFAULT_MODEL)
+            from utils.llm_recording import wrap_backend
+
+            backend = wrap_backend(backend)
+            _backends[key] = backend
+    return backend
+
+
+def llm_backend_needs_api_key():
+    """True when the configured backend is the real OpenAI API (and so needs OPENAI_API_KEY)."""
+    if os.getenv("LLM_REPLAY_DIR") and os.getenv("LLM_REPLAY_MISS", "error").lower() != "passthrough":
+        # Pure replay never reaches the network
+        return False
+    return os.getenv("LLM_BACKEND", "openai").strip().lower() == "openai"
@@ -0,0 +1,154 @@
+"""
+MyGymBro - Shared OpenAI Client
+
+One OpenAI client (and one httpx keep-alive connection pool) is shared by every
+Streamlit session in the process, so chat turns reuse open TCP/TLS connections
+instead of paying a new handshake per message.
+
+Pool settings (env vars):
+- OPENAI_MAX_CONNECTIONS: max open connections (default 50)
+- OPENAI_MAX_KEEPALIVE: max idle keep-alive connections (default 20)
+- OPENAI_KEEPALIVE_EXPIRY: seconds an idle connection is kept (default 30)
+- OPENAI_CONNECT_TIMEOUT / OPENAI_READ_TIMEOUT: timeouts in seconds (default 10 / 60)
+- OPENAI_VERIFY_SSL: "true" to verify certificates (default false, for problematic school networks)
+"""
+
+import atexit
+import os
+import threading
+
+import httpx
+from openai import OpenAI
+
+
+def _env_float(name, default):
+    try:
+        return float(os.getenv(name, default))
+    except ValueError:
+        return float(default)
+
+
+def _env_int(name, default):
+    try:
+        return int(os.getenv(name, default))
+    except ValueError:
+        return int(default)
+
+
+class OpenAIClientManager:
+    """Owns the process-wide OpenAI client and tracks connection reuse."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._client = None
+        self._client_key = None
+        self.requests = 0
+        self.connections_opened = 0
+        self.tls_handshakes = 0
+        self.clients_created = 0
+
+    def _trace(self, event_name, info):
+        """httpcore trace hook: counts new TCP connections and TLS handshakes."""
+        if event_name.endswith("connect_tcp.complete"):
+            with self._lock:
+                self.connections_opened += 1
+        elif event_name.endswith("start_tls.complete"):
+            with self._lock:
+                self.tls_handshakes += 1
+
+    def _on_request(self, request):
+        request.extensions["trace"] = self._trace
+        with self._lock:
+            self.requests += 1
+
+    def _build_http_client(self):
+        limits = httpx.Limits(
+            max_connections=_env_int("OPENAI_MAX_CONNECTIONS", 50),
+            max_keepalive_connections=_env_int("OPENAI_MAX_KEEPALIVE", 20),
+            keepalive_expiry=_env_float("OPENAI_KEEPALIVE_EXPIRY", 30),
+        )
+        timeout = httpx.Timeout(
+            _env_float("OPENAI_READ_TIMEOUT", 60),
+            connect=_env_float("OPENAI_CONNECT_TIMEOUT", 10),
+        )
+        verify = os.getenv("OPENAI_VERIFY_SSL", "false").lower() in ("1", "true", "yes")
+        return httpx.Client(
+            verify=verify,
+            limits=limits,
+            timeout=timeout,
+            event_hooks={"request": [self._on_request]},
+        )
+
+    def get_client(self, api_key, base_url=None):
+        """Return the shared client, rebuilding it only if the API key or base URL changed."""
+        with self._lock:
+            if self._client is not None and self._client_key == (api_key, base_url):
+                return self._client
+            old_client = self._client
+            self._client = OpenAI(api_key=api_key, base_url=base_url, http_client=self._build_http_client())
+            self._client_key = (api_key, base_url)
+            self.clients_created += 1
+        if old_client is not None:
+            old_client.close()
+        return self._client
+
+    def close(self):
+        """Close the shared client and its connection pool."""
+        with self._lock:
+            client = self._client
+            self._client = None
+            self._client_key = None
+        if client is not None:
+            client.close()
+
+    def stats(self):
+        """Return connection reuse counters for monitoring."""
+        with self._lock:
+            reused = max(self.requests - self.connections_opened, 0)
+            return {
+                "requests": self.requests,
+                "connections_opened": self.connections_opened,
+                "tls_handshakes": self.tls_handshakes,
+                "reused_requests": reused,
+                "reuse_rate": round(reused / self.requests, 3) if self.requests else 0.0,
+                "clients_created": self.clients_created,
+            }
+
+
+_manager = OpenAIClientManager()
+atexit.register(_manager.close)
+
+
+def get_client_manager():
+    """Return the process-wide client manager."""
+    return _manager
+
+
+def get_openai_client(api_key, base_url=None):
+    """Return the shared OpenAI client for api_key (and an optional OpenAI-compatible base_url)."""
+    return _manager.get_client(api_key, base_url)
+
+
+def stream_chat_completion(client, model, messages, temperature, max_tokens, response_format=None, cancel_token=None):
+    """
+    Call the chat completions API in streaming mode and yield text chunks as they
+    arrive. The HTTP response is closed when the generator is closed early or
+    cancel_token is cancelled, so the server stops generating.
+    """
+    extra_args = {"response_format": response_format} if response_format else {}
+    stream = client.chat.completions.create(
+        model=model,
+        messages=messages,
+        temperature=temperature,
+        max_tokens=max_tokens,
+        stream=True,
+        **extra_args
+    )
+    if cancel_token is not None:
+        cancel_token.add_callback(stream.response.close)
+    try:
+        for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content is not None:
+                yield chunk.choices[0].delta.content
+    finally:
+        stream.response.close()
@@ -0,0 +1,215 @@
+"""
+MyGymBro - LLM Record/Replay
+
+Captures real LLM streams to fixture files and serves them back, so parsing,
+rendering and UI latency can be measured end to end without network access.
+
+- Record mode (LLM_RECORD_DIR set): every upstream stream is passed through
+  unchanged and, once complete, appended to LLM_RECORD_DIR/recordings.jsonl
+  with the request (prompt, language, system-prompt hash, request key) and
+  every chunk with its delay since the previous one.
+- Replay mode (LLM_REPLAY_DIR set): streams are served from the fixtures in
+  that directory, matched by request key, at recorded speed times
+  LLM_REPLAY_SPEED (2 = twice as fast, 0 = no delays). A request without a
+  fixture raises ReplayMissError unless LLM_REPLAY_MISS=passthrough, in
+  which case it goes to the configured backend.
+
+Fixture lines also carry "request_key" and "response", so the same files can
+be replayed by scripts/stub_llm_server.py --replay.
+
+    python -m utils.llm_recording list fixtures/
+    python -m utils.llm_recording bench fixtures/ [--speed 0]
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+from utils.llm_backends import LLMBackend, request_fingerprint
+
+RECORDINGS_FILE = "recordings.jsonl"
+
+
+class ReplayMissError(Exception):
+    """Raised in replay mode when no fixture matches a request."""
+
+
+def _request_details(messages):
+    """Prompt and system-prompt hash recorded with each fixture."""
+    system_prompt = messages[0]["content"] if messages and messages[0]["role"] == "system" else ""
+    prompt = next((m["content"] for m in reversed(messages) if m["role"] == "user"), "")
+    return prompt, hashlib.sha256(system_prompt.encode("utf-8")).hexdigest()
+
+
+def load_fixtures(directory):
+    """Load fixtures from every *.jsonl file in directory, keyed by request key (latest wins)."""
+    fixtures = {}
+    for path in sorted(Path(directory).glob("*.jsonl")):
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    fixture = json.loads(line)
+                    fixtures[fixture["request_key"]] = fixture
+    return fixtures
+
+
+class RecordingBackend(LLMBackend):
+    """Passes streams through from another backend and records them as fixtures."""
+
+    def __init__(self, inner, record_dir):
+        super().__init__(inner.model, inner.base_url)
+        self.name = inner.name
+        self.inner = inner
+        self.record_dir = Path(record_dir)
+        self.record_dir.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self.recorded = 0
+
+    def stream_chat(self, messages, temperature, max_tokens, response_format=None, labels=None, cancel_token=None):
+        chunks = []
+        start = last = time.monotonic()
+        for chunk in self.inner.stream_chat(messages, temperature, max_tokens, response_format, labels=labels,
+                                            cancel_token=cancel_token):
+            now = time.monotonic()
+            chunks.append([round(now - last, 4), chunk])
+            last = now
+            yield chunk
+
+        # Only complete streams become fixtures
+        if cancel_token is not None and cancel_token.cancelled:
+            return
+        prompt, system_prompt_sha256 = _request_details(messages)
+        fixture = {
+            "request_key": request_fingerprint(messages, response_format),
+            "prompt": prompt,
+            "language": (labels or {}).get("language"),
+            "system_prompt_sha256": system_prompt_sha256,
+            "backend": self.inner.describe(),
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+            "response_format": response_format,
+            "recorded_at": time.time(),
+            "ttft": chunks[0][0] if chunks else None,
+            "duration": round(last - start, 4),
+            "chunks": chunks,
+            "response": "".join(chunk for _, chunk in chunks),
+        }
+        line = json.dumps(fixture, ensure_ascii=False) + "\n"
+        with self._lock:
+            with open(self.record_dir / RECORDINGS_FILE, "a", encoding="utf-8") as f:
+                f.write(line)
+            self.recorded += 1
+
+
+class ReplayBackend(LLMBackend):
+    """Serves recorded streams with their original inter-chunk timing, optionally accelerated."""
+
+    def __init__(self, replay_dir, speed=1.0, fallback=None, model="replay"):
+        super().__init__(fallback.model if fallback else model, str(replay_dir))
+        self.name = "replay"
+        self.fixtures = load_fixtures(replay_dir)
+        self.speed = speed
+        self.fallback = fallback
+        self.hits = 0
+        self.misses = 0
+
+    def stream_chat(self, messages, temperature, max_tokens, response_format=None, labels=None, cancel_token=None):
+        fixture = self.fixtures.get(request_fingerprint(messages, response_format))
+        if fixture is None:
+            self.misses += 1
+            if self.fallback is None:
+                prompt, _ = _request_details(messages)
+                raise ReplayMissError(f"No recorded response for prompt: {prompt[:80]!r}")
+            yield from self.fallback.stream_chat(messages, temperature, max_tokens, response_format, labels=labels,
+                                                 cancel_token=cancel_token)
+            return
+
+        self.hits += 1
+        for delay, chunk in fixture["chunks"]:
+            if self.speed > 0 and delay > 0:
+                time.sleep(delay / self.speed)
+            if cancel_token is not None and cancel_token.cancelled:
+                return
+            yield chunk
+
+
+def wrap_backend(backend):
+    """Apply record/replay mode from the environment to a freshly built backend."""
+    replay_dir = os.getenv("LLM_REPLAY_DIR")
+    if replay_dir:
+        fallback = backend if os.getenv("LLM_REPLAY_MISS", "error").lower() == "passthrough" else None
+        return ReplayBackend(replay_dir, speed=float(os.getenv("LLM_REPLAY_SPEED", "1")), fallback=fallback)
+    record_dir = os.getenv("LLM_RECORD_DIR")
+    if record_dir:
+        return RecordingBackend(backend, record_dir)
+    return backend
+
+
+def bench_fixtures(directory, speed):
+    """Replay every fixture through the workout parsers and report timings."""
+    from utils.workout_parser import analyze_workout_text
+    from utils.workout_stream import IncrementalWorkoutParser
+
+    results = []
+    for fixture in load_fixtures(directory).values():
+        structured = (fixture.get("response_format") or {}).get("type") == "json_object"
+        parser = IncrementalWorkoutParser() if structured else None
+        parse_seconds = 0.0
+        first_block = None
+        start = time.perf_counter()
+        for delay, chunk in fixture["chunks"]:
+            if speed > 0 and delay > 0:
+                time.sleep(delay / speed)
+            if parser is not None:
+                t = time.perf_counter()
+                if parser.feed(chunk) and first_block is None:
+                    first_block = time.perf_counter() - start
+                parse_seconds += time.perf_counter() - t
+        t = time.perf_counter()
+        if parser is not None:
+            parser.result()
+        else:
+            exercises = analyze_workout_text(fixture["response"])["exercises"]
+            if exercises:
+                first_block = time.perf_counter() - start
+        parse_seconds += time.perf_counter() - t
+        results.append({
+            "prompt": fixture["prompt"],
+            "chunks": len(fixture["chunks"]),
+            "total_seconds": time.perf_counter() - start,
+            "parse_seconds": parse_seconds,
+            "first_block_seconds": first_block,
+        })
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="MyGymBro LLM record/replay fixtures")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    list_parser = subparsers.add_parser("list", help="List recorded fixtures")
+    list_parser.add_argument("directory")
+
+    bench_parser = subparsers.add_parser("bench", help="Replay fixtures through the workout parsers")
+    bench_parser.add_argument("directory")
+    bench_parser.add_argument("--speed", type=float, default=0.0, help="replay speed factor (0 = no delays)")
+
+    args = parser.parse_args(argv)
+    if args.command == "list":
+        for fixture in load_fixtures(args.directory).values():
+            print(f"{fixture['request_key'][:12]}  {fixture.get('language') or '-':<9} ttft={fixture['ttft']}s "
+                  f"chunks={len(fixture['chunks'])}  {fixture['prompt'][:60]!r}")
+    elif args.command == "bench":
+        for result in bench_fixtures(args.directory, args.speed):
+            first_block = result["first_block_seconds"]
+            first_block = f"{first_block * 1000:.1f}ms" if first_block is not None else "-"
+            print(f"total={result['total_seconds'] * 1000:8.1f}ms  parse={result['parse_seconds'] * 1000:6.2f}ms  "
+                  f"first_block={first_block:>9}  chunks={result['chunks']:<5} {result['prompt'][:50]!r}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,415 @@
+"""
+MyGymBro - Prometheus Metrics
+
+One process-wide registry of counters, gauges and histograms, exported in the
+Prometheus text format. Metrics are always recorded (an increment is a dict
+lookup under a lock); they are only exported when configured:
+
+- METRICS_PORT: serve GET /metrics on this port (METRICS_HOST, default 127.0.0.1)
+- METRICS_FILE: rewrite this file every METRICS_FILE_INTERVAL seconds (default 15),
+  e.g. for node_exporter's textfile collector
+
+Metric definitions live at the bottom of this module so every code path
+records into the same objects. Service counters that already exist
+(response cache, single-flight, governor, user-store cache, password pool,
+login limiter, sessions, background jobs, cancellation registry) are exported
+as gauges read at scrape time.
+"""
+
+import functools
+import os
+import sys
+import threading
+import time
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Histogram bucket upper bounds in seconds (shared with utils/instrumentation.py)
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    pairs.extend(f'{name}="{_escape(value)}"' for name, value in extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_number(value):
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Timer:
+    __slots__ = ("_child", "_start")
+
+    def __init__(self, child):
+        self._child = child
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._child.observe(time.perf_counter() - self._start)
+        return False
+
+
+class Metric:
+    """Base class: a named metric with a fixed set of label names."""
+
+    type = "untyped"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._children = {}
+
+    def labels(self, *values):
+        """Return the child for one combination of label values."""
+        if len(values) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {values}")
+        values = tuple(str(value) for value in values)
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def _samples(self):
+        """Yield (suffix, label values, extra labels, value)."""
+        raise NotImplementedError
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        for suffix, values, extra, value in self._samples():
+            lines.append(f"{self.name}{suffix}{_format_labels(self.labelnames, values, extra)} {_format_number(value)}")
+        return "\n".join(lines)
+
+
+class _CounterChild:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+
+class Counter(Metric):
+    """Monotonically increasing count."""
+
+    type = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+    def _samples(self):
+        for values, child in list(self._children.items()):
+            yield "_total", values, (), child.value
+
+
+class _GaugeChild:
+    __slots__ = ("value", "function")
+
+    def __init__(self):
+        self.value = 0.0
+        self.function = None
+
+    def set(self, value):
+        self.value = value
+
+    def set_function(self, function):
+        """Read the value from function() at scrape time."""
+        self.function = function
+
+
+class Gauge(Metric):
+    """Value that goes up and down (or is computed at scrape time)."""
+
+    type = "gauge"
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, value):
+        self.labels().set(value)
+
+    def set_function(self, function):
+        self.labels().set_function(function)
+
+    def _samples(self):
+        for values, child in list(self._children.items()):
+            if child.function is not None:
+                try:
+                    value = child.function()
+                except Exception:
+                    continue
+            else:
+                value = child.value
+            if value is not None:
+                yield "", values, (), value
+
+
+class _HistogramChild:
+    __slots__ = ("buckets", "counts", "count", "sum", "_lock")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.sum += value
+
+    def time(self):
+        """Context manager that observes the duration of its block."""
+        return _Timer(self)
+
+
+class Histogram(Metric):
+    """Distribution of observed values in cumulative buckets."""
+
+    type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+    def time(self):
+        return self.labels().time()
+
+    def _samples(self):
+        for values, child in list(self._children.items()):
+            with child._lock:
+                counts, count, total = list(child.counts), child.count, child.sum
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                yield "_bucket", values, (("le", _format_number(bound)),), cumulative
+            yield "_bucket", values, (("le", "+Inf"),), count
+            yield "_sum", values, (), total
+            yield "_count", values, (), count
+
+
+class MetricsRegistry:
+    """Named collection of metrics rendered together."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}
+
+    def _register(self, cls, name, documentation, labelnames, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, documentation, labelnames, **kwargs)
+            elif not isinstance(metric, cls) or metric.labelnames != tuple(labelnames):
+                raise ValueError(f"Metric {name} already registered with a different type or labels")
+            return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter, name, documentation, labelnames)
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._register(Gauge, name, documentation, labelnames)
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._register(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def render(self):
+        """Prometheus text exposition of every metric."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "\n".join(metric.render() for metric in metrics) + "\n"
+
+
+_registry = MetricsRegistry()
+
+
+def timed_operation(histogram, *label_values):
+    """Decorator that observes each call's duration in histogram (with the given label values)."""
+    child = histogram.labels(*label_values)
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with child.time():
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def get_metrics_registry():
+    """Return the process-wide metrics registry."""
+    return _registry
+
+
+def write_metrics_file(path):
+    """Atomically replace path with the current exposition."""
+    tmp_path = f"{path}.tmp{os.getpid()}"
+    with open(tmp_path, 'w') as f:
+        f.write(_registry.render())
+    os.replace(tmp_path, path)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split("?")[0].rstrip("/") not in ("", "/metrics"):
+            self.send_error(404)
+            return
+        data = _registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+_exporter_started = False
+_exporter_lock = threading.Lock()
+
+
+def _register_service_collectors():
+    """Export the existing services' stats() counters as gauges read at scrape time."""
+    from utils.cancellation import get_cancellation_registry
+    from utils.jobs import get_job_queue
+    from utils.passwords import get_login_limiter, get_password_service
+    from utils.rate_limiter import get_llm_governor
+    from utils.response_cache import get_response_cache
+    from utils.sessions import get_session_store
+    from utils.single_flight import get_single_flight
+    from utils.user_store import get_user_store
+
+    services = {
+        "response_cache": get_response_cache,
+        "single_flight": get_single_flight,
+        "llm_governor": get_llm_governor,
+        "user_store_cache": get_user_store,
+        "password_service": get_password_service,
+        "login_limiter": get_login_limiter,
+        "sessions": get_session_store,
+        "jobs": get_job_queue,
+        "cancellation": get_cancellation_registry,
+    }
+    for service, getter in services.items():
+        stats = getter().stats()
+        for key, value in stats.items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                SERVICE_STAT.labels(service, key).set_function(
+                    lambda getter=getter, key=key: getter().stats().get(key)
+                )
+
+
+def start_metrics_exporter():
+    """Start the configured exporters once per process (cheap to call on every rerun)."""
+    global _exporter_started
+    if _exporter_started:
+        return
+    with _exporter_lock:
+        if _exporter_started:
+            return
+        _exporter_started = True
+        port = os.getenv("METRICS_PORT")
+        path = os.getenv("METRICS_FILE")
+        if not port and not path:
+            return
+        _register_service_collectors()
+
+        if port:
+            try:
+                server = ThreadingHTTPServer((os.getenv("METRICS_HOST", "127.0.0.1"), int(port)), _MetricsHandler)
+            except OSError as e:
+                # Another process (e.g. a second Streamlit worker) already serves this port
+                print(f"MyGymBro metrics: could not listen on port {port}: {e}", file=sys.stderr)
+            else:
+                server.daemon_threads = True
+                threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+
+        if path:
+            interval = float(os.getenv("METRICS_FILE_INTERVAL", "15"))
+
+            def write_forever():
+                while True:
+                    try:
+                        write_metrics_file(path)
+                    except OSError as e:
+                        print(f"MyGymBro metrics: could not write {path}: {e}", file=sys.stderr)
+                    time.sleep(interval)
+
+            threading.Thread(target=write_forever, name="metrics-file", daemon=True).start()
+
+
+# Metric definitions
+LLM_REQUESTS = _registry.counter(
+    "mygymbro_llm_requests", "Chat answers requested from the LLM pipeline", ["backend", "mode"])
+LLM_REQUEST_SECONDS = _registry.histogram(
+    "mygymbro_llm_request_seconds", "Time from request to the last streamed chunk, as seen by the page", ["backend", "mode"])
+LLM_TTFT_SECONDS = _registry.histogram(
+    "mygymbro_llm_time_to_first_token_seconds", "Time from request to the first streamed chunk (includes queueing)", ["backend", "mode"])
+LLM_TOKENS = _registry.counter(
+    "mygymbro_llm_tokens", "Tokens sent to and received from the upstream LLM", ["backend", "direction"])
+LLM_ERRORS = _registry.counter(
+    "mygymbro_llm_errors", "Failed LLM answers by kind (authentication, busy, queue_timeout, other)", ["backend", "kind"])
+LLM_CANCELLED = _registry.counter(
+    "mygymbro_llm_cancelled", "Upstream LLM calls stopped early because nobody was waiting for the answer "
+    "(reason is \"abandoned\" for clear chat, logout, navigation and reruns alike)", ["backend", "reason"])
+LLM_WASTED_TOKENS = _registry.counter(
+    "mygymbro_llm_wasted_tokens", "Tokens sent and generated for answers that were cancelled", ["backend", "direction"])
+LLM_TOKENS_AVOIDED = _registry.counter(
+    "mygymbro_llm_tokens_avoided", "Output tokens not generated thanks to cancellation (max_tokens minus tokens generated)", ["backend"])
+RESPONSE_CACHE_LOOKUPS = _registry.counter(
+    "mygymbro_response_cache_lookups", "Sidebar prompt lookups in the AI response cache", ["result"])
+CHAT_MESSAGES = _registry.counter(
+    "mygymbro_chat_messages", "User messages added to the chat", ["source"])
+USER_STORE_SECONDS = _registry.histogram(
+    "mygymbro_user_store_seconds", "User store operation latency", ["operation"])
+EQUIPMENT_CACHE = _registry.counter(
+    "mygymbro_equipment_cache", "Equipment catalog refreshes by outcome (hit, reload, error, sidecar_error)", ["result"])
+LOGIN_ATTEMPTS = _registry.counter(
+    "mygymbro_login_attempts", "Login attempts by outcome (success, invalid, rate_limited, busy)", ["result"])
+PASSWORD_KDF_SECONDS = _registry.histogram(
+    "mygymbro_password_kdf_seconds", "Password hash/verify time on the worker pool", ["operation"])
+JOBS = _registry.counter(
+    "mygymbro_jobs", "Finished background jobs by kind and final status (done, failed)", ["kind", "status"])
+JOB_SECONDS = _registry.histogram(
+    "mygymbro_job_seconds", "Background job time from submission to the end of its output", ["kind"])
+RERUN_SECONDS = _registry.histogram(
+    "mygymbro_rerun_seconds", "Streamlit script run duration", ["page"])
+ACTIVE_SESSIONS = _registry.gauge(
+    "mygymbro_active_sessions", "Sessions with a rerun in the last 5 minutes (not capped by INSTRUMENTATION_MAX_SESSIONS)")
+SERVICE_STAT = _registry.gauge(
+    "mygymbro_service_stat", "Counters reported by the shared services' stats()", ["service", "stat"])
+
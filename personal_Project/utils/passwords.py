@@ -0,0 +1,312 @@
+"""
+MyGymBro - Password Hashing and Login Limits
+
+Passwords are stored as scrypt hashes ("scrypt$N$r$p$salt$hash"). The KDF
+costs tens of milliseconds by design, so it runs on a small bounded thread
+pool (hashlib.scrypt releases the GIL) instead of the Streamlit script
+thread: when a whole class logs in at the bell, logins queue for a worker
+instead of piling up CPU work on every session's thread.
+
+Accounts created before this change have bare SHA-256 hex hashes. They still
+verify, and are rehashed with scrypt on the first successful login.
+
+Every login attempt also passes a per-email and a per-client-IP token bucket
+(utils.rate_limiter.TokenBucket), so one account cannot be brute-forced and
+one client cannot hammer the KDF pool. A successful login refills that
+email's bucket. Email and IP buckets are kept in separate stores, and only
+buckets that have refilled completely are ever forgotten, so flooding the
+limiter with new keys cannot reset the counter of an account under attack.
+
+The client IP is the socket peer. X-Forwarded-For is client-controlled, so it
+is only used when LOGIN_TRUSTED_PROXY_HOPS says how many proxies in front of
+the app append to it; the client is then the address the outermost trusted
+proxy saw. Without any usable address the per-IP bucket is skipped.
+
+Settings (env vars):
+- PASSWORD_SCRYPT_N / PASSWORD_SCRYPT_R / PASSWORD_SCRYPT_P: scrypt cost (default 16384 / 8 / 1)
+- PASSWORD_WORKERS: KDF threads (default min(4, CPU count))
+- PASSWORD_MAX_PENDING: queued KDF jobs before logins are turned away (default 256)
+- PASSWORD_TIMEOUT: seconds a login waits for its KDF result (default 30)
+- LOGIN_EMAIL_BURST / LOGIN_EMAIL_PER_MINUTE: attempts per email (default 5 / 5)
+- LOGIN_IP_BURST / LOGIN_IP_PER_MINUTE: attempts per client IP (default 600 / 600;
+  a whole school often shares one address)
+- LOGIN_MAX_TRACKED: buckets kept per store before refilled ones are forgotten (default 50000)
+- LOGIN_TRUSTED_PROXY_HOPS: reverse proxies that append to X-Forwarded-For (default 0: ignore the header)
+"""
+
+import base64
+import hashlib
+import hmac
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+from utils import metrics
+from utils.rate_limiter import TokenBucket
+
+_LEGACY_HASH_RE = re.compile(r"^[0-9a-f]{64}$")
+
+
+class PasswordServiceBusyError(Exception):
+    """Raised when too many password hashes are already queued (or one took too long)."""
+
+
+class LoginRateLimitedError(Exception):
+    """Raised when an email or client has made too many login attempts."""
+
+    def __init__(self, retry_after):
+        super().__init__(f"Too many login attempts, retry in {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+def _b64encode(data):
+    return base64.b64encode(data).decode("ascii")
+
+
+def scrypt_hash(password, n, r, p, salt=None):
+    """Return an encoded scrypt hash of password."""
+    salt = salt if salt is not None else os.urandom(16)
+    digest = hashlib.scrypt(password.encode("utf-8"), salt=salt, n=n, r=r, p=p, maxmem=256 * n * r, dklen=32)
+    return f"scrypt${n}${r}${p}${_b64encode(salt)}${_b64encode(digest)}"
+
+
+def check_password(password, stored):
+    """Return (matches, scheme) for password against a stored hash ("scrypt", "sha256" or None)."""
+    if stored.startswith("scrypt$"):
+        try:
+            _, n, r, p, salt, expected = stored.split("$")
+            n, r, p = int(n), int(r), int(p)
+            salt = base64.b64decode(salt)
+        except ValueError:
+            return False, None
+        candidate = scrypt_hash(password, n, r, p, salt)
+        return hmac.compare_digest(candidate.rsplit("$", 1)[1], expected), "scrypt"
+    if _LEGACY_HASH_RE.match(stored):
+        candidate = hashlib.sha256(password.encode()).hexdigest()
+        return hmac.compare_digest(candidate, stored), "sha256"
+    return False, None
+
+
+class PasswordService:
+    """Runs password hashing and verification on a bounded worker pool."""
+
+    def __init__(self, workers=4, max_pending=256, timeout=30.0, n=16384, r=8, p=1):
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.n, self.r, self.p = n, r, p
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="password-kdf")
+        self._lock = threading.Lock()
+        self._dummy_hash = None
+        self.pending = 0
+        self.hashed = 0
+        self.verified = 0
+        self.upgrades_needed = 0
+        self.rejected = 0
+
+    def _run(self, operation, func, *args):
+        with self._lock:
+            if self.pending >= self.max_pending:
+                self.rejected += 1
+                raise PasswordServiceBusyError("Password service is overloaded")
+            self.pending += 1
+
+        def job():
+            start = time.perf_counter()
+            try:
+                return func(*args)
+            finally:
+                metrics.PASSWORD_KDF_SECONDS.labels(operation).observe(time.perf_counter() - start)
+                with self._lock:
+                    self.pending -= 1
+
+        future = self._executor.submit(job)
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            raise PasswordServiceBusyError("Password check timed out") from None
+
+    def current_params(self):
+        return f"scrypt${self.n}${self.r}${self.p}$"
+
+    def hash(self, password):
+        """Hash a new password with the current scrypt parameters."""
+        result = self._run("hash", scrypt_hash, password, self.n, self.r, self.p)
+        with self._lock:
+            self.hashed += 1
+        return result
+
+    def _check_unknown(self, password):
+        # Runs on the pool like a real check; the dummy hash is made there once
+        with self._lock:
+            dummy_hash = self._dummy_hash
+        if dummy_hash is None:
+            dummy_hash = scrypt_hash(os.urandom(16).hex(), self.n, self.r, self.p)
+            with self._lock:
+                if self._dummy_hash is None:
+                    self._dummy_hash = dummy_hash
+        return check_password(password, dummy_hash)
+
+    def verify(self, password, stored):
+        """
+        Return (matches, needs_upgrade). stored=None (unknown account) runs a
+        dummy check of the same cost on the same pool, so response time does
+        not reveal which emails have accounts.
+        """
+        if stored is None:
+            self._run("verify", self._check_unknown, password)
+            return False, False
+        matches, scheme = self._run("verify", check_password, password, stored)
+        # Legacy SHA-256 and outdated scrypt costs are rehashed after a successful login
+        needs_upgrade = matches and (scheme != "scrypt" or not stored.startswith(self.current_params()))
+        with self._lock:
+            self.verified += 1
+            if needs_upgrade:
+                self.upgrades_needed += 1
+        return matches, needs_upgrade
+
+    def stats(self):
+        """Return counters for monitoring."""
+        with self._lock:
+            return {
+                "pending": self.pending,
+                "hashed": self.hashed,
+                "verified": self.verified,
+                "upgrades_needed": self.upgrades_needed,
+                "rejected": self.rejected,
+            }
+
+
+class _BucketStore:
+    """Token buckets by key. Only full (idle) buckets are evicted, so forgetting one never resets a limit."""
+
+    # Oldest entries inspected per insert while over max_keys
+    EVICT_SCAN = 32
+
+    def __init__(self, rate, capacity, max_keys):
+        self.rate = rate
+        self.capacity = capacity
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+
+    def __len__(self):
+        return len(self._buckets)
+
+    def get(self, key):
+        """Return key's bucket, creating it if needed. Caller holds the limiter lock."""
+        bucket = self._buckets.get(key)
+        if bucket is not None:
+            self._buckets.move_to_end(key)
+            return bucket
+        bucket = self._buckets[key] = TokenBucket(self.rate, self.capacity)
+        self._evict()
+        return bucket
+
+    def _evict(self):
+        # Buckets still refilling are moved to the back instead of dropped; if a
+        # flood keeps every bucket busy the store briefly grows past max_keys
+        for _ in range(self.EVICT_SCAN):
+            if len(self._buckets) <= self.max_keys:
+                return
+            key, bucket = next(iter(self._buckets.items()))
+            if bucket.wait_time(self.capacity) == 0:
+                del self._buckets[key]
+            else:
+                self._buckets.move_to_end(key)
+
+
+class LoginLimiter:
+    """Token buckets per email and per client IP, in separate stores."""
+
+    def __init__(self, email_burst=5, email_per_minute=5, ip_burst=600, ip_per_minute=600, max_keys=50000,
+                 trusted_proxy_hops=0):
+        self.email_burst = email_burst
+        self.trusted_proxy_hops = trusted_proxy_hops
+        self._lock = threading.Lock()
+        self._emails = _BucketStore(email_per_minute / 60.0, email_burst, max_keys)
+        self._ips = _BucketStore(ip_per_minute / 60.0, ip_burst, max_keys)
+        self.limited = 0
+
+    def client_ip(self, peer_ip=None, forwarded_for=None, real_ip=None):
+        """
+        Return the address to rate-limit a request by, or None if there is none.
+        Forwarding headers are only believed behind trusted_proxy_hops proxies.
+        """
+        if self.trusted_proxy_hops > 0:
+            hops = [hop.strip() for hop in (forwarded_for or "").split(",") if hop.strip()]
+            if hops:
+                # Each trusted proxy appended one address; the client is the one the outermost proxy saw
+                return hops[max(len(hops) - self.trusted_proxy_hops, 0)]
+            if real_ip:
+                return real_ip.strip()
+        return peer_ip or None
+
+    def check(self, email, ip):
+        """Consume one attempt for email and ip (None skips the IP bucket), or raise LoginRateLimitedError."""
+        with self._lock:
+            email_bucket = self._emails.get(email.strip().lower())
+            ip_bucket = self._ips.get(ip) if ip else None
+        wait = max(email_bucket.wait_time(1), ip_bucket.wait_time(1) if ip_bucket is not None else 0.0)
+        if wait > 0 or not email_bucket.try_acquire(1):
+            self._count_limited()
+            raise LoginRateLimitedError(max(wait, 1.0))
+        if ip_bucket is not None and not ip_bucket.try_acquire(1):
+            email_bucket.refund(1)
+            self._count_limited()
+            raise LoginRateLimitedError(max(ip_bucket.wait_time(1), 1.0))
+
+    def _count_limited(self):
+        with self._lock:
+            self.limited += 1
+
+    def succeeded(self, email):
+        """Reset an email's allowance after a successful login."""
+        with self._lock:
+            bucket = self._emails.get(email.strip().lower())
+        bucket.refund(self.email_burst)
+
+    def stats(self):
+        """Return counters for monitoring."""
+        with self._lock:
+            return {"tracked_emails": len(self._emails), "tracked_ips": len(self._ips), "limited": self.limited}
+
+
+_service = None
+_limiter = None
+_singletons_lock = threading.Lock()
+
+
+def get_password_service():
+    """Return the process-wide password service."""
+    global _service
+    if _service is None:
+        with _singletons_lock:
+            if _service is None:
+                _service = PasswordService(
+                    workers=int(os.getenv("PASSWORD_WORKERS", str(min(4, os.cpu_count() or 1)))),
+                    max_pending=int(os.getenv("PASSWORD_MAX_PENDING", "256")),
+                    timeout=float(os.getenv("PASSWORD_TIMEOUT", "30")),
+                    n=int(os.getenv("PASSWORD_SCRYPT_N", "16384")),
+                    r=int(os.getenv("PASSWORD_SCRYPT_R", "8")),
+                    p=int(os.getenv("PASSWORD_SCRYPT_P", "1")),
+                )
+    return _service
+
+
+def get_login_limiter():
+    """Return the process-wide login rate limiter."""
+    global _limiter
+    if _limiter is None:
+        with _singletons_lock:
+            if _limiter is None:
+                _limiter = LoginLimiter(
+                    email_burst=float(os.getenv("LOGIN_EMAIL_BURST", "5")),
+                    email_per_minute=float(os.getenv("LOGIN_EMAIL_PER_MINUTE", "5")),
+                    ip_burst=float(os.getenv("LOGIN_IP_BURST", "600")),
+                    ip_per_minute=float(os.getenv("LOGIN_IP_PER_MINUTE", "600")),
+                    max_keys=int(os.getenv("LOGIN_MAX_TRACKED", "50000")),
+                    trusted_proxy_hops=int(os.getenv("LOGIN_TRUSTED_PROXY_HOPS", "0")),
+                )
+    return _limiter
@@ -0,0 +1,208 @@
+"""
+MyGymBro - OpenAI Concurrency Governor
+
+Process-wide admission control for OpenAI calls. When a whole class logs in
+together, requests queue here (FIFO, with a visible queue position) instead of
+all hitting the API at once and failing with 429s.
+
+Limits (env vars):
+- LLM_MAX_CONCURRENT: concurrent upstream streams (default 8)
+- LLM_RPM: requests per minute (default 500)
+- LLM_TPM: tokens per minute, prompt + max completion (default 200000)
+- LLM_MAX_QUEUE: waiting requests before new ones are rejected (default 200)
+- LLM_QUEUE_TIMEOUT: seconds a request may wait in line (default 120)
+"""
+
+import os
+import threading
+import time
+from collections import deque
+
+
+class GovernorBusyError(Exception):
+    """Raised when the wait queue is full (backpressure)."""
+
+
+class GovernorTimeoutError(Exception):
+    """Raised when a request waited in line longer than the queue timeout."""
+
+
+class TokenBucket:
+    """Classic token bucket: refills at rate tokens/second up to capacity."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def wait_time(self, amount):
+        """Seconds until amount tokens are available (0 if available now)."""
+        amount = min(amount, self.capacity)
+        with self._lock:
+            self._refill(time.monotonic())
+            if self.tokens >= amount:
+                return 0.0
+            return (amount - self.tokens) / self.rate
+
+    def try_acquire(self, amount):
+        """Take amount tokens if available. Returns True on success."""
+        amount = min(amount, self.capacity)
+        with self._lock:
+            self._refill(time.monotonic())
+            if self.tokens >= amount:
+                self.tokens -= amount
+                return True
+            return False
+
+    def refund(self, amount):
+        """Give back tokens that were reserved but not used."""
+        if amount <= 0:
+            return
+        with self._lock:
+            self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class Permit:
+    """Admission to make one upstream call; release it when the stream ends."""
+
+    def __init__(self, governor, reserved_tokens):
+        self.governor = governor
+        self.reserved_tokens = reserved_tokens
+        self.used_tokens = None
+        self._released = False
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self.governor._release(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+
+
+class LLMGovernor:
+    """Caps concurrent streams and enforces RPM/TPM budgets with a FIFO wait queue."""
+
+    def __init__(self, max_concurrent=8, requests_per_minute=500, tokens_per_minute=200000,
+                 max_queue=200, queue_timeout=120.0, poll_interval=0.5):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.poll_interval = poll_interval
+        self.request_bucket = TokenBucket(requests_per_minute / 60.0, max(requests_per_minute / 60.0, 1.0) * 10)
+        self.token_bucket = TokenBucket(tokens_per_minute / 60.0, tokens_per_minute)
+        self._cond = threading.Condition()
+        self._queue = deque()
+        self.active = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.max_queue_depth = 0
+        self.total_wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self._recent_waits = deque(maxlen=1000)
+
+    def acquire(self, estimated_tokens, on_wait=None):
+        """
+        Block until this request may call the API and return a Permit.
+        on_wait(position, waited_seconds) is called while queued (position is 1-based).
+        """
+        ticket = object()
+        start = time.monotonic()
+        with self._cond:
+            if len(self._queue) >= self.max_queue:
+                self.rejected += 1
+                raise GovernorBusyError("Too many requests are waiting for MyGymBro right now")
+            self._queue.append(ticket)
+            self.max_queue_depth = max(self.max_queue_depth, len(self._queue))
+            try:
+                while True:
+                    wait = self.poll_interval
+                    if self._queue[0] is ticket and self.active < self.max_concurrent:
+                        wait = max(self.request_bucket.wait_time(1), self.token_bucket.wait_time(estimated_tokens))
+                        if wait == 0 and self.request_bucket.try_acquire(1) and self.token_bucket.try_acquire(estimated_tokens):
+                            self._queue.popleft()
+                            self.active += 1
+                            self._cond.notify_all()
+                            break
+                        wait = min(max(wait, 0.01), self.poll_interval)
+
+                    waited = time.monotonic() - start
+                    if waited >= self.queue_timeout:
+                        self.timeouts += 1
+                        raise GovernorTimeoutError("Timed out waiting for an available MyGymBro slot")
+                    if on_wait is not None:
+                        on_wait(self._queue.index(ticket) + 1, waited)
+                    self._cond.wait(min(wait, self.queue_timeout - waited))
+            except BaseException:
+                if ticket in self._queue:
+                    self._queue.remove(ticket)
+                    self._cond.notify_all()
+                raise
+
+            waited = time.monotonic() - start
+            self.admitted += 1
+            self.total_wait_seconds += waited
+            self.max_wait_seconds = max(self.max_wait_seconds, waited)
+            self._recent_waits.append(waited)
+        return Permit(self, estimated_tokens)
+
+    def _release(self, permit):
+        if permit.used_tokens is not None:
+            # Return the part of the reservation the request did not actually use
+            self.token_bucket.refund(permit.reserved_tokens - permit.used_tokens)
+        with self._cond:
+            self.active -= 1
+            self._cond.notify_all()
+
+    def stats(self):
+        """Return queue depth and wait-time metrics."""
+        with self._cond:
+            waits = sorted(self._recent_waits)
+
+            def percentile(p):
+                if not waits:
+                    return 0.0
+                return round(waits[min(len(waits) - 1, int(p * len(waits)))], 3)
+
+            return {
+                "active": self.active,
+                "queue_depth": len(self._queue),
+                "max_queue_depth": self.max_queue_depth,
+                "admitted": self.admitted,
+                "rejected": self.rejected,
+                "timeouts": self.timeouts,
+                "avg_wait_seconds": round(self.total_wait_seconds / self.admitted, 3) if self.admitted else 0.0,
+                "p50_wait_seconds": percentile(0.5),
+                "p95_wait_seconds": percentile(0.95),
+                "max_wait_seconds": round(self.max_wait_seconds, 3),
+            }
+
+
+_governor = None
+_governor_lock = threading.Lock()
+
+
+def get_llm_governor():
+    """Return the process-wide OpenAI governor."""
+    global _governor
+    if _governor is None:
+        with _governor_lock:
+            if _governor is None:
+                _governor = LLMGovernor(
+                    max_concurrent=int(os.getenv("LLM_MAX_CONCURRENT", "8")),
+                    requests_per_minute=float(os.getenv("LLM_RPM", "500")),
+                    tokens_per_minute=float(os.getenv("LLM_TPM", "200000")),
+                    max_queue=int(os.getenv("LLM_MAX_QUEUE", "200")),
+                    queue_timeout=float(os.getenv("LLM_QUEUE_TIMEOUT", "120")),
+                )
+    return _governor
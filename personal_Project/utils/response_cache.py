@@ -0,0 +1,168 @@
+"""
+MyGymBro - AI Response Cache
+
+The sidebar workout buttons build their prompts only from the user's profile
+(age, gender, fitness level, frequency, sports), so many students send
+byte-identical prompts. Responses are cached by normalized prompt, language,
+system-prompt version and equipment-catalog hash, so repeats replay instantly
+without another API call.
+
+Settings (env vars):
+- RESPONSE_CACHE_MAX_ENTRIES: in-memory LRU size (default 256)
+- RESPONSE_CACHE_TTL: seconds before an entry expires (default 21600 = 6h)
+- RESPONSE_CACHE_DIR: optional directory for an on-disk tier shared across restarts
+  (best effort: disk I/O runs outside the cache lock, and read or write errors
+  only count as disk_errors)
+"""
+
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+
+def normalize_prompt(prompt):
+    """Collapse whitespace and case so trivially different prompts share a cache entry."""
+    return re.sub(r"\s+", " ", prompt).strip().lower()
+
+
+class ResponseCache:
+    """LRU + TTL cache of complete AI responses with an optional disk tier."""
+
+    def __init__(self, max_entries=256, ttl_seconds=21600, disk_dir=None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.disk_dir = Path(disk_dir) if disk_dir else None
+        if self.disk_dir is not None:
+            self.disk_dir.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.disk_errors = 0
+
+    @staticmethod
+    def make_key(prompt, language, system_prompt_version, catalog_fingerprint):
+        """Build the cache key for one request."""
+        raw = json.dumps([normalize_prompt(prompt), language, system_prompt_version, catalog_fingerprint])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _disk_path(self, key):
+        return self.disk_dir / f"{key}.json"
+
+    def _read_disk(self, key, now):
+        if self.disk_dir is None:
+            return None
+        path = self._disk_path(key)
+        try:
+            with open(path, 'r') as f:
+                entry = json.load(f)
+            created_at, response = entry["created_at"], entry["response"]
+            if now - created_at > self.ttl_seconds:
+                path.unlink(missing_ok=True)
+                return None
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError, TypeError):
+            self._count_disk_error()
+            return None
+        return created_at, response
+
+    def _write_disk(self, key, created_at, response):
+        if self.disk_dir is None:
+            return
+        path = self._disk_path(key)
+        tmp_path = path.with_name(path.name + f".tmp{os.getpid()}.{threading.get_ident()}")
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump({"created_at": created_at, "response": response}, f)
+            os.replace(tmp_path, path)
+        except OSError:
+            # Disk full or read-only: the answer has already been shown, so only the disk copy is lost
+            try:
+                tmp_path.unlink(missing_ok=True)
+            except OSError:
+                pass
+            self._count_disk_error()
+
+    def _count_disk_error(self):
+        with self._lock:
+            self.disk_errors += 1
+
+    def _remember(self, key, created_at, response):
+        self._entries[key] = (created_at, response)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def get(self, key):
+        """Return the cached response for key, or None."""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if now - entry[0] <= self.ttl_seconds:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                del self._entries[key]
+
+        # File I/O outside the lock, so memory hits never wait behind the disk
+        entry = self._read_disk(key, now)
+        with self._lock:
+            if entry is not None:
+                self._remember(key, *entry)
+                self.disk_hits += 1
+                return entry[1]
+            self.misses += 1
+            return None
+
+    def put(self, key, response):
+        """Store a complete response (the disk copy is best effort)."""
+        created_at = time.time()
+        with self._lock:
+            self._remember(key, created_at, response)
+        self._write_disk(key, created_at, response)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Return cache counters for monitoring."""
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": round((self.hits + self.disk_hits) / lookups, 3) if lookups else 0.0,
+                "evictions": self.evictions,
+                "disk_errors": self.disk_errors,
+            }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_response_cache():
+    """Return the process-wide response cache."""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ResponseCache(
+                    max_entries=int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "256")),
+                    ttl_seconds=float(os.getenv("RESPONSE_CACHE_TTL", "21600")),
+                    disk_dir=os.getenv("RESPONSE_CACHE_DIR") or None,
+                )
+    return _cache
@@ -0,0 +1,266 @@
+"""
+MyGymBro - Persistent Sessions
+
+st.session_state is lost when the browser refreshes. Pages therefore keep a
+signed, expiring session token in the URL (?session=...) and restore the
+login from it instead of sending the student back to the login page.
+
+Token format: "<session id>.<expiry unix time>.<HMAC-SHA256 signature>".
+Forged or expired tokens are rejected from the signature and expiry alone,
+without a database read. Valid tokens are then looked up in a small
+server-side table (data/sessions.db, one row per session, so logout and
+expiry can revoke a token) behind an in-memory LRU. A restore is one dict
+lookup for the session plus one for the user record in the shared
+CachedUserStore; nothing re-reads users.json.
+
+Settings (env vars):
+- SESSION_SECRET: HMAC key (default: a random key generated once into data/session_secret,
+  shared by every process using the same data directory)
+- SESSION_TTL_HOURS: token lifetime (default 168, one week)
+- SESSION_CACHE_MAX: sessions kept in memory, least recently used dropped (default 10000)
+"""
+
+import base64
+import hashlib
+import hmac
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+from utils.user_store import get_user_store
+
+# Data directory setup
+DATA_DIR = Path("data")
+SESSIONS_DB_FILE = DATA_DIR / "sessions.db"
+SESSION_SECRET_FILE = DATA_DIR / "session_secret"
+
+SESSION_QUERY_PARAM = "session"
+
+# Expired rows are deleted every this many new sessions
+PURGE_EVERY = 500
+
+
+def _load_secret(path):
+    """Return the HMAC key from SESSION_SECRET, or from path (created on first use)."""
+    secret = os.getenv("SESSION_SECRET")
+    if secret:
+        return secret.encode("utf-8")
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        # O_EXCL: when several workers start at once, only one writes the key
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        pass
+    else:
+        with os.fdopen(fd, 'w') as f:
+            f.write(os.urandom(32).hex())
+    for _ in range(50):
+        key = path.read_text().strip()
+        if key:
+            return key.encode("utf-8")
+        # Another process created the file and has not written it yet
+        time.sleep(0.01)
+    raise RuntimeError(f"Session secret file {path} is empty")
+
+
+class SessionStore:
+    """Signed session tokens backed by a SQLite table with an LRU in front."""
+
+    def __init__(self, db_path=SESSIONS_DB_FILE, secret=None, ttl_seconds=7 * 24 * 3600, max_cached=10000):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.secret = secret if secret is not None else _load_secret(SESSION_SECRET_FILE)
+        self.ttl_seconds = ttl_seconds
+        self.max_cached = max_cached
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        # session id -> (email, expires_at)
+        self._cache = OrderedDict()
+        self.created = 0
+        self.revoked = 0
+        self.hits = 0
+        self.misses = 0
+        self.rejected = 0
+        self._init_schema()
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _init_schema(self):
+        conn = self._connect()
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS sessions (
+                session_id TEXT PRIMARY KEY,
+                email TEXT NOT NULL,
+                expires_at INTEGER NOT NULL
+            )
+            """
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS sessions_expires_at ON sessions (expires_at)")
+
+    def _sign(self, payload):
+        digest = hmac.new(self.secret, payload.encode("ascii"), hashlib.sha256).digest()
+        return base64.urlsafe_b64encode(digest).rstrip(b"=").decode("ascii")
+
+    def _remember(self, session_id, email, expires_at):
+        # Caller holds the lock
+        self._cache[session_id] = (email, expires_at)
+        self._cache.move_to_end(session_id)
+        while len(self._cache) > self.max_cached:
+            self._cache.popitem(last=False)
+
+    def _parse(self, token):
+        """Return (session id, expires_at) if token is well formed, correctly signed and unexpired."""
+        try:
+            session_id, expires, signature = token.split(".")
+            expires_at = int(expires)
+        except (AttributeError, ValueError):
+            return None
+        if not hmac.compare_digest(signature, self._sign(f"{session_id}.{expires}")):
+            return None
+        if expires_at <= time.time():
+            return None
+        return session_id, expires_at
+
+    def create(self, email):
+        """Start a session for email and return its token."""
+        session_id = base64.urlsafe_b64encode(os.urandom(18)).decode("ascii")
+        expires_at = int(time.time() + self.ttl_seconds)
+        conn = self._connect()
+        conn.execute(
+            "INSERT INTO sessions (session_id, email, expires_at) VALUES (?, ?, ?)",
+            (session_id, email, expires_at),
+        )
+        with self._lock:
+            self._remember(session_id, email, expires_at)
+            self.created += 1
+            purge = self.created % PURGE_EVERY == 0
+        if purge:
+            self.purge_expired()
+        return f"{session_id}.{expires_at}.{self._sign(f'{session_id}.{expires_at}')}"
+
+    def resolve(self, token):
+        """Return the email a valid, unrevoked token belongs to, or None."""
+        parsed = self._parse(token)
+        if parsed is None:
+            with self._lock:
+                self.rejected += 1
+            return None
+        session_id = parsed[0]
+        with self._lock:
+            entry = self._cache.get(session_id)
+            if entry is not None:
+                self._cache.move_to_end(session_id)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+        row = self._connect().execute(
+            "SELECT email, expires_at FROM sessions WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        if row is None or row[1] <= time.time():
+            return None
+        with self._lock:
+            self._remember(session_id, row[0], row[1])
+        return row[0]
+
+    def revoke(self, token):
+        """End the session behind token (unknown or invalid tokens are ignored)."""
+        parsed = self._parse(token)
+        if parsed is None:
+            return
+        self._connect().execute("DELETE FROM sessions WHERE session_id = ?", (parsed[0],))
+        with self._lock:
+            self._cache.pop(parsed[0], None)
+            self.revoked += 1
+
+    def purge_expired(self):
+        """Delete expired sessions from the table and the cache."""
+        now = time.time()
+        self._connect().execute("DELETE FROM sessions WHERE expires_at <= ?", (int(now),))
+        with self._lock:
+            for session_id in [key for key, (_, expires_at) in self._cache.items() if expires_at <= now]:
+                del self._cache[session_id]
+
+    def stats(self):
+        """Return counters for monitoring."""
+        with self._lock:
+            return {
+                "cached": len(self._cache),
+                "created": self.created,
+                "revoked": self.revoked,
+                "hits": self.hits,
+                "misses": self.misses,
+                "rejected": self.rejected,
+            }
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_session_store():
+    """Return the process-wide session store."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = SessionStore(
+                    SESSIONS_DB_FILE,
+                    ttl_seconds=float(os.getenv("SESSION_TTL_HOURS", "168")) * 3600,
+                    max_cached=int(os.getenv("SESSION_CACHE_MAX", "10000")),
+                )
+    return _store
+
+
+def start_session(session_state, query_params, email):
+    """Issue a token for a fresh login and put it in the URL. Pass st.session_state and st.query_params."""
+    token = get_session_store().create(email)
+    session_state["session_token"] = token
+    query_params[SESSION_QUERY_PARAM] = token
+
+
+def restore_session(session_state, query_params):
+    """
+    Page guard: return True if the user is logged in, restoring the login from
+    the URL token after a browser refresh. Also puts the token back in the
+    URL, since st.switch_page drops query parameters.
+    """
+    if session_state.get("authenticated", False):
+        token = session_state.get("session_token")
+        if token and query_params.get(SESSION_QUERY_PARAM) != token:
+            query_params[SESSION_QUERY_PARAM] = token
+        return True
+    token = query_params.get(SESSION_QUERY_PARAM)
+    if not token:
+        return False
+    email = get_session_store().resolve(token)
+    user_data = get_user_store().get(email) if email else None
+    if user_data is None:
+        # Expired, revoked or forged; drop it so the login page starts clean
+        del query_params[SESSION_QUERY_PARAM]
+        return False
+    session_state["authenticated"] = True
+    session_state["user_email"] = email
+    session_state["user_data"] = user_data
+    session_state["session_token"] = token
+    return True
+
+
+def end_session(session_state, query_params):
+    """Revoke the current token on logout and remove it from the URL."""
+    token = session_state.pop("session_token", None)
+    if token:
+        get_session_store().revoke(token)
+    if SESSION_QUERY_PARAM in query_params:
+        del query_params[SESSION_QUERY_PARAM]
@@ -0,0 +1,169 @@
+"""
+MyGymBro - Single-Flight Streaming
+
+When a whole class clicks the same sidebar button at once, identical requests
+attach to one upstream stream instead of each calling the API. The first
+caller starts the producer on a background thread; every subscriber (including
+late joiners, who first receive the already-buffered prefix) gets the chunks
+as they arrive.
+
+When the last subscriber leaves before the stream is finished (its request
+was cancelled, or its consumer went away), the flight is cancelled through
+flight.cancel_token so the producer can close the upstream call early.
+"""
+
+import threading
+
+from utils.cancellation import CancelToken, RequestCancelled
+
+
+class Flight:
+    """One in-flight upstream stream and its buffered chunks."""
+
+    def __init__(self, key):
+        self.key = key
+        self.chunks = []
+        self.done = False
+        self.error = None
+        self.subscribers = 0
+        # Producer-reported status (e.g. queue position) shown to every subscriber while waiting
+        self.status = None
+        self.status_version = 0
+        self.condition = threading.Condition()
+        # Cancelled when every subscriber has left; producers pass it upstream
+        self.cancel_token = CancelToken(request_id=key)
+
+    def set_status(self, status):
+        """Publish a status update to all subscribers."""
+        with self.condition:
+            self.status = status
+            self.status_version += 1
+            self.condition.notify_all()
+
+
+class SingleFlight:
+    """Coalesces concurrent identical streaming requests."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights = {}
+        self.upstream_calls = 0
+        self.coalesced = 0
+        self.cancelled = 0
+
+    def stream(self, key, producer, on_status=None, cancel_token=None):
+        """
+        Yield chunks for key. producer is called with the Flight and returns an
+        iterator of chunks; it only runs if no identical request is in flight.
+        on_status(status) is called in the subscriber's thread whenever the
+        producer publishes a status. Exceptions raised by the producer are
+        re-raised in every subscriber. Cancelling cancel_token makes this
+        subscriber raise RequestCancelled and leave the flight.
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            is_leader = flight is None
+            if is_leader:
+                flight = Flight(key)
+                self._flights[key] = flight
+                self.upstream_calls += 1
+            else:
+                self.coalesced += 1
+            flight.subscribers += 1
+
+        if is_leader:
+            # Run upstream on its own thread so it keeps feeding joiners even if the leader's session goes away
+            threading.Thread(target=self._run, args=(flight, producer), daemon=True).start()
+
+        if cancel_token is not None:
+            def wake():
+                with flight.condition:
+                    flight.condition.notify_all()
+            cancel_token.add_callback(wake)
+
+        try:
+            index = 0
+            seen_status = 0
+            while True:
+                with flight.condition:
+                    while (index >= len(flight.chunks) and not flight.done and flight.status_version == seen_status
+                           and not (cancel_token is not None and cancel_token.cancelled)):
+                        flight.condition.wait()
+                    if cancel_token is not None:
+                        cancel_token.raise_if_cancelled()
+                    new_chunks = flight.chunks[index:]
+                    index += len(new_chunks)
+                    finished = flight.done and index >= len(flight.chunks)
+                    error = flight.error
+                    status_changed = flight.status_version != seen_status
+                    seen_status = flight.status_version
+                    status = flight.status
+                if status_changed and on_status is not None:
+                    on_status(status)
+                for chunk in new_chunks:
+                    yield chunk
+                if finished:
+                    if error is not None:
+                        raise error
+                    return
+        finally:
+            self._leave(flight, cancel_token.reason if cancel_token is not None and cancel_token.cancelled else "abandoned")
+
+    def _leave(self, flight, reason):
+        # Under self._lock so nobody can join a flight that is being cancelled
+        with self._lock:
+            with flight.condition:
+                flight.subscribers -= 1
+                abandoned = flight.subscribers == 0 and not flight.done
+            if abandoned:
+                if self._flights.get(flight.key) is flight:
+                    del self._flights[flight.key]
+                self.cancelled += 1
+        if abandoned:
+            flight.cancel_token.cancel(reason)
+
+    def _run(self, flight, producer):
+        chunks = None
+        try:
+            chunks = producer(flight)
+            for chunk in chunks:
+                if flight.cancel_token.cancelled:
+                    break
+                with flight.condition:
+                    flight.chunks.append(chunk)
+                    flight.condition.notify_all()
+        except Exception as e:
+            # A cancelled upstream call usually ends in an error from its closed response; nobody is listening
+            if not flight.cancel_token.cancelled:
+                with flight.condition:
+                    flight.error = e
+        finally:
+            try:
+                # Close a producer that stopped early right away (releases its governor slot and upstream response)
+                if hasattr(chunks, "close"):
+                    chunks.close()
+            finally:
+                with self._lock:
+                    if self._flights.get(flight.key) is flight:
+                        del self._flights[flight.key]
+                with flight.condition:
+                    flight.done = True
+                    flight.condition.notify_all()
+
+    def stats(self):
+        """Return coalescing counters for monitoring."""
+        with self._lock:
+            return {
+                "in_flight": len(self._flights),
+                "upstream_calls": self.upstream_calls,
+                "coalesced_requests": self.coalesced,
+                "cancelled_flights": self.cancelled,
+            }
+
+
+_single_flight = SingleFlight()
+
+
+def get_single_flight():
+    """Return the process-wide single-flight group for LLM streams."""
+    return _single_flight
@@ -0,0 +1,168 @@
+"""
+MyGymBro - Chat Transcripts
+
+Per-user, append-only chat log so conversations survive a refresh or logout.
+Each user gets a directory under data/transcripts/ with:
+- seg-000001.jsonl, seg-000002.jsonl, ...: one JSON record per message,
+  rolled over to a new segment file once a segment passes the size limit
+- index.bin: one fixed-size record per message (segment, offset, length),
+  so message N is found with a single seek without reading any segment
+
+Appending a message writes one line and one index record (O(message)); the
+history and users.json are never rewritten. Readers use the index to load
+only the page they need (the latest page on login, older pages on demand).
+
+Settings (env vars):
+- TRANSCRIPT_DIR: root directory (default data/transcripts)
+- TRANSCRIPT_SEGMENT_BYTES: segment size before rolling over (default 1 MB)
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import struct
+import threading
+import time
+from pathlib import Path
+
+from utils.instrumentation import timed
+
+# Data directory setup
+DATA_DIR = Path("data")
+
+# Index record: segment number, byte offset in the segment, record length
+INDEX_RECORD = struct.Struct("<IQI")
+
+# Appends to one user's log are serialized by one of this many shared locks
+LOCK_STRIPES = 64
+
+# Message fields worth persisting ("parsed" is re-derived lazily by the workout parser)
+PERSISTED_FIELDS = ("role", "content", "workout", "prompt")
+
+
+class TranscriptStore:
+    """Append-only per-user message log with an offset index."""
+
+    def __init__(self, root, segment_bytes=1024 * 1024):
+        self.root = Path(root)
+        self.segment_bytes = segment_bytes
+        # Fixed pool keyed by the user's directory, so every spelling of an email shares a lock
+        self._locks = [threading.Lock() for _ in range(LOCK_STRIPES)]
+        self.appends = 0
+        self.pages_read = 0
+
+    @staticmethod
+    def _user_key(email):
+        # Hashed so emails never appear in file names
+        return hashlib.sha256(email.strip().lower().encode("utf-8")).hexdigest()[:24]
+
+    def _user_dir(self, email):
+        return self.root / self._user_key(email)
+
+    def _lock_for(self, email):
+        return self._locks[int(self._user_key(email), 16) % LOCK_STRIPES]
+
+    @staticmethod
+    def _segment_path(user_dir, segment):
+        return user_dir / f"seg-{segment:06d}.jsonl"
+
+    def _read_index(self, user_dir, start, stop):
+        """Return index records [start, stop)."""
+        if stop <= start:
+            return []
+        with open(user_dir / "index.bin", "rb") as f:
+            f.seek(start * INDEX_RECORD.size)
+            data = f.read((stop - start) * INDEX_RECORD.size)
+        return [INDEX_RECORD.unpack_from(data, i) for i in range(0, len(data) - INDEX_RECORD.size + 1, INDEX_RECORD.size)]
+
+    def count(self, email):
+        """Number of messages stored for email."""
+        try:
+            size = (self._user_dir(email) / "index.bin").stat().st_size
+        except FileNotFoundError:
+            return 0
+        # A torn trailing record (crash mid-append) is ignored
+        return size // INDEX_RECORD.size
+
+    def append(self, email, message):
+        """Append one message to the user's transcript."""
+        record = {key: message[key] for key in PERSISTED_FIELDS if message.get(key) is not None}
+        record["ts"] = time.time()
+        line = (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+        user_dir = self._user_dir(email)
+        index_path = user_dir / "index.bin"
+
+        with self._lock_for(email):
+            user_dir.mkdir(parents=True, exist_ok=True)
+            with open(index_path, "ab") as index_file:
+                index_size = index_file.tell()
+                if index_size % INDEX_RECORD.size:
+                    # Drop a torn record left by an interrupted append
+                    index_size -= index_size % INDEX_RECORD.size
+                    index_file.truncate(index_size)
+                segment = 1
+                if index_size:
+                    segment = self._read_index(user_dir, index_size // INDEX_RECORD.size - 1, index_size // INDEX_RECORD.size)[0][0]
+                segment_path = self._segment_path(user_dir, segment)
+                if segment_path.exists() and segment_path.stat().st_size >= self.segment_bytes:
+                    segment += 1
+                    segment_path = self._segment_path(user_dir, segment)
+
+                # Data first, then the index record that makes it visible
+                with open(segment_path, "ab") as segment_file:
+                    offset = segment_file.tell()
+                    segment_file.write(line)
+                index_file.write(INDEX_RECORD.pack(segment, offset, len(line)))
+            self.appends += 1
+
+    @timed("transcript_read")
+    def read_page(self, email, before=None, limit=20):
+        """
+        Return (messages, start) for up to limit messages ending just before
+        index `before` (default: the end of the log). start is the index of the
+        first returned message; 0 means there is nothing older.
+        """
+        user_dir = self._user_dir(email)
+        stop = self.count(email) if before is None else min(before, self.count(email))
+        start = max(0, stop - limit)
+        messages = []
+        handles = {}
+        try:
+            for segment, offset, length in self._read_index(user_dir, start, stop):
+                segment_file = handles.get(segment)
+                if segment_file is None:
+                    segment_file = handles[segment] = open(self._segment_path(user_dir, segment), "rb")
+                segment_file.seek(offset)
+                messages.append(json.loads(segment_file.read(length)))
+        finally:
+            for segment_file in handles.values():
+                segment_file.close()
+        self.pages_read += 1
+        return messages, start
+
+    def clear(self, email):
+        """Delete the user's whole transcript."""
+        with self._lock_for(email):
+            shutil.rmtree(self._user_dir(email), ignore_errors=True)
+
+    def stats(self):
+        """Return counters for monitoring."""
+        return {"appends": self.appends, "pages_read": self.pages_read}
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_transcript_store():
+    """Return the process-wide transcript store."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = TranscriptStore(
+                    os.getenv("TRANSCRIPT_DIR") or DATA_DIR / "transcripts",
+                    segment_bytes=int(os.getenv("TRANSCRIPT_SEGMENT_BYTES", str(1024 * 1024))),
+                )
+    return _store
@@ -0,0 +1,467 @@
+"""
+MyGymBro - User Store
+
+All pages read and write user accounts through one shared interface keyed by
+email. The default backend is SQLite in WAL mode, so a profile update touches a
+single row instead of re-serializing the whole user directory, and concurrent
+sessions no longer overwrite each other's writes.
+
+Backend selection (USER_STORE_BACKEND env var):
+- "sqlite" (default): data/users.db, one JSON record per email
+- "json": legacy data/users.json, whole-file rewrites (kept for debugging)
+
+Either backend is wrapped in a process-wide CachedUserStore, so Streamlit
+reruns and concurrent sessions share one parsed copy of each record instead of
+hitting the backend every time. The cache is invalidated when the backend
+files change on disk (mtime/size) and is updated in place by the save path.
+It keeps at most USER_CACHE_MAX_RECORDS records (default 10000, least
+recently used dropped first), so memory stays flat however many accounts exist.
+
+Login only needs one field, so get_password_hash() reads just the stored hash
+(one indexed SQLite lookup, O(log N)) and never materializes or caches the
+record; the full record is loaded only after the password matched.
+
+The first time the SQLite store is opened on an empty database, existing
+accounts are imported from data/users.json. The importer can also be run by
+hand:
+
+    python -m utils.user_store import-json [--path data/users.json] [--overwrite]
+"""
+
+import argparse
+import copy
+import json
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from pathlib import Path
+
+from utils import metrics
+from utils.instrumentation import timed
+
+# Data directory setup
+DATA_DIR = Path("data")
+USERS_FILE = DATA_DIR / "users.json"
+USERS_DB_FILE = DATA_DIR / "users.db"
+
+
+class UserStore:
+    """Interface shared by all user storage backends."""
+
+    def get(self, email):
+        """Return the user record for email, or None."""
+        raise NotImplementedError
+
+    def get_password_hash(self, email):
+        """Return the stored password hash for email, or None if there is no such account."""
+        user = self.get(email)
+        return user.get("password") if user else None
+
+    def exists(self, email):
+        """Return True if an account exists for email."""
+        return self.get(email) is not None
+
+    def create(self, email, user_data):
+        """Insert a new user. Returns False if the email is already taken."""
+        raise NotImplementedError
+
+    def put(self, email, user_data):
+        """Insert or replace the full record for email."""
+        raise NotImplementedError
+
+    def update(self, email, updated_data):
+        """Merge updated_data into the record for email and return the new record (None if missing)."""
+        raise NotImplementedError
+
+    def count(self):
+        """Return the number of stored users."""
+        raise NotImplementedError
+
+    def version_stamp(self):
+        """Return a value that changes whenever the backing files change on disk."""
+        return None
+
+    def close(self):
+        """Release any resources held by the backend."""
+
+
+def _file_stamp(*paths):
+    """Return (mtime_ns, size) for each path, or None for missing files."""
+    stamp = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            stamp.append((stat.st_mtime_ns, stat.st_size))
+        except FileNotFoundError:
+            stamp.append(None)
+    return tuple(stamp)
+
+
+class SQLiteUserStore(UserStore):
+    """SQLite (WAL mode) backend with per-record reads and writes."""
+
+    def __init__(self, db_path=USERS_DB_FILE):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        # Streamlit runs every session on its own thread, so each thread gets its own connection
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+        self._init_schema()
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=30000")
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
+    def _init_schema(self):
+        conn = self._connect()
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS users (
+                email TEXT PRIMARY KEY,
+                data TEXT NOT NULL,
+                updated_at TEXT NOT NULL
+            )
+            """
+        )
+        conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+
+    def get(self, email):
+        row = self._connect().execute("SELECT data FROM users WHERE email = ?", (email,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def exists(self, email):
+        row = self._connect().execute("SELECT 1 FROM users WHERE email = ?", (email,)).fetchone()
+        return row is not None
+
+    def get_password_hash(self, email):
+        # json_extract reads one field inside SQLite; the record is never parsed in Python
+        try:
+            row = self._connect().execute(
+                "SELECT json_extract(data, '$.password') FROM users WHERE email = ?", (email,)
+            ).fetchone()
+        except sqlite3.OperationalError:
+            # SQLite built without the JSON1 functions
+            return super().get_password_hash(email)
+        return row[0] if row else None
+
+    def create(self, email, user_data):
+        cursor = self._connect().execute(
+            "INSERT OR IGNORE INTO users (email, data, updated_at) VALUES (?, ?, ?)",
+            (email, json.dumps(user_data), datetime.now().isoformat()),
+        )
+        return cursor.rowcount == 1
+
+    def put(self, email, user_data):
+        self._connect().execute(
+            "INSERT OR REPLACE INTO users (email, data, updated_at) VALUES (?, ?, ?)",
+            (email, json.dumps(user_data), datetime.now().isoformat()),
+        )
+
+    def update(self, email, updated_data):
+        conn = self._connect()
+        # BEGIN IMMEDIATE takes the write lock up front so concurrent
+        # read-modify-write cycles on the same record cannot interleave
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT data FROM users WHERE email = ?", (email,)).fetchone()
+            if row is None:
+                conn.execute("ROLLBACK")
+                return None
+            user_data = json.loads(row[0])
+            user_data.update(updated_data)
+            conn.execute(
+                "UPDATE users SET data = ?, updated_at = ? WHERE email = ?",
+                (json.dumps(user_data), datetime.now().isoformat(), email),
+            )
+            conn.execute("COMMIT")
+            return user_data
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def count(self):
+        return self._connect().execute("SELECT COUNT(*) FROM users").fetchone()[0]
+
+    def get_meta(self, key, default=None):
+        row = self._connect().execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def set_meta(self, key, value):
+        self._connect().execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, str(value)))
+
+    def version_stamp(self):
+        # In WAL mode committed writes land in the -wal file first
+        return _file_stamp(self.db_path, f"{self.db_path}-wal")
+
+    def close(self):
+        with self._connections_lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections = []
+        self._local = threading.local()
+
+
+class JsonUserStore(UserStore):
+    """Legacy backend that keeps every user in a single users.json file."""
+
+    def __init__(self, json_path=USERS_FILE):
+        self.json_path = Path(json_path)
+        self._lock = threading.Lock()
+
+    @timed("users_json_parse")
+    def _load(self):
+        if self.json_path.exists():
+            with open(self.json_path, 'r') as f:
+                return json.load(f)
+        return {}
+
+    def _save(self, users):
+        self.json_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.json_path, 'w') as f:
+            json.dump(users, f, indent=2)
+
+    def get(self, email):
+        return self._load().get(email)
+
+    def load_all(self):
+        """Return the full parsed user directory."""
+        return self._load()
+
+    def create(self, email, user_data):
+        with self._lock:
+            users = self._load()
+            if email in users:
+                return False
+            users[email] = user_data
+            self._save(users)
+            return True
+
+    def put(self, email, user_data):
+        with self._lock:
+            users = self._load()
+            users[email] = user_data
+            self._save(users)
+
+    def update(self, email, updated_data):
+        with self._lock:
+            users = self._load()
+            if email not in users:
+                return None
+            users[email].update(updated_data)
+            self._save(users)
+            return users[email]
+
+    def count(self):
+        return len(self._load())
+
+    def version_stamp(self):
+        return _file_stamp(self.json_path)
+
+
+_MISSING = object()
+
+
+class CachedUserStore(UserStore):
+    """
+    Process-wide read-through cache in front of a backend store.
+    Records are shared by every session, so callers always receive copies.
+    """
+
+    def __init__(self, backend, max_records=10000):
+        self.backend = backend
+        self.max_records = max_records
+        self._lock = threading.Lock()
+        self._records = OrderedDict()
+        # Backends that can only load everything at once (users.json) are parsed once and cached whole
+        self._complete = False
+        self._stamp = backend.version_stamp()
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.evictions = 0
+
+    def _check_stamp(self):
+        """Drop every cached record if the backend changed behind our back."""
+        stamp = self.backend.version_stamp()
+        if stamp != self._stamp:
+            self._records.clear()
+            self._complete = False
+            self._stamp = stamp
+            self.invalidations += 1
+
+    def _remember(self, email, user_data):
+        self._records[email] = user_data
+        self._records.move_to_end(email)
+        if not self._complete:
+            while len(self._records) > self.max_records:
+                self._records.popitem(last=False)
+                self.evictions += 1
+
+    def _store_local(self, email, user_data):
+        """Update the cache in place after a write made through this process."""
+        self._remember(email, user_data)
+        self._stamp = self.backend.version_stamp()
+        self.version += 1
+
+    @timed("user_lookup")
+    @metrics.timed_operation(metrics.USER_STORE_SECONDS, "get")
+    def get(self, email):
+        with self._lock:
+            self._check_stamp()
+            record = self._records.get(email, _MISSING)
+            if record is _MISSING and self._complete:
+                record = None
+            if record is not _MISSING:
+                self.hits += 1
+                if not self._complete:
+                    self._records.move_to_end(email)
+                return copy.deepcopy(record)
+
+            self.misses += 1
+            if hasattr(self.backend, "load_all"):
+                self._records = OrderedDict(self.backend.load_all())
+                self._complete = True
+                record = self._records.get(email)
+            else:
+                record = self.backend.get(email)
+                self._remember(email, record)
+            return copy.deepcopy(record)
+
+    @metrics.timed_operation(metrics.USER_STORE_SECONDS, "get_password_hash")
+    def get_password_hash(self, email):
+        with self._lock:
+            self._check_stamp()
+            record = self._records.get(email, _MISSING)
+            if record is _MISSING and self._complete:
+                record = None
+            if record is not _MISSING:
+                return record.get("password") if record else None
+            # Not cached: read only the hash, so failed logins never pull records into memory
+            return self.backend.get_password_hash(email)
+
+    @metrics.timed_operation(metrics.USER_STORE_SECONDS, "create")
+    def create(self, email, user_data):
+        with self._lock:
+            created = self.backend.create(email, user_data)
+            if created:
+                self._store_local(email, copy.deepcopy(user_data))
+            return created
+
+    @metrics.timed_operation(metrics.USER_STORE_SECONDS, "put")
+    def put(self, email, user_data):
+        with self._lock:
+            self.backend.put(email, user_data)
+            self._store_local(email, copy.deepcopy(user_data))
+
+    @metrics.timed_operation(metrics.USER_STORE_SECONDS, "update")
+    def update(self, email, updated_data):
+        with self._lock:
+            user_data = self.backend.update(email, updated_data)
+            if user_data is not None:
+                self._store_local(email, copy.deepcopy(user_data))
+            return user_data
+
+    def count(self):
+        return self.backend.count()
+
+    def version_stamp(self):
+        return self.backend.version_stamp()
+
+    def stats(self):
+        """Return cache hit/miss counters for monitoring."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "invalidations": self.invalidations,
+                "evictions": self.evictions,
+                "version": self.version,
+                "cached_records": len(self._records),
+            }
+
+    def close(self):
+        with self._lock:
+            self._records.clear()
+            self._complete = False
+        self.backend.close()
+
+
+def import_json_users(store, json_path=USERS_FILE, overwrite=False):
+    """
+    One-shot import of accounts from a legacy users.json file.
+    Existing records are kept unless overwrite is True.
+    Returns the number of records written.
+    """
+    json_path = Path(json_path)
+    if not json_path.exists():
+        return 0
+    with open(json_path, 'r') as f:
+        users = json.load(f)
+
+    imported = 0
+    for email, user_data in users.items():
+        if overwrite:
+            store.put(email, user_data)
+            imported += 1
+        elif store.create(email, user_data):
+            imported += 1
+    return imported
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_user_store():
+    """Return the process-wide cached user store, creating (and migrating) it on first use."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                backend = os.getenv("USER_STORE_BACKEND", "sqlite").lower()
+                if backend == "json":
+                    store = JsonUserStore(USERS_FILE)
+                else:
+                    store = SQLiteUserStore(USERS_DB_FILE)
+                    if store.get_meta("json_imported") is None:
+                        if store.count() == 0:
+                            import_json_users(store, USERS_FILE)
+                        store.set_meta("json_imported", datetime.now().isoformat())
+                _store = CachedUserStore(store, max_records=int(os.getenv("USER_CACHE_MAX_RECORDS", "10000")))
+    return _store
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="MyGymBro user store maintenance")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    import_parser = subparsers.add_parser("import-json", help="Import accounts from a legacy users.json file")
+    import_parser.add_argument("--path", default=str(USERS_FILE), help="Path to users.json")
+    import_parser.add_argument("--db", default=str(USERS_DB_FILE), help="Path to the SQLite database")
+    import_parser.add_argument("--overwrite", action="store_true", help="Replace records that already exist")
+
+    args = parser.parse_args(argv)
+    if args.command == "import-json":
+        store = SQLiteUserStore(args.db)
+        imported = import_json_users(store, args.path, overwrite=args.overwrite)
+        store.set_meta("json_imported", datetime.now().isoformat())
+        print(f"Imported {imported} user(s) into {args.db} ({store.count()} total)")
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,230 @@
+"""
+MyGymBro - Free-Text Workout Parser
+
+Recovers exercise blocks (name, sets/reps, rest, weight, form tips) from a
+free-text AI answer. Assistant messages are parsed once when they are stored
+and the result is kept on the message under "parsed", tagged with
+PARSER_VERSION; reruns reuse it and older entries are re-derived lazily
+after the parser changes.
+"""
+
+import re
+
+from utils.instrumentation import timed
+
+# Bump whenever parsing or extraction output changes so stored results are re-derived
+PARSER_VERSION = 1
+
+# Words that mark an assistant answer as a workout worth rendering as blocks
+WORKOUT_KEYWORDS = ['workout', 'exercise', 'routine', 'sets', 'reps', 'squat', 'press', 'deadlift', 'bench']
+
+FORM_KEYWORDS = ['form', 'technique', 'posture', 'position', 'keep', 'maintain', 'avoid']
+
+
+def _keyword_pattern(words):
+    """Compile a list of substrings into one alternation, longest first."""
+    return re.compile("|".join(re.escape(word) for word in sorted(words, key=len, reverse=True)))
+
+
+# Numbered ("1." / "1)"), ordinal ("First:") and "Exercise 1:" headings in one alternation
+_EXERCISE_START_RE = re.compile(
+    r'^(?:\d+[\.\)]\s*'
+    r'|(?:First|Second|Third|Fourth|Fifth|Sixth|Seventh|Eighth|Ninth|Tenth)\s*[:\-]?\s*'
+    r'|Exercise\s+\d+[:\-]?\s*)'
+    r'(.+?)(?:\s*[-–—]|$)',
+    re.IGNORECASE,
+)
+_NAME_TRIM_RE = re.compile(r'^[-–—\s]+|[-–—\s]+$')
+_BOLD_RE = re.compile(r'^\*\*(.+?)\*\*')
+_NUMBERED_ITEM_RE = re.compile(r'^\d+[\.\)]\s+')
+
+# Skip intro sections (warm-up, introduction, etc.)
+SKIP_SECTIONS = ['warm-up', 'warmup', 'introduction', 'overview', 'summary', 'cool-down', 'cooldown']
+# Words that make a short capitalized line look like an exercise name
+EXERCISE_KEYWORDS = ['squat', 'press', 'curl', 'row', 'pull', 'push', 'deadlift', 'lunge', 'plank', 'crunch',
+                     'bench', 'fly', 'extension', 'raise', 'dip']
+
+_SKIP_SECTION_RE = _keyword_pattern(SKIP_SECTIONS)
+_EXERCISE_KEYWORD_RE = _keyword_pattern(EXERCISE_KEYWORDS)
+
+
+def _match_exercise_start(line, line_lower):
+    """Return the exercise name if this line starts a new exercise, '' if it is a heading without a name, else None."""
+    match = _EXERCISE_START_RE.match(line)
+    if match:
+        # Clean up exercise name (remove extra punctuation)
+        exercise_name = _NAME_TRIM_RE.sub('', match.group(1).strip())
+        if exercise_name:
+            return exercise_name
+
+    # Also check for bold text (markdown format)
+    if line.startswith('**'):
+        bold_match = _BOLD_RE.match(line)
+        if bold_match:
+            potential_name = bold_match.group(1).strip()
+            # Check if it looks like an exercise name (not too long, not a full sentence)
+            if len(potential_name) < 80 and ':' not in potential_name:
+                return potential_name
+
+    # Look for lines that might be exercise names (short, capitalized, contain exercise keywords)
+    if len(line) < 80 and line[0].isupper() and _EXERCISE_KEYWORD_RE.search(line_lower):
+        # Starts with capital, short, no colon in middle
+        if line.count(':') <= 1:
+            name, _, _ = line.partition(':')
+            if len(name) < 60 or ':' not in line:
+                return name.strip()
+    return None
+
+
+def parse_workout_exercises(text):
+    """
+    Parse workout text to extract individual exercises.
+
+    One linear pass over the lines with precompiled patterns. Numbered lines
+    are remembered along the way so the fallback (used when no exercise
+    heading was recognized) does not need a second scan.
+    """
+    exercises = []
+    lines = text.split('\n')
+    current_exercise = None
+    current_description = []
+    numbered_lines = []
+
+    for index, raw_line in enumerate(lines):
+        line = raw_line.strip()
+        if not line:
+            continue
+
+        if line[0].isdecimal() and _NUMBERED_ITEM_RE.match(line):
+            numbered_lines.append(index)
+
+        line_lower = line.lower()
+        is_section = _SKIP_SECTION_RE.search(line_lower) is not None
+
+        # Skip section headers, closing the current exercise
+        if is_section and len(line) < 50:
+            if current_exercise:
+                exercises.append({
+                    'name': current_exercise,
+                    'description': '\n'.join(current_description).strip()
+                })
+                current_exercise = None
+                current_description = []
+            continue
+
+        exercise_name = _match_exercise_start(line, line_lower)
+        if exercise_name:
+            # Save previous exercise if exists
+            if current_exercise:
+                exercises.append({
+                    'name': current_exercise,
+                    'description': '\n'.join(current_description).strip()
+                })
+
+            # Start new exercise, keeping the rest of the line as description
+            current_exercise = exercise_name
+            current_description = []
+            remaining = line.partition(':')[2].strip()
+            if remaining:
+                current_description.append(remaining)
+        elif current_exercise:
+            # Skip if this looks like the start of a new section
+            if not (is_section or line_lower.startswith('workout') or line_lower.startswith('day')):
+                current_description.append(line)
+
+    # Add last exercise
+    if current_exercise:
+        exercises.append({
+            'name': current_exercise,
+            'description': '\n'.join(current_description).strip()
+        })
+
+    # If no exercise headings were found, fall back to the numbered list items
+    if not exercises:
+        for index in numbered_lines:
+            line = lines[index].strip()
+            exercise_name = line[_NUMBERED_ITEM_RE.match(line).end():].strip()
+            # Get description from next few lines
+            desc_lines = []
+            for j in range(index + 1, min(index + 6, len(lines))):
+                next_line = lines[j].strip()
+                if next_line and not _NUMBERED_ITEM_RE.match(next_line):
+                    desc_lines.append(next_line)
+                else:
+                    break
+            if exercise_name:
+                exercises.append({
+                    'name': exercise_name,
+                    'description': '\n'.join(desc_lines).strip()
+                })
+
+    # Filter out exercises with very short or invalid names
+    return [ex for ex in exercises if ex['name'] and len(ex['name']) > 2]
+
+
+_SETS_REPS_RE = re.compile(r'(\d+)\s*(?:sets?|x)\s*(?:of\s*)?(\d+)')
+_REST_RE = re.compile(r'rest[:\s]+(\d+[-\s]?\d*)\s*(?:seconds?|sec|minutes?|min)')
+_WEIGHT_RE = re.compile(r'(\d+[-\s]?\d*)\s*(?:lbs?|kg|pounds?|kilograms?)')
+_FORM_KEYWORD_RE = _keyword_pattern(FORM_KEYWORDS)
+_WORKOUT_KEYWORD_RE = _keyword_pattern(WORKOUT_KEYWORDS)
+
+
+def extract_exercise_details(exercise):
+    """Extract sets/reps, rest, weight and form tips from an exercise description."""
+    description = exercise['description'] or ""
+    desc_text = description.lower()
+    details = {
+        'name': exercise['name'],
+        'description': description,
+        'sets': None,
+        'reps': None,
+        'rest': None,
+        'weight': None,
+        'form_tips': [],
+    }
+
+    # Look for sets/reps pattern
+    sets_reps_match = _SETS_REPS_RE.search(desc_text)
+    if sets_reps_match:
+        details['sets'] = sets_reps_match.group(1)
+        details['reps'] = sets_reps_match.group(2)
+
+    # Look for rest period
+    rest_match = _REST_RE.search(desc_text)
+    if rest_match:
+        details['rest'] = rest_match.group(1)
+
+    # Look for weight information
+    weight_match = _WEIGHT_RE.search(desc_text)
+    if weight_match:
+        details['weight'] = weight_match.group(1)
+
+    # Extract sentences with form-related keywords
+    if _FORM_KEYWORD_RE.search(desc_text):
+        sentences = description.split('.')
+        details['form_tips'] = [s.strip() + '.' for s in sentences if _FORM_KEYWORD_RE.search(s.lower())][:3]
+
+    return details
+
+
+def is_workout_text(text):
+    """Check if content looks like a workout (contains exercise-related keywords)."""
+    return _WORKOUT_KEYWORD_RE.search(text.lower()) is not None
+
+
+@timed("workout_parse")
+def analyze_workout_text(text):
+    """Parse an assistant answer once into everything the chat view needs to render it."""
+    exercises = []
+    if is_workout_text(text):
+        exercises = [extract_exercise_details(exercise) for exercise in parse_workout_exercises(text)]
+    return {"version": PARSER_VERSION, "exercises": exercises}
+
+
+def get_parsed_workout(message):
+    """Return the stored parse result for a message, re-deriving it if missing or from an older parser."""
+    parsed = message.get("parsed")
+    if parsed is None or parsed.get("version") != PARSER_VERSION:
+        parsed = analyze_workout_text(message["content"])
+        message["parsed"] = parsed
+    return parsed
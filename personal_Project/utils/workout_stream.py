@@ -0,0 +1,267 @@
+"""
+MyGymBro - Structured Workout Output
+
+In structured mode the model answers with a JSON workout plan instead of free
+text. IncrementalWorkoutParser consumes the streamed JSON chunk by chunk and
+hands back each exercise object the moment its closing brace arrives, so the
+page can render workout blocks while the rest of the plan is still streaming.
+"""
+
+import json
+
+# Shape of the plan the model is asked to return
+WORKOUT_JSON_SCHEMA = {
+    "title": "string - short name for the plan",
+    "days": [
+        {
+            "day": "string - e.g. 'Monday' or 'Day 1' (use 'Workout' for a single session)",
+            "focus": "string - e.g. 'Upper body'",
+            "exercises": [
+                {
+                    "name": "string",
+                    "sets": "integer or string",
+                    "reps": "integer or string, e.g. '8-12' or '30 sec'",
+                    "rest": "string, e.g. '60 sec'",
+                    "weight": "string, e.g. '45-65 lbs' or 'bodyweight'",
+                    "description": "string - how to perform the exercise",
+                    "form_tips": ["string"]
+                }
+            ]
+        }
+    ],
+    "notes": "string - warm-up, cool-down, progression and safety notes"
+}
+
+STRUCTURED_OUTPUT_INSTRUCTIONS = (
+    "Respond ONLY with a single JSON object (no markdown, no code fences) that follows this schema:\n"
+    f"{json.dumps(WORKOUT_JSON_SCHEMA, indent=2)}\n"
+    "Put the keys 'day' and 'focus' before 'exercises' in every day object. "
+    "Write all string values in the requested response language."
+)
+
+
+class _Frame:
+    __slots__ = ("kind", "key", "start", "expect_key", "current_key", "parent")
+
+    def __init__(self, kind, key, start, parent):
+        self.kind = kind            # "obj" or "arr"
+        self.key = key              # key this container sits under (arrays pass theirs to items)
+        self.start = start
+        self.expect_key = kind == "obj"
+        self.current_key = None
+        self.parent = parent
+
+
+class IncrementalWorkoutParser:
+    """
+    Streaming scanner for the workout JSON. feed() returns the exercises that
+    became complete with that chunk, each tagged with its day and focus.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self.position = 0
+        self.stack = []
+        self.in_string = False
+        self.escape = False
+        self.string_start = None
+        self.day_index = -1
+        self.current_day = None
+        self.current_focus = None
+        self.exercises = []
+
+    def feed(self, chunk):
+        """Consume one streamed chunk and return newly completed exercises."""
+        self.text += chunk
+        completed = []
+        text = self.text
+        for i in range(self.position, len(text)):
+            char = text[i]
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif char == "\\":
+                    self.escape = True
+                elif char == '"':
+                    self.in_string = False
+                    self._on_string(text[self.string_start:i + 1])
+                continue
+
+            if char == '"':
+                if self.stack:
+                    self.in_string = True
+                    self.string_start = i
+            elif char in "{[":
+                parent = self.stack[-1] if self.stack else None
+                if parent is None:
+                    key = None
+                elif parent.kind == "obj":
+                    key = parent.current_key
+                else:
+                    key = parent.key
+                frame = _Frame("obj" if char == "{" else "arr", key, i, parent)
+                self.stack.append(frame)
+                if frame.kind == "obj" and parent is not None and parent.kind == "arr" and parent.key == "days":
+                    self.day_index += 1
+                    self.current_day = None
+                    self.current_focus = None
+            elif char in "}]":
+                if not self.stack:
+                    continue
+                frame = self.stack.pop()
+                if frame.kind == "obj" and frame.parent is not None and frame.parent.kind == "arr" \
+                        and frame.parent.key == "exercises":
+                    exercise = self._load_exercise(text[frame.start:i + 1])
+                    if exercise is not None:
+                        completed.append(exercise)
+            elif char == ",":
+                if self.stack and self.stack[-1].kind == "obj":
+                    self.stack[-1].expect_key = True
+        self.position = len(text)
+        self.exercises.extend(completed)
+        return completed
+
+    def _on_string(self, raw):
+        frame = self.stack[-1]
+        if frame.kind != "obj":
+            return
+        try:
+            value = json.loads(raw)
+        except ValueError:
+            # e.g. an invalid escape; the enclosing object will fail to load on its own
+            value = None
+        if frame.expect_key:
+            frame.current_key = value
+            frame.expect_key = False
+            return
+        # A string value directly inside a day object
+        if frame.parent is not None and frame.parent.kind == "arr" and frame.parent.key == "days":
+            if frame.current_key == "day":
+                self.current_day = value
+            elif frame.current_key == "focus":
+                self.current_focus = value
+
+    def _load_exercise(self, raw):
+        try:
+            exercise = _clean_exercise(json.loads(raw))
+        except ValueError:
+            return None
+        if exercise is None:
+            return None
+        exercise["day"] = self.current_day
+        exercise["focus"] = self.current_focus
+        exercise["day_index"] = max(self.day_index, 0)
+        return exercise
+
+    def result(self):
+        """Return the full plan once streaming has finished (None if the output was not valid JSON)."""
+        return parse_workout_json(self.text)
+
+    def partial_plan(self):
+        """Build a plan from the exercises completed so far (e.g. when the response was cut off)."""
+        days = []
+        for exercise in self.exercises:
+            if not days or days[-1]["_index"] != exercise["day_index"]:
+                days.append({"_index": exercise["day_index"], "day": exercise["day"], "focus": exercise["focus"], "exercises": []})
+            days[-1]["exercises"].append(exercise)
+        for day in days:
+            del day["_index"]
+        return {"title": "", "days": days, "notes": ""}
+
+
+def _text_field(value):
+    """Return value if it is a string, else an empty string."""
+    return value if isinstance(value, str) else ""
+
+
+def _clean_exercise(exercise):
+    """
+    Return exercise with only well-typed fields, or None if it is not an
+    exercise object with a name. Models sometimes return a day as a plain
+    string or form_tips as one sentence; rendering must never see those.
+    """
+    if not isinstance(exercise, dict) or not isinstance(exercise.get("name"), str) or not exercise["name"].strip():
+        return None
+    cleaned = {"name": exercise["name"]}
+    for key in ("sets", "reps"):
+        value = exercise.get(key)
+        if isinstance(value, (int, float, str)) and not isinstance(value, bool):
+            cleaned[key] = value
+    for key in ("rest", "weight", "description"):
+        if isinstance(exercise.get(key), str):
+            cleaned[key] = exercise[key]
+    form_tips = exercise.get("form_tips")
+    if isinstance(form_tips, list):
+        cleaned["form_tips"] = [tip for tip in form_tips if isinstance(tip, str)]
+    return cleaned
+
+
+def _clean_day(day):
+    """Return a day object with its valid exercises, or None if day is not an object."""
+    if not isinstance(day, dict):
+        return None
+    exercises = day.get("exercises")
+    exercises = [e for e in map(_clean_exercise, exercises) if e is not None] if isinstance(exercises, list) else []
+    return {
+        "day": day.get("day") if isinstance(day.get("day"), str) else None,
+        "focus": day.get("focus") if isinstance(day.get("focus"), str) else None,
+        "exercises": exercises,
+    }
+
+
+def parse_workout_json(text):
+    """
+    Parse a complete structured response. Returns the plan dict, keeping only
+    well-typed days and exercises, or None if it has no exercise to show.
+    """
+    start = text.find("{")
+    end = text.rfind("}")
+    if start == -1 or end <= start:
+        return None
+    try:
+        plan = json.loads(text[start:end + 1])
+    except ValueError:
+        return None
+    if not isinstance(plan, dict) or not isinstance(plan.get("days"), list):
+        return None
+    days = [day for day in map(_clean_day, plan["days"]) if day is not None]
+    if not any(day["exercises"] for day in days):
+        # Nothing renderable; the caller shows the response as plain text
+        return None
+    return {"title": _text_field(plan.get("title")), "days": days, "notes": _text_field(plan.get("notes"))}
+
+
+def render_workout_markdown(plan):
+    """Render a structured plan as readable markdown for the chat history."""
+    lines = []
+    if plan.get("title"):
+        lines.append(f"**{plan['title']}**")
+        lines.append("")
+    number = 1
+    for day in plan.get("days", []):
+        heading = " - ".join(str(part) for part in (day.get("day"), day.get("focus")) if part)
+        if heading:
+            lines.append(f"**{heading}**")
+        for exercise in day.get("exercises", []):
+            details = []
+            if exercise.get("sets") and exercise.get("reps"):
+                details.append(f"{exercise['sets']} sets x {exercise['reps']} reps")
+            if exercise.get("rest"):
+                details.append(f"rest {exercise['rest']}")
+            if exercise.get("weight"):
+                details.append(f"weight {exercise['weight']}")
+            suffix = f" - {', '.join(details)}" if details else ""
+            lines.append(f"{number}. {exercise.get('name', '')}{suffix}")
+            if exercise.get("description"):
+                lines.append(f"   {exercise['description']}")
+            for tip in exercise.get("form_tips", []) or []:
+                lines.append(f"   - {tip}")
+            number += 1
+        lines.append("")
+    if plan.get("notes"):
+        lines.append(plan["notes"])
+    if plan.get("notice"):
+        # Set by the page when the plan was cut off
+        lines.append("")
+        lines.append(plan["notice"])
+    return "\n".join(lines).strip()